@@ -0,0 +1,92 @@
+"""Chat completion latency and throughput through the shared LLM client.
+
+Run from the backend directory, e.g. against the local mock server:
+
+    OPENAI_BASE_URL=http://localhost:8001/v1 OPENAI_API_KEY=mock \\
+        python -m benchmarks.chat_load --requests 200 --concurrency 20
+
+Streams --requests replies through llm.llm_provider with --concurrency in
+flight and reports time to first token, total latency and throughput.
+--fresh-client opens a new client per request instead, which shows what
+connection reuse saves.
+"""
+import argparse
+import asyncio
+import json
+import math
+import time
+
+from llm import OpenAIProvider, llm_provider
+
+MESSAGES = [
+    {"role": "system", "content": "You are a helpful assistant."},
+    {"role": "user", "content": "Describe a lighthouse on a cliff at sunset."}
+]
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q
+    low, high = math.floor(position), math.ceil(position)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+async def timed_stream(provider, max_tokens: int) -> dict:
+    start = time.perf_counter()
+    first_token = None
+    chunks = 0
+    async for _ in provider.stream(MESSAGES, max_tokens, 0.7):
+        if first_token is None:
+            first_token = time.perf_counter() - start
+        chunks += 1
+    return {"first_token": first_token or 0.0, "latency": time.perf_counter() - start, "chunks": chunks}
+
+async def run(requests: int, concurrency: int, max_tokens: int, fresh_client: bool) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one() -> dict:
+        async with semaphore:
+            if not fresh_client:
+                return await timed_stream(llm_provider, max_tokens)
+            provider = OpenAIProvider()
+            await provider.start()
+            try:
+                return await timed_stream(provider, max_tokens)
+            finally:
+                await provider.stop()
+
+    await llm_provider.start()
+    try:
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one() for _ in range(requests)))
+        wall = time.perf_counter() - start
+    finally:
+        await llm_provider.stop()
+
+    first_tokens = [result["first_token"] for result in results]
+    latencies = [result["latency"] for result in results]
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "fresh_client": fresh_client,
+        "requests_per_second": round(requests / wall, 2),
+        "chunks_per_second": round(sum(result["chunks"] for result in results) / wall, 1),
+        "first_token_p50": round(percentile(first_tokens, 0.50), 4),
+        "first_token_p95": round(percentile(first_tokens, 0.95), 4),
+        "latency_p50": round(percentile(latencies, 0.50), 4),
+        "latency_p95": round(percentile(latencies, 0.95), 4),
+        "latency_p99": round(percentile(latencies, 0.99), 4)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--fresh-client", action="store_true", help="new connection pool per request")
+    args = parser.parse_args()
+
+    if not llm_provider.configured:
+        parser.error("set OPENAI_API_KEY (any value works against the mock server)")
+    print(json.dumps(asyncio.run(run(args.requests, args.concurrency, args.max_tokens, args.fresh_client)), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Compare image generation speed across registered models on this machine.
+
+Run from the backend directory, e.g. on a CPU inference node:
+
+    python -m benchmarks.cpu_inference stable-diffusion-xl-base-1.0 stable-diffusion-xl-lcm-cpu
+
+Loads each model in this process, renders one warm-up batch and then --runs
+timed batches through pipelines.generate_batch, and reports load time and
+seconds per image. Speedups are relative to the first model given.
+"""
+import argparse
+import json
+import statistics
+import time
+
+from models import ImageGenerationRequest, ImageSize, ImageStyle
+
+def make_request(model_version: str, size: str, steps: int, seed: int) -> ImageGenerationRequest:
+    return ImageGenerationRequest(
+        prompt="a lighthouse on a cliff at sunset",
+        style=ImageStyle.REALISTIC,
+        size=ImageSize(size),
+        steps=steps,
+        seed=seed,
+        num_images=1,
+        model_version=model_version
+    )
+
+def benchmark(model_version: str, runs: int, batch: int, size: str, steps: int) -> dict:
+    """Time loading and rendering for one model"""
+    # Imported here so --help works without the ML stack
+    from pipelines import generate_batch, pipeline_cache
+
+    start = time.perf_counter()
+    pipeline_cache.get(model_version)
+    load_seconds = time.perf_counter() - start
+
+    def render(run: int) -> float:
+        jobs = [
+            (f"bench-{model_version}-{run}-{i}", make_request(model_version, size, steps, seed=run * batch + i))
+            for i in range(batch)
+        ]
+        start = time.perf_counter()
+        generate_batch(jobs)
+        return (time.perf_counter() - start) / batch
+
+    render(-1)  # warm-up: kernels, allocator, torch.compile
+    per_image = [render(run) for run in range(runs)]
+    return {
+        "model": model_version,
+        "load_seconds": round(load_seconds, 2),
+        "seconds_per_image_median": round(statistics.median(per_image), 3),
+        "seconds_per_image_min": round(min(per_image), 3),
+        "images_per_second": round(1 / statistics.median(per_image), 3)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("models", nargs="+", help="model ids from the registry")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--batch", type=int, default=1, help="images per forward pass")
+    parser.add_argument("--size", default="512x512", choices=[size.value for size in ImageSize])
+    parser.add_argument("--steps", type=int, default=20, help="ignored by models with fixed steps")
+    args = parser.parse_args()
+
+    results = []
+    for model_version in args.models:
+        result = benchmark(model_version, args.runs, args.batch, args.size, args.steps)
+        if results:
+            baseline = results[0]["seconds_per_image_median"]
+            result["speedup"] = round(baseline / result["seconds_per_image_median"], 2)
+        results.append(result)
+        print(json.dumps(result))
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
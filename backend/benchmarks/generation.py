@@ -0,0 +1,348 @@
+"""End-to-end image generation benchmark on a tiny stand-in model.
+
+Run from the backend directory with a scratch MongoDB available:
+
+    python -m benchmarks.generation --sizes 512x512 768x768 --steps 10 20 \\
+        --num-images 1 2 --concurrency 1 4
+
+Starts the worker pool with tiny-sdxl-random (see benchmarks/tiny_model.py)
+and, for every combination in the sweep, has --concurrency clients each run
+--requests generations through the image endpoint and generate_image_task,
+as the API does: fair queue, workers, storage, thumbnails and the
+image_history insert. Reports latency percentiles, images per second, peak
+RSS of the API process and the workers, and the time each generation spent
+loading, encoding the prompt, denoising, decoding, encoding images, writing
+to the database and waiting in queues or IPC.
+
+Results are saved under benchmarks/results/ as JSON. Pass --baseline with
+an earlier file to compare; the exit status is non-zero when throughput or
+p95 latency of any configuration regressed by more than --tolerance.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from pymongo import monitoring
+
+BENCHMARK_MODEL = "tiny-sdxl-random"
+BENCHMARK_USER_PREFIX = "benchmark-"
+BENCHMARK_MONGODB_URL = os.getenv("BENCHMARK_MONGODB_URL", "mongodb://localhost:27017/ai_studio_benchmark")
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# Stages recorded by the workers, in pipeline order
+WORKER_STAGES = ("load", "text_encode", "denoise", "decode", "encode")
+
+def configure_environment(args):
+    """Point the app at the tiny model and scratch storage before importing it"""
+    os.environ["BENCHMARK_TINY_MODEL"] = "true"
+    os.environ["IMAGE_WORKERS"] = str(args.workers)
+    os.environ["IMAGE_STORAGE_BACKEND"] = "local"
+    os.environ["IMAGE_DIR"] = args.image_dir
+
+def percentile(values: List[float], q: float) -> float:
+    """Linearly interpolated percentile, q in [0, 1]"""
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q
+    low, high = math.floor(position), math.ceil(position)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+def peak_rss_mb(pid: Optional[int] = None) -> Optional[float]:
+    """High-water RSS of a process since its last reset (Linux only)"""
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if pid is None:
+        # ru_maxrss can't be reset, so it covers the whole run
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return None
+
+def reset_peak_rss(pid: Optional[int] = None):
+    """Restart a process's high-water RSS from its current RSS"""
+    try:
+        with open(f"/proc/{pid or 'self'}/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+class InsertTimer(monitoring.CommandListener):
+    """pymongo command listener timing the image_history inserts"""
+
+    def __init__(self):
+        self.durations: List[float] = []
+        self._pending = set()
+
+    def started(self, event):
+        if event.command_name == "insert" and event.command.get("insert") == "image_history":
+            self._pending.add(event.request_id)
+
+    def succeeded(self, event):
+        if event.request_id in self._pending:
+            self._pending.discard(event.request_id)
+            self.durations.append(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        self._pending.discard(event.request_id)
+
+async def generate(request, user: dict) -> Dict[str, Any]:
+    """Run one generation through the endpoint and its background task"""
+    from fastapi import BackgroundTasks
+    from generation_store import status_store
+    from routers.image_generation import generate_image
+
+    start = time.perf_counter()
+    tasks = BackgroundTasks()
+    response = await generate_image(request, tasks, current_user=user)
+    await tasks()
+    latency = time.perf_counter() - start
+
+    status_info = await status_store.get(response["generation_id"])
+    return {
+        "generation_id": response["generation_id"],
+        "latency": latency,
+        "completed": status_info is not None and status_info.status == "completed"
+    }
+
+def make_request(size: str, steps: int, num_images: int, seed: int):
+    from models import ImageGenerationRequest, ImageSize, ImageStyle, ImageFormat
+
+    return ImageGenerationRequest(
+        prompt="a lighthouse on a cliff at sunset",
+        style=ImageStyle.REALISTIC,
+        size=ImageSize(size),
+        steps=steps,
+        num_images=num_images,
+        seed=seed,
+        model_version=BENCHMARK_MODEL,
+        output_format=ImageFormat.PNG
+    )
+
+async def worker_timings(generation_ids: List[str]) -> List[Dict[str, float]]:
+    """Per-stage timings the workers recorded for these generations"""
+    from database import get_database
+
+    cursor = get_database().image_history.find({"_id": {"$in": generation_ids}}, {"timings": 1})
+    return [record.get("timings", {}) async for record in cursor]
+
+async def run_config(
+    size: str,
+    steps: int,
+    num_images: int,
+    concurrency: int,
+    requests: int,
+    seeds: itertools.count,
+    timer: InsertTimer
+) -> Dict[str, Any]:
+    """Benchmark one point of the sweep"""
+    from image_worker import worker_pool
+
+    worker_pids = [process.pid for process in worker_pool.processes.values()]
+    for pid in [None] + worker_pids:
+        reset_peak_rss(pid)
+    timer.durations.clear()
+
+    async def client(index: int) -> List[Dict[str, Any]]:
+        user = {"_id": f"{BENCHMARK_USER_PREFIX}{index}", "settings": {}}
+        return [
+            await generate(make_request(size, steps, num_images, next(seeds)), user)
+            for _ in range(requests)
+        ]
+
+    start = time.perf_counter()
+    runs = list(itertools.chain.from_iterable(
+        await asyncio.gather(*(client(i) for i in range(concurrency)))
+    ))
+    wall = time.perf_counter() - start
+
+    completed = [run for run in runs if run["completed"]]
+    latencies = [run["latency"] for run in completed]
+    result = {
+        "size": size,
+        "steps": steps,
+        "num_images": num_images,
+        "concurrency": concurrency,
+        "generations": len(runs),
+        "failed": len(runs) - len(completed),
+        "wall_seconds": round(wall, 3),
+        "images_per_second": round(len(completed) * num_images / wall, 3)
+    }
+    if not completed:
+        return result
+
+    result["latency_seconds"] = {
+        "mean": round(sum(latencies) / len(latencies), 3),
+        "p50": round(percentile(latencies, 0.50), 3),
+        "p90": round(percentile(latencies, 0.90), 3),
+        "p95": round(percentile(latencies, 0.95), 3),
+        "p99": round(percentile(latencies, 0.99), 3),
+        "max": round(max(latencies), 3)
+    }
+
+    # Mean seconds per generation in each stage; batched generations each
+    # count the whole forward pass they shared
+    totals: Dict[str, float] = defaultdict(float)
+    for timings in await worker_timings([run["generation_id"] for run in completed]):
+        for stage in WORKER_STAGES:
+            totals[stage] += timings.get(stage, 0.0)
+    stages = {stage: totals[stage] / len(completed) for stage in WORKER_STAGES}
+    stages["db_write"] = sum(timer.durations) / len(timer.durations) if timer.durations else 0.0
+    stages["queue_and_ipc"] = max(0.0, result["latency_seconds"]["mean"] - sum(stages.values()))
+    result["stage_seconds"] = {stage: round(seconds, 4) for stage, seconds in stages.items()}
+
+    api_rss = peak_rss_mb()
+    worker_rss = [rss for rss in map(peak_rss_mb, worker_pids) if rss is not None]
+    result["peak_rss_mb"] = {
+        "api": round(api_rss, 1),
+        "workers": round(max(worker_rss), 1) if worker_rss else None,
+        "total": round(api_rss + sum(worker_rss), 1) if worker_rss else None
+    }
+    return result
+
+async def run(args) -> Dict[str, Any]:
+    """Start the app's pieces, warm every worker up and run the sweep"""
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from database import db, create_indexes
+    from generation_events import progress_broker
+    from image_worker import worker_pool
+
+    timer = InsertTimer()
+    db.client = AsyncIOMotorClient(BENCHMARK_MONGODB_URL, event_listeners=[timer])
+    db.database = db.client.get_default_database()
+    await create_indexes()
+    await progress_broker.start()
+    worker_pool.start()
+
+    seeds = itertools.count()
+    try:
+        # One generation per worker so each has the model loaded
+        warm_start = time.perf_counter()
+        warmup = await asyncio.gather(*(
+            generate(
+                make_request(args.sizes[0], args.steps[0], 1, next(seeds)),
+                {"_id": f"{BENCHMARK_USER_PREFIX}warmup-{i}", "settings": {}}
+            )
+            for i in range(args.workers)
+        ))
+        if not all(run["completed"] for run in warmup):
+            raise RuntimeError("Warm-up generations failed; check the worker output above")
+        loads = [timings.get("load", 0.0) for timings in await worker_timings([run["generation_id"] for run in warmup])]
+        cold_start = {
+            "seconds": round(time.perf_counter() - warm_start, 3),
+            "load_seconds": round(max(loads), 3)
+        }
+        print(json.dumps({"cold_start": cold_start}))
+
+        results = []
+        for size, steps, num_images, concurrency in itertools.product(
+            args.sizes, args.steps, args.num_images, args.concurrency
+        ):
+            result = await run_config(size, steps, num_images, concurrency, args.requests, seeds, timer)
+            results.append(result)
+            print(json.dumps(result))
+    finally:
+        worker_pool.stop()
+        await progress_broker.stop()
+        await db.database.image_history.delete_many({"user_id": {"$regex": f"^{BENCHMARK_USER_PREFIX}"}})
+        db.client.close()
+
+    import diffusers
+    import torch
+
+    return {
+        "created_at": datetime.utcnow().isoformat(),
+        "model": BENCHMARK_MODEL,
+        "requests_per_client": args.requests,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "torch": torch.__version__,
+            "diffusers": diffusers.__version__,
+            "image_workers": args.workers,
+            "torch_threads": os.getenv("TORCH_THREADS", "0"),
+            "image_batch_max_images": os.getenv("IMAGE_BATCH_MAX_IMAGES", "4")
+        },
+        "cold_start": cold_start,
+        "results": results
+    }
+
+def config_key(result: dict) -> tuple:
+    return (result["size"], result["steps"], result["num_images"], result["concurrency"])
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> bool:
+    """Print changes against a baseline report; True if anything regressed"""
+    previous = {config_key(result): result for result in baseline["results"]}
+    regressed = False
+    for result in report["results"]:
+        before = previous.get(config_key(result))
+        if not before or "latency_seconds" not in result or "latency_seconds" not in before:
+            continue
+
+        throughput = result["images_per_second"] / before["images_per_second"] - 1
+        p95 = result["latency_seconds"]["p95"] / before["latency_seconds"]["p95"] - 1
+        worse = throughput < -tolerance or p95 > tolerance
+        regressed = regressed or worse
+        print(
+            f"{'REGRESSED' if worse else 'ok':9} size={result['size']} steps={result['steps']} "
+            f"num_images={result['num_images']} concurrency={result['concurrency']}: "
+            f"images/s {throughput:+.1%}, p95 latency {p95:+.1%}"
+        )
+    return regressed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", default=["512x512"])
+    parser.add_argument("--steps", nargs="+", type=int, default=[10])
+    parser.add_argument("--num-images", nargs="+", type=int, default=[1])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1])
+    parser.add_argument("--requests", type=int, default=5, help="sequential generations per client")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("IMAGE_WORKERS", "1")))
+    parser.add_argument("--output", help="result file (default: benchmarks/results/generation-<time>.json)")
+    parser.add_argument("--baseline", help="earlier result file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression")
+    args = parser.parse_args()
+
+    from models import ImageSize
+    sizes = [size.value for size in ImageSize]
+    for size in args.sizes:
+        if size not in sizes:
+            parser.error(f"--sizes must be among {', '.join(sizes)}")
+
+    args.image_dir = tempfile.mkdtemp(prefix="benchmark-images-")
+    configure_environment(args)
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(args.image_dir, ignore_errors=True)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"generation-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved results to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.tolerance):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""OpenAI-compatible chat completions server for offline testing.
+
+Run from the backend directory:
+
+    python -m benchmarks.mock_llm --port 8001 --first-token-ms 300 --tokens-per-second 40
+
+and start the API (or benchmarks.chat_load) with
+OPENAI_BASE_URL=http://localhost:8001/v1 and any OPENAI_API_KEY. Replies are
+filler text streamed at the configured pace, so chat latency and throughput
+can be measured without network access or API spend.
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+FILLER = (
+    "This is a simulated reply from the local mock model, streamed one token at a time "
+    "so that latency and throughput can be measured offline."
+).split()
+
+app = FastAPI(title="Mock LLM")
+app.state.first_token_seconds = 0.3
+app.state.tokens_per_second = 40.0
+app.state.reply_tokens = 64
+
+def count_tokens(messages: list) -> int:
+    """Rough prompt size, about four characters per token"""
+    return sum(len(message.get("content") or "") for message in messages) // 4 + 4 * len(messages)
+
+def reply_tokens(max_tokens) -> list:
+    count = min(app.state.reply_tokens, max_tokens or app.state.reply_tokens)
+    return [FILLER[i % len(FILLER)] + " " for i in range(count)]
+
+@app.get("/v1/models")
+async def list_models():
+    return {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]}
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "mock")
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    tokens = reply_tokens(body.get("max_tokens"))
+    prompt_tokens = count_tokens(body.get("messages", []))
+    delay = 1 / app.state.tokens_per_second
+
+    if not body.get("stream"):
+        await asyncio.sleep(app.state.first_token_seconds + delay * len(tokens))
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens)},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(tokens),
+                "total_tokens": prompt_tokens + len(tokens)
+            }
+        }
+
+    def chunk(delta: dict, finish_reason=None) -> str:
+        return "data: " + json.dumps({
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        }) + "\n\n"
+
+    async def events():
+        await asyncio.sleep(app.state.first_token_seconds)
+        yield chunk({"role": "assistant", "content": ""})
+        for token in tokens:
+            yield chunk({"content": token})
+            await asyncio.sleep(delay)
+        yield chunk({}, "stop")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--first-token-ms", type=float, default=300)
+    parser.add_argument("--tokens-per-second", type=float, default=40)
+    parser.add_argument("--reply-tokens", type=int, default=64)
+    args = parser.parse_args()
+
+    app.state.first_token_seconds = args.first_token_ms / 1000
+    app.state.tokens_per_second = args.tokens_per_second
+    app.state.reply_tokens = args.reply_tokens
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
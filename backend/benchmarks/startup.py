@@ -0,0 +1,80 @@
+"""Startup-time budget check for the API process.
+
+Run from the backend directory:
+
+    python -m benchmarks.startup
+
+Imports main:app in fresh interpreters, reports wall-clock startup time,
+import time and peak RSS, and exits non-zero when a budget is exceeded or
+the API process pulls in the ML stack (which belongs in the image workers).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = ("torch", "diffusers", "transformers", "accelerate", "xformers")
+
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+from main import app
+import_seconds = time.perf_counter() - start
+print(json.dumps({
+    "import_seconds": import_seconds,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy_modules": [m for m in %r if m in sys.modules]
+}))
+""" % (HEAVY_MODULES,)
+
+def probe() -> dict:
+    """Import main:app in a fresh interpreter and measure it"""
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env={**os.environ, "IMAGE_WORKERS": os.getenv("IMAGE_WORKERS", "0")},
+        capture_output=True,
+        text=True,
+        check=True
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["startup_seconds"] = time.perf_counter() - start
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--startup-budget", type=float, default=float(os.getenv("STARTUP_BUDGET_SECONDS", "3.0")))
+    parser.add_argument("--import-budget", type=float, default=float(os.getenv("IMPORT_BUDGET_SECONDS", "2.0")))
+    parser.add_argument("--rss-budget", type=float, default=float(os.getenv("STARTUP_RSS_BUDGET_MB", "200")))
+    args = parser.parse_args()
+
+    runs = [probe() for _ in range(args.runs)]
+    report = {
+        "startup_seconds": statistics.median(r["startup_seconds"] for r in runs),
+        "import_seconds": statistics.median(r["import_seconds"] for r in runs),
+        "peak_rss_mb": max(r["peak_rss_mb"] for r in runs),
+        "heavy_modules": sorted({m for r in runs for m in r["heavy_modules"]})
+    }
+    print(json.dumps(report, indent=2))
+
+    failures = []
+    if report["startup_seconds"] > args.startup_budget:
+        failures.append(f"startup {report['startup_seconds']:.2f}s > {args.startup_budget:.2f}s")
+    if report["import_seconds"] > args.import_budget:
+        failures.append(f"import {report['import_seconds']:.2f}s > {args.import_budget:.2f}s")
+    if report["peak_rss_mb"] > args.rss_budget:
+        failures.append(f"RSS {report['peak_rss_mb']:.0f} MB > {args.rss_budget:.0f} MB")
+    if report["heavy_modules"]:
+        failures.append(f"API process imported {', '.join(report['heavy_modules'])}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
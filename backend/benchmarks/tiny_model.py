@@ -0,0 +1,90 @@
+"""Tiny randomly initialised SDXL pipeline for benchmarks.
+
+Registered as "tiny-sdxl-random" when BENCHMARK_TINY_MODEL=true. It has the
+structure of SDXL (two text encoders, a UNet with micro-conditioning and a
+VAE that downsamples 8x, so every ImageSize works) with a few million
+weights, so the serving path can be measured on CPU in seconds and without
+downloading anything. Its images are noise.
+"""
+import json
+import os
+import tempfile
+
+import torch
+from diffusers import AutoencoderKL, EulerDiscreteScheduler, StableDiffusionXLPipeline, UNet2DConditionModel
+from transformers import CLIPTextConfig, CLIPTextModel, CLIPTextModelWithProjection, CLIPTokenizer
+from transformers.models.clip.tokenization_clip import bytes_to_unicode
+
+def build_tokenizer() -> CLIPTokenizer:
+    """Byte-level CLIP tokenizer without merges"""
+    chars = list(bytes_to_unicode().values())
+    tokens = chars + [char + "</w>" for char in chars] + ["<|startoftext|>", "<|endoftext|>"]
+    with tempfile.TemporaryDirectory() as directory:
+        vocab_file = os.path.join(directory, "vocab.json")
+        merges_file = os.path.join(directory, "merges.txt")
+        with open(vocab_file, "w") as f:
+            json.dump({token: i for i, token in enumerate(tokens)}, f)
+        with open(merges_file, "w") as f:
+            f.write("#version: 0.2\n")
+        return CLIPTokenizer(vocab_file, merges_file, model_max_length=77)
+
+def build_pipeline(seed: int = 0) -> StableDiffusionXLPipeline:
+    """Build the pipeline; the same seed always gives the same weights"""
+    torch.manual_seed(seed)
+    unet = UNet2DConditionModel(
+        block_out_channels=(32, 64),
+        layers_per_block=2,
+        sample_size=32,
+        in_channels=4,
+        out_channels=4,
+        down_block_types=("DownBlock2D", "CrossAttnDownBlock2D"),
+        up_block_types=("CrossAttnUpBlock2D", "UpBlock2D"),
+        attention_head_dim=(2, 4),
+        use_linear_projection=True,
+        addition_embed_type="text_time",
+        addition_time_embed_dim=8,
+        transformer_layers_per_block=(1, 2),
+        projection_class_embeddings_input_dim=80,
+        cross_attention_dim=64
+    )
+    # Four blocks give SDXL's 8x latent downsampling
+    vae = AutoencoderKL(
+        block_out_channels=[8, 16, 16, 32],
+        in_channels=3,
+        out_channels=3,
+        down_block_types=["DownEncoderBlock2D"] * 4,
+        up_block_types=["UpDecoderBlock2D"] * 4,
+        latent_channels=4,
+        layers_per_block=1,
+        norm_num_groups=8,
+        sample_size=128
+    )
+    text_config = CLIPTextConfig(
+        bos_token_id=0,
+        eos_token_id=2,
+        pad_token_id=1,
+        hidden_size=32,
+        intermediate_size=37,
+        layer_norm_eps=1e-05,
+        num_attention_heads=4,
+        num_hidden_layers=5,
+        vocab_size=1000,
+        hidden_act="gelu",
+        projection_dim=32
+    )
+    scheduler = EulerDiscreteScheduler(
+        beta_start=0.00085,
+        beta_end=0.012,
+        beta_schedule="scaled_linear",
+        steps_offset=1,
+        timestep_spacing="leading"
+    )
+    return StableDiffusionXLPipeline(
+        vae=vae,
+        text_encoder=CLIPTextModel(text_config),
+        text_encoder_2=CLIPTextModelWithProjection(text_config),
+        tokenizer=build_tokenizer(),
+        tokenizer_2=build_tokenizer(),
+        unet=unet,
+        scheduler=scheduler
+    )
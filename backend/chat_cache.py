@@ -0,0 +1,159 @@
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+from dotenv import load_dotenv
+
+from database import get_redis
+
+load_dotenv()
+
+# "memory" is local to this process and only safe with a single uvicorn
+# worker (--workers 1, the default); "redis" shares hot sessions between
+# every worker and node, which keeps them coherent when turns of one session
+# land on different processes. Use redis whenever more than one API process
+# serves chat
+CHAT_SESSION_CACHE_BACKEND = os.getenv("CHAT_SESSION_CACHE_BACKEND", "memory")
+
+# Sessions kept at once (0 disables the cache) and seconds an idle one stays.
+# The memory default is short because it also bounds how long another
+# process can serve a session deleted elsewhere
+CHAT_SESSION_CACHE_SIZE = int(os.getenv("CHAT_SESSION_CACHE_SIZE", "1000"))
+CHAT_SESSION_CACHE_TTL = int(os.getenv(
+    "CHAT_SESSION_CACHE_TTL",
+    "1800" if CHAT_SESSION_CACHE_BACKEND == "redis" else "300"
+))
+
+# uvicorn's worker count when started with --workers unset. It is the only
+# worker count visible here: --workers N on the command line is not, so
+# multi-worker deployments must set the backend themselves
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+class SessionCache:
+    """LRU cache of active chat sessions keyed by (user_id, session_id).
+
+    Each entry holds what a chat turn needs to build its prompt: the
+    session metadata and its recent messages. chat_store writes entries
+    through as turns are saved and drops them when sessions are deleted.
+
+    Entries only live in this process, so deleting a session only drops it
+    here: another API process keeps serving its cached history for one more
+    turn (cache_turn then sees the count mismatch and drops it) or until the
+    TTL expires. Use the Redis backend when running more than one worker.
+    """
+
+    def __init__(self, max_entries: int = CHAT_SESSION_CACHE_SIZE, ttl: int = CHAT_SESSION_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: "OrderedDict[Tuple[str, str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    async def get(self, user_id: str, session_id: str) -> Optional[Dict[str, Any]]:
+        key = (user_id, session_id)
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self.entries.pop(key, None)
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    async def set(self, user_id: str, session_id: str, entry: Dict[str, Any]):
+        if not self.enabled:
+            return
+        key = (user_id, session_id)
+        self.entries[key] = (time.monotonic() + self.ttl, entry)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    async def delete(self, user_id: str, session_id: Optional[str] = None):
+        """Drop one session, or all of a user's sessions"""
+        if session_id is not None:
+            self.entries.pop((user_id, session_id), None)
+            return
+        for key in [key for key in self.entries if key[0] == user_id]:
+            del self.entries[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for monitoring"""
+        lookups = self.hits + self.misses
+        return {
+            "backend": CHAT_SESSION_CACHE_BACKEND,
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+class RedisSessionCache(SessionCache):
+    """Hot sessions kept in Redis.
+
+    Each session is a key with a TTL, refreshed on every turn; a per-user
+    set of session ids lets clearing a user's history drop them all. Size is
+    bounded by the TTL and the Redis eviction policy rather than max_entries.
+    """
+
+    PREFIX = "chat-session:"
+    USER_PREFIX = "chat-sessions:"
+
+    def key_for(self, user_id: str, session_id: str) -> str:
+        return f"{self.PREFIX}{user_id}:{session_id}"
+
+    async def get(self, user_id: str, session_id: str) -> Optional[Dict[str, Any]]:
+        raw = await get_redis().get(self.key_for(user_id, session_id))
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(raw)
+
+    async def set(self, user_id: str, session_id: str, entry: Dict[str, Any]):
+        if not self.enabled:
+            return
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.set(self.key_for(user_id, session_id), json.dumps(entry, default=str), ex=self.ttl)
+        pipe.sadd(f"{self.USER_PREFIX}{user_id}", session_id)
+        pipe.expire(f"{self.USER_PREFIX}{user_id}", self.ttl)
+        await pipe.execute()
+
+    async def delete(self, user_id: str, session_id: Optional[str] = None):
+        redis = get_redis()
+        if session_id is not None:
+            await redis.delete(self.key_for(user_id, session_id))
+            await redis.srem(f"{self.USER_PREFIX}{user_id}", session_id)
+            return
+        session_ids = await redis.smembers(f"{self.USER_PREFIX}{user_id}")
+        await redis.delete(
+            f"{self.USER_PREFIX}{user_id}",
+            *(self.key_for(user_id, member) for member in session_ids)
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats["entries"] = None  # shared; not tracked per process
+        return stats
+
+def create_session_cache() -> SessionCache:
+    if CHAT_SESSION_CACHE_BACKEND == "redis":
+        return RedisSessionCache()
+    if WEB_CONCURRENCY > 1 and CHAT_SESSION_CACHE_SIZE > 0:
+        print("Chat session cache disabled: the memory backend cannot be shared "
+              f"between {WEB_CONCURRENCY} workers, set CHAT_SESSION_CACHE_BACKEND=redis")
+        return SessionCache(max_entries=0)
+    return SessionCache()
+
+# Shared hot-session cache for this API process
+session_cache = create_session_cache()
@@ -0,0 +1,181 @@
+import asyncio
+import os
+from typing import Dict, Any, List, Optional, Set, Tuple
+from dotenv import load_dotenv
+
+from database import get_database
+from llm import llm_provider, CHAT_MODEL
+from chat_store import message_range
+from chat_cache import session_cache
+
+load_dotenv()
+
+# Tokens of system prompt, summary and history sent with each turn; the
+# reply's max_tokens comes on top
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "6000"))
+
+# Turns that no longer fit can be folded into a rolling summary, written in
+# the background once this many messages have dropped out of the window
+CHAT_SUMMARY_ENABLED = os.getenv("CHAT_SUMMARY_ENABLED", "false").lower() == "true"
+CHAT_SUMMARY_MIN_MESSAGES = int(os.getenv("CHAT_SUMMARY_MIN_MESSAGES", "6"))
+CHAT_SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "400"))
+
+# tiktoken encoding for models it doesn't know; without tiktoken (or its
+# encoding files) tokens are estimated as four characters each. tiktoken
+# downloads encodings on first use unless TIKTOKEN_CACHE_DIR already has them
+CHAT_TOKEN_ENCODING = os.getenv("CHAT_TOKEN_ENCODING", "cl100k_base")
+
+# Longest the application waits for the encoding at startup before falling
+# back to estimates
+CHAT_TOKEN_ENCODING_TIMEOUT_SECONDS = float(os.getenv("CHAT_TOKEN_ENCODING_TIMEOUT_SECONDS", "10"))
+
+# Role and separators the chat format adds to every message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation so far for your own future reference. Keep facts, "
+    "names, decisions, preferences and open questions; drop small talk. Be concise."
+)
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+_encoding = None
+
+def load_encoding():
+    """Load the tokenizer for CHAT_MODEL. Blocking, as tiktoken may download
+    it, so it runs in an executor at startup and never in a request"""
+    global _encoding
+    try:
+        try:
+            encoding = tiktoken.encoding_for_model(CHAT_MODEL)
+        except KeyError:
+            encoding = tiktoken.get_encoding(CHAT_TOKEN_ENCODING)
+        _encoding = encoding
+    except Exception as e:
+        print(f"Token encoding unavailable, estimating token counts: {e}")
+
+async def start_encoding(timeout: float = CHAT_TOKEN_ENCODING_TIMEOUT_SECONDS):
+    """Load the encoding in the background; counts are estimated until then"""
+    if tiktoken is None:
+        return
+    loop = asyncio.get_running_loop()
+    try:
+        await asyncio.wait_for(loop.run_in_executor(None, load_encoding), timeout)
+    except asyncio.TimeoutError:
+        print(f"Token encoding not loaded after {timeout:.0f}s, estimating token counts")
+
+def count_tokens(text: str) -> int:
+    """Tokens in a piece of text"""
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    """Tokens a stored message costs, using its cached count when present"""
+    tokens = message.get("tokens")
+    if tokens is None:
+        tokens = count_tokens(message["content"])
+    return tokens + MESSAGE_OVERHEAD_TOKENS
+
+def build_context(
+    session: Optional[Dict[str, Any]],
+    history: List[Dict[str, Any]],
+    system_prompt: Optional[str],
+    user_message: str,
+    budget: int = CHAT_CONTEXT_TOKENS
+) -> Tuple[List[Dict[str, str]], int]:
+    """Messages to send for a turn, and the seq of the oldest one kept.
+
+    history is the session's latest messages, oldest first, as returned by
+    chat_store.recent_messages. The system prompt, the session's summary and
+    the new message always go; earlier messages are added newest first
+    while they fit the budget. Messages already folded into the summary are
+    never resent.
+    """
+    summary = (session or {}).get("summary")
+    start = summary["upto"] if summary else 0
+
+    head = []
+    if system_prompt:
+        head.append({"role": "system", "content": system_prompt})
+    if summary:
+        head.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary['text']}"})
+    tail = [{"role": "user", "content": user_message}]
+
+    remaining = budget - sum(message_tokens(message) for message in head + tail)
+    kept = len(history)
+    while kept > 0 and history[kept - 1]["seq"] >= start:
+        cost = message_tokens(history[kept - 1])
+        if cost > remaining:
+            break
+        remaining -= cost
+        kept -= 1
+
+    if kept < len(history):
+        first_kept = history[kept]["seq"]
+    else:
+        first_kept = (session or {}).get("message_count", 0)
+    turns = [{"role": message["role"], "content": message["content"]} for message in history[kept:]]
+    return head + turns + tail, first_kept
+
+class ConversationSummarizer:
+    """Folds turns that fell out of the context window into a rolling
+    summary stored on the session, one session at a time"""
+
+    def __init__(self):
+        self.running: Set[str] = set()
+        self.tasks: Set[asyncio.Task] = set()
+        self.summaries = 0
+        self.failures = 0
+
+    def schedule(self, session: Optional[Dict[str, Any]], first_kept: int):
+        """Start a summary if enough messages have dropped out"""
+        if not CHAT_SUMMARY_ENABLED or not session or not llm_provider.configured:
+            return
+        summary = session.get("summary")
+        upto = summary["upto"] if summary else 0
+        if first_kept - upto < CHAT_SUMMARY_MIN_MESSAGES or session["_id"] in self.running:
+            return
+
+        self.running.add(session["_id"])
+        task = asyncio.create_task(self._summarize(session, upto, first_kept))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _summarize(self, session: Dict[str, Any], upto: int, first_kept: int):
+        try:
+            summary = session.get("summary")
+            messages = await message_range(session, upto, first_kept)
+            transcript = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+            if summary:
+                transcript = f"Earlier summary:\n{summary['text']}\n\nLater messages:\n{transcript}"
+
+            completion = await llm_provider.complete(
+                [
+                    {"role": "system", "content": SUMMARY_PROMPT},
+                    {"role": "user", "content": transcript}
+                ],
+                CHAT_SUMMARY_MAX_TOKENS,
+                0.2
+            )
+
+            # Skip the write if another process has moved the summary on
+            db = get_database()
+            result = await db.chat_history.update_one(
+                {"_id": session["_id"], "summary.upto": summary["upto"] if summary else None},
+                {"$set": {"summary": {"text": completion["content"], "upto": first_kept}}}
+            )
+            # The cached copy still has the old summary; reload it next turn
+            if result.modified_count:
+                await session_cache.delete(session["user_id"], session["session_id"])
+            self.summaries += 1
+        except Exception as e:
+            self.failures += 1
+            print(f"Failed to summarize chat session {session['_id']}: {e}")
+        finally:
+            self.running.discard(session["_id"])
+
+conversation_summarizer = ConversationSummarizer()
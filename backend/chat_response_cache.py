@@ -0,0 +1,294 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+from dotenv import load_dotenv
+
+import numpy as np
+
+load_dotenv()
+
+# Opt-in. Replies are only reused for requests at or below this temperature,
+# where a new completion would be (near) identical anyway
+CHAT_RESPONSE_CACHE_ENABLED = os.getenv("CHAT_RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+CHAT_RESPONSE_CACHE_MAX_TEMPERATURE = float(os.getenv("CHAT_RESPONSE_CACHE_MAX_TEMPERATURE", "0"))
+CHAT_RESPONSE_CACHE_SIZE = int(os.getenv("CHAT_RESPONSE_CACHE_SIZE", "5000"))
+CHAT_RESPONSE_CACHE_TTL = int(os.getenv("CHAT_RESPONSE_CACHE_TTL", "3600"))
+
+# "user" keeps cached replies to the user who got them; "global" shares them
+# between users sending the same conversation
+CHAT_RESPONSE_CACHE_SCOPE = os.getenv("CHAT_RESPONSE_CACHE_SCOPE", "user")
+
+# Optional semantic layer for one-shot questions: a local embedding model
+# finds earlier questions worded differently but meaning the same
+CHAT_SEMANTIC_CACHE_ENABLED = os.getenv("CHAT_SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+CHAT_SEMANTIC_CACHE_MODEL = os.getenv("CHAT_SEMANTIC_CACHE_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+CHAT_SEMANTIC_CACHE_DEVICE = os.getenv("CHAT_SEMANTIC_CACHE_DEVICE", "cpu")
+CHAT_SEMANTIC_CACHE_THRESHOLD = float(os.getenv("CHAT_SEMANTIC_CACHE_THRESHOLD", "0.95"))
+
+# Semantic indexes kept at once, one per tenant, model, system prompt and
+# settings; the least recently used go first
+CHAT_SEMANTIC_CACHE_MAX_INDEXES = int(os.getenv("CHAT_SEMANTIC_CACHE_MAX_INDEXES", "1000"))
+
+class TextEmbedder:
+    """Sentence embeddings from a local transformers model, mean pooled and
+    normalized so a dot product is the cosine similarity.
+
+    The model is loaded on first use and runs in the default executor to
+    keep the event loop free; if it cannot be loaded, embed returns None.
+    """
+
+    def __init__(self, model_name: str = CHAT_SEMANTIC_CACHE_MODEL, device: str = CHAT_SEMANTIC_CACHE_DEVICE):
+        self.model_name = model_name
+        self.device = device
+        self.model = None
+        self.tokenizer = None
+        self.failed = False
+        self.lock = asyncio.Lock()
+
+    def _load(self):
+        from transformers import AutoModel, AutoTokenizer
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        self.model = AutoModel.from_pretrained(self.model_name).to(self.device).eval()
+
+    def _embed(self, text: str) -> np.ndarray:
+        import torch
+        inputs = self.tokenizer(text, truncation=True, max_length=256, return_tensors="pt").to(self.device)
+        with torch.no_grad():
+            hidden = self.model(**inputs).last_hidden_state
+        mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+        vector = ((hidden * mask).sum(dim=1) / mask.sum(dim=1))[0]
+        vector = torch.nn.functional.normalize(vector, dim=0)
+        return vector.float().cpu().numpy()
+
+    async def embed(self, text: str) -> Optional[np.ndarray]:
+        if self.failed:
+            return None
+        loop = asyncio.get_running_loop()
+        if self.model is None:
+            async with self.lock:
+                if self.model is None and not self.failed:
+                    try:
+                        await loop.run_in_executor(None, self._load)
+                        print(f"Loaded chat cache embedding model {self.model_name}")
+                    except Exception as e:
+                        self.failed = True
+                        print(f"Semantic chat cache disabled, embedding model failed to load: {e}")
+                if self.failed:
+                    return None
+        return await loop.run_in_executor(None, self._embed, text)
+
+class SemanticIndex:
+    """Exact nearest-neighbour search over the embedded questions of one
+    bucket; a matrix product is fast enough at cache sizes.
+
+    Rows live in a preallocated array that doubles when full, and a removed
+    row is replaced by the last one, so adds and removes are O(1) amortized.
+    """
+
+    def __init__(self):
+        self.keys: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.vectors: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, key: str, vector: np.ndarray):
+        if key in self.rows:
+            self.vectors[self.rows[key]] = vector
+            return
+        if self.vectors is None:
+            self.vectors = np.empty((16, vector.shape[0]), dtype=np.float32)
+        elif len(self.keys) == len(self.vectors):
+            grown = np.empty((2 * len(self.vectors), self.vectors.shape[1]), dtype=np.float32)
+            grown[:len(self.keys)] = self.vectors
+            self.vectors = grown
+        self.rows[key] = len(self.keys)
+        self.vectors[len(self.keys)] = vector
+        self.keys.append(key)
+
+    def remove(self, key: str):
+        row = self.rows.pop(key, None)
+        if row is None:
+            return
+        last = len(self.keys) - 1
+        if row != last:
+            moved = self.keys[last]
+            self.keys[row] = moved
+            self.rows[moved] = row
+            self.vectors[row] = self.vectors[last]
+        self.keys.pop()
+
+    def search(self, vector: np.ndarray) -> Tuple[Optional[str], float]:
+        """The closest key and its cosine similarity"""
+        if not self.keys:
+            return None, 0.0
+        scores = self.vectors[:len(self.keys)] @ vector
+        best = int(np.argmax(scores))
+        return self.keys[best], float(scores[best])
+
+class ResponseCache:
+    """TTL'd LRU cache of chat replies.
+
+    The exact layer is keyed on a hash of the tenant, model, full prompt
+    (system prompt, summary, history and message), temperature and
+    max_tokens. For one-shot questions the semantic layer also matches
+    differently worded questions sent with the same system prompt and
+    settings. lookup() and store() bracket a completion:
+
+        lookup = await response_cache.lookup(...)
+        if lookup["response"] is None:
+            ...call the model...
+            await response_cache.store(lookup, response)
+    """
+
+    def __init__(
+        self,
+        enabled: bool = CHAT_RESPONSE_CACHE_ENABLED,
+        max_entries: int = CHAT_RESPONSE_CACHE_SIZE,
+        ttl: int = CHAT_RESPONSE_CACHE_TTL,
+        max_temperature: float = CHAT_RESPONSE_CACHE_MAX_TEMPERATURE,
+        scope: str = CHAT_RESPONSE_CACHE_SCOPE,
+        semantic: bool = CHAT_SEMANTIC_CACHE_ENABLED,
+        threshold: float = CHAT_SEMANTIC_CACHE_THRESHOLD,
+        max_indexes: int = CHAT_SEMANTIC_CACHE_MAX_INDEXES
+    ):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_temperature = max_temperature
+        self.scope = scope
+        self.threshold = threshold
+        self.max_indexes = max_indexes
+        self.embedder = TextEmbedder() if enabled and semantic else None
+        # key -> (expires_at, response, semantic bucket or None)
+        self.entries: "OrderedDict[str, Tuple[float, Dict[str, Any], Optional[str]]]" = OrderedDict()
+        self.indexes: "OrderedDict[str, SemanticIndex]" = OrderedDict()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+
+    def tenant_for(self, user_id: str) -> str:
+        return "*" if self.scope == "global" else user_id
+
+    @staticmethod
+    def hash_for(value: Any) -> str:
+        return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+    def _get(self, key: Optional[str]) -> Optional[Dict[str, Any]]:
+        entry = self.entries.get(key) if key else None
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            self._drop(key)
+            return None
+        self.entries.move_to_end(key)
+        return dict(entry[1])
+
+    def _drop(self, key: str):
+        """Remove an entry and its semantic index row"""
+        _, _, bucket = self.entries.pop(key)
+        index = self.indexes.get(bucket) if bucket else None
+        if index is not None:
+            index.remove(key)
+            if not len(index):
+                del self.indexes[bucket]
+
+    async def lookup(
+        self,
+        user_id: str,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        one_shot: bool = False
+    ) -> Dict[str, Any]:
+        """Find a cached reply; the result also carries what store() needs"""
+        lookup = {"key": None, "bucket": None, "vector": None, "response": None}
+        if not self.enabled:
+            return lookup
+        if temperature > self.max_temperature:
+            self.bypassed += 1
+            return lookup
+
+        tenant = self.tenant_for(user_id)
+        lookup["key"] = self.hash_for([tenant, model, messages, temperature, max_tokens])
+        lookup["response"] = self._get(lookup["key"])
+        if lookup["response"] is not None:
+            self.hits += 1
+            return lookup
+
+        # The semantic layer compares only the question; everything before
+        # it (here just the system prompt) must match exactly
+        if self.embedder is not None and one_shot:
+            lookup["bucket"] = self.hash_for([tenant, model, messages[:-1], temperature, max_tokens])
+            lookup["vector"] = await self.embedder.embed(messages[-1]["content"])
+            index = self.indexes.get(lookup["bucket"])
+            if lookup["vector"] is not None and index is not None:
+                self.indexes.move_to_end(lookup["bucket"])
+                key, score = index.search(lookup["vector"])
+                if score >= self.threshold:
+                    lookup["response"] = self._get(key)
+                    if lookup["response"] is not None:
+                        self.semantic_hits += 1
+                        return lookup
+
+        self.misses += 1
+        return lookup
+
+    async def store(self, lookup: Dict[str, Any], response: Dict[str, Any]):
+        """Cache the reply a lookup missed"""
+        if lookup["key"] is None or lookup["response"] is not None:
+            return
+        if lookup["key"] in self.entries:
+            self._drop(lookup["key"])
+
+        bucket = lookup["bucket"] if lookup["vector"] is not None else None
+        self.entries[lookup["key"]] = (time.monotonic() + self.ttl, response, bucket)
+        if bucket is not None:
+            index = self.indexes.get(bucket)
+            if index is None:
+                index = self.indexes[bucket] = SemanticIndex()
+            self.indexes.move_to_end(bucket)
+            index.add(lookup["key"], lookup["vector"])
+
+            # Dropping an index leaves its entries reachable by exact match
+            while len(self.indexes) > self.max_indexes:
+                _, dropped = self.indexes.popitem(last=False)
+                for key in dropped.keys:
+                    entry = self.entries.get(key)
+                    if entry is not None:
+                        self.entries[key] = (entry[0], entry[1], None)
+
+        # Least recently used entries go first; expired ones are dropped
+        # when next looked up
+        while len(self.entries) > self.max_entries:
+            self._drop(next(iter(self.entries)))
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for monitoring"""
+        lookups = self.hits + self.semantic_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "semantic": self.embedder is not None and not self.embedder.failed,
+            "scope": self.scope,
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "semantic_indexes": len(self.indexes),
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.semantic_hits) / lookups if lookups else 0.0
+        }
+
+# Shared response cache for this API process
+response_cache = ResponseCache()
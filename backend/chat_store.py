@@ -0,0 +1,241 @@
+import os
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+from dotenv import load_dotenv
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+
+from database import get_database
+from chat_cache import session_cache
+
+load_dotenv()
+
+# Newest messages loaded to build a turn's context; older ones are only
+# reached through the summary
+CHAT_CONTEXT_MAX_MESSAGES = int(os.getenv("CHAT_CONTEXT_MAX_MESSAGES", "200"))
+
+# Fields of a chat_history session document; messages live in chat_messages,
+# one document per message keyed by (user_id, session_id, seq)
+SESSION_FIELDS = {"messages": 0}
+MESSAGE_FIELDS = {"_id": 0, "user_id": 0, "session_id": 0}
+
+def session_title(content: str) -> str:
+    """Session title from its first message"""
+    return content[:50] + "..." if len(content) > 50 else content
+
+def format_session(session: Dict[str, Any]) -> Dict[str, Any]:
+    """Session metadata as returned by the chat and history endpoints"""
+    return {
+        "id": str(session["_id"]),
+        "user_id": session["user_id"],
+        "session_id": session["session_id"],
+        "title": session.get("title") or "New Chat",
+        "message_count": session.get("message_count", 0),
+        "created_at": session["created_at"],
+        "updated_at": session["updated_at"]
+    }
+
+async def migrate_session(session: Dict[str, Any]) -> Dict[str, Any]:
+    """Move a session's embedded messages array into chat_messages.
+
+    Safe to repeat and to run concurrently: messages are upserted by seq,
+    which is their index in the old array, and only the first run strips
+    the array from the session.
+    """
+    messages = session.get("messages")
+    if messages is None:
+        return session
+
+    db = get_database()
+    if messages:
+        await db.chat_messages.bulk_write([
+            UpdateOne(
+                {"user_id": session["user_id"], "session_id": session["session_id"], "seq": seq},
+                {"$setOnInsert": {**message, "_id": str(ObjectId())}},
+                upsert=True
+            )
+            for seq, message in enumerate(messages)
+        ], ordered=False)
+
+    metadata = {
+        "title": session_title(messages[0]["content"]) if messages else "New Chat",
+        "message_count": len(messages)
+    }
+    await db.chat_history.update_one(
+        {"_id": session["_id"], "messages": {"$exists": True}},
+        {"$set": metadata, "$unset": {"messages": ""}}
+    )
+    session = {key: value for key, value in session.items() if key != "messages"}
+    return {**session, **metadata}
+
+async def migrate_chat_sessions():
+    """Migrate every session still storing its messages inline"""
+    db = get_database()
+    migrated = 0
+    async for session in db.chat_history.find({"messages": {"$exists": True}}):
+        try:
+            await migrate_session(session)
+            migrated += 1
+        except Exception as e:
+            print(f"Failed to migrate chat session {session['_id']}: {e}")
+    if migrated:
+        print(f"Migrated {migrated} chat sessions to chat_messages")
+
+async def get_session(user_id: str, session_id: str) -> Optional[Dict[str, Any]]:
+    """A user's session metadata, migrating it first if needed"""
+    db = get_database()
+    session = await db.chat_history.find_one({"user_id": user_id, "session_id": session_id})
+    if session and "messages" in session:
+        session = await migrate_session(session)
+    return session
+
+async def recent_messages(session: Optional[Dict[str, Any]], limit: int = CHAT_CONTEXT_MAX_MESSAGES) -> List[Dict[str, Any]]:
+    """The newest messages not yet folded into the summary, oldest first"""
+    if not session:
+        return []
+    db = get_database()
+    summary = session.get("summary")
+    cursor = db.chat_messages.find(
+        {
+            "user_id": session["user_id"],
+            "session_id": session["session_id"],
+            "seq": {"$gte": summary["upto"] if summary else 0}
+        },
+        MESSAGE_FIELDS
+    ).sort("seq", -1).limit(limit)
+    messages = await cursor.to_list(length=limit)
+    messages.reverse()
+    return messages
+
+async def load_context(user_id: str, session_id: str) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Session metadata and recent messages for a chat turn.
+
+    Served from the hot-session cache when the session is in it, so a turn
+    on an active conversation reads nothing from MongoDB before calling the
+    model.
+    """
+    if session_cache.enabled:
+        entry = await session_cache.get(user_id, session_id)
+        if entry is not None:
+            return entry["session"], entry["messages"]
+
+    session = await get_session(user_id, session_id)
+    history = await recent_messages(session)
+    if session:
+        await session_cache.set(user_id, session_id, {"session": session, "messages": history})
+    return session, history
+
+async def message_range(session: Dict[str, Any], start: int, end: int) -> List[Dict[str, Any]]:
+    """Messages with start <= seq < end, oldest first"""
+    db = get_database()
+    cursor = db.chat_messages.find(
+        {
+            "user_id": session["user_id"],
+            "session_id": session["session_id"],
+            "seq": {"$gte": start, "$lt": end}
+        },
+        MESSAGE_FIELDS
+    ).sort("seq", 1)
+    return await cursor.to_list(length=None)
+
+async def page_messages(
+    session: Dict[str, Any],
+    limit: int,
+    before: Optional[int] = None
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """Up to limit messages older than seq before (newest if None), oldest
+    first, and whether older ones remain"""
+    db = get_database()
+    query = {"user_id": session["user_id"], "session_id": session["session_id"]}
+    if before is not None:
+        query["seq"] = {"$lt": before}
+
+    # Fetch one extra message instead of counting
+    cursor = db.chat_messages.find(query, MESSAGE_FIELDS).sort("seq", -1).limit(limit + 1)
+    messages = await cursor.to_list(length=limit + 1)
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    messages.reverse()
+    return messages, has_more
+
+async def append_messages(
+    user_id: str,
+    session_id: str,
+    messages: List[Dict[str, Any]],
+    context: Optional[Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]] = None
+) -> Dict[str, Any]:
+    """Add messages to a session, creating it if needed.
+
+    Sequence numbers are reserved with an atomic increment of the session's
+    message_count, so concurrent turns never reuse one and a turn only
+    writes its own messages. context is what load_context returned for this
+    turn; when given, the hot-session cache is updated write-through.
+    """
+    db = get_database()
+    now = datetime.utcnow()
+    session = await db.chat_history.find_one_and_update(
+        {"user_id": user_id, "session_id": session_id},
+        {
+            "$inc": {"message_count": len(messages)},
+            "$set": {"updated_at": now},
+            "$setOnInsert": {
+                "_id": str(ObjectId()),
+                "title": session_title(messages[0]["content"]),
+                "created_at": now
+            }
+        },
+        projection=SESSION_FIELDS,
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+
+    first_seq = session["message_count"] - len(messages)
+    stored = [{**message, "seq": first_seq + offset} for offset, message in enumerate(messages)]
+    await db.chat_messages.insert_many([
+        {**message, "_id": str(ObjectId()), "user_id": user_id, "session_id": session_id}
+        for message in stored
+    ])
+
+    if context is not None:
+        await cache_turn(session, stored, *context)
+    return session
+
+async def cache_turn(
+    session: Dict[str, Any],
+    stored: List[Dict[str, Any]],
+    previous: Optional[Dict[str, Any]],
+    history: List[Dict[str, Any]]
+):
+    """Write a saved turn through to the hot-session cache.
+
+    If another turn was saved since this one loaded its context, the
+    messages in between are missing from history, so the entry is dropped
+    and rebuilt from MongoDB on the next turn instead.
+    """
+    if not session_cache.enabled:
+        return
+    if session["message_count"] - len(stored) != (previous or {}).get("message_count", 0):
+        await session_cache.delete(session["user_id"], session["session_id"])
+        return
+
+    summary = session.get("summary")
+    start = summary["upto"] if summary else 0
+    history = [message for message in history + stored if message["seq"] >= start]
+    await session_cache.set(session["user_id"], session["session_id"], {
+        "session": session,
+        "messages": history[-CHAT_CONTEXT_MAX_MESSAGES:]
+    })
+
+async def delete_sessions(user_id: str, session_id: Optional[str] = None) -> int:
+    """Delete one of a user's sessions, or all of them, with their messages.
+    Returns the number of sessions deleted."""
+    db = get_database()
+    query = {"user_id": user_id}
+    if session_id is not None:
+        query["session_id"] = session_id
+
+    result = await db.chat_history.delete_many(query)
+    await db.chat_messages.delete_many(query)
+    await session_cache.delete(user_id, session_id)
+    return result.deleted_count
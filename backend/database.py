@@ -6,10 +6,16 @@ from dotenv import load_dotenv
 load_dotenv()
 
 MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017/ai_studio")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Case-insensitive comparison used by the prompt autocomplete index; queries
+# must pass the same collation to use it
+PROMPT_COLLATION = {"locale": "en", "strength": 2}
 
 class Database:
     client: AsyncIOMotorClient = None
     database = None
+    redis = None
 
 # Database instance
 db = Database()
@@ -28,6 +34,9 @@ async def close_mongo_connection():
     if db.client:
         db.client.close()
         print("Disconnected from MongoDB")
+    if db.redis:
+        await db.redis.close()
+        db.redis = None
 
 async def create_indexes():
     """Create database indexes for better performance"""
@@ -38,13 +47,43 @@ async def create_indexes():
     # Chat history indexes
     await db.database.chat_history.create_index([("user_id", 1), ("created_at", -1)])
     await db.database.chat_history.create_index("session_id")
+    # One document per message; seq orders a session's messages
+    await db.database.chat_messages.create_index(
+        [("user_id", 1), ("session_id", 1), ("seq", 1)],
+        unique=True
+    )
     
     # Image history indexes
     await db.database.image_history.create_index([("user_id", 1), ("created_at", -1)])
-    await db.database.image_history.create_index("prompt")
+    # Prompt search: a user-scoped text index over both prompts, and a
+    # case-insensitive (user_id, prompt) index for prefix autocomplete
+    image_indexes = await db.database.image_history.index_information()
+    if "prompt_1" in image_indexes:
+        await db.database.image_history.drop_index("prompt_1")
+    await db.database.image_history.create_index(
+        [("user_id", 1), ("prompt", "text"), ("negative_prompt", "text")],
+        name="prompt_text",
+        weights={"prompt": 10, "negative_prompt": 1},
+        default_language="english"
+    )
+    await db.database.image_history.create_index(
+        [("user_id", 1), ("prompt", 1)],
+        name="user_prompt_ci",
+        collation=PROMPT_COLLATION
+    )
+    await db.database.image_history.create_index("image_urls")
+    await db.database.image_history.create_index([("created_at", -1)])
     
     print("Database indexes created successfully")
 
 def get_database():
     """Get database instance"""
-    return db.database
\ No newline at end of file
+    return db.database
+
+def get_redis():
+    """Get the shared Redis client, connecting on first use"""
+    if db.redis is None:
+        # Redis is optional; only deployments that enable a Redis backend need it
+        import redis.asyncio as redis
+        db.redis = redis.from_url(REDIS_URL, decode_responses=True)
+    return db.redis
@@ -0,0 +1,124 @@
+import asyncio
+import json
+import os
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, Set
+from dotenv import load_dotenv
+
+from database import get_redis
+
+load_dotenv()
+
+# "memory" keeps updates inside this process; "redis" fans them out to every
+# API process so a client can watch a job started by another worker
+GENERATION_EVENTS_BACKEND = os.getenv("GENERATION_EVENTS_BACKEND", "memory")
+
+# Channel for requests addressed to whichever process owns a generation
+CONTROL_CHANNEL = "control"
+
+class Subscription:
+    """One watcher of a channel.
+
+    By default only the latest message is kept: progress updates supersede
+    each other, so a slow client skips intermediate ones instead of queueing
+    them. Subscribers that must see every message pass latest_only=False.
+    """
+
+    def __init__(self, latest_only: bool = True):
+        self._messages: deque = deque(maxlen=1 if latest_only else None)
+        self._ready = asyncio.Event()
+
+    def deliver(self, message: Dict[str, Any]):
+        self._messages.append(message)
+        self._ready.set()
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Wait for the next message, or return None after timeout seconds"""
+        if not self._messages:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self._messages.popleft()
+
+class ProgressBroker:
+    """In-process pub/sub with one channel per generation id.
+
+    Watchers sleep on an event until something is published, so idle
+    connections cost no CPU.
+    """
+
+    def __init__(self):
+        self.subscribers: Dict[str, Set[Subscription]] = {}
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    @asynccontextmanager
+    async def subscribe(self, channel: str, latest_only: bool = True):
+        subscription = Subscription(latest_only)
+        self.subscribers.setdefault(channel, set()).add(subscription)
+        try:
+            yield subscription
+        finally:
+            watchers = self.subscribers.get(channel)
+            if watchers is not None:
+                watchers.discard(subscription)
+                if not watchers:
+                    del self.subscribers[channel]
+
+    def _deliver(self, channel: str, message: Dict[str, Any]):
+        for subscription in self.subscribers.get(channel, ()):
+            subscription.deliver(message)
+
+    async def publish(self, channel: str, message: Dict[str, Any]):
+        self._deliver(channel, message)
+
+class RedisProgressBroker(ProgressBroker):
+    """Broker that relays messages through Redis pub/sub.
+
+    Each process holds a single pattern subscription and fans messages out
+    to its local watchers, however many there are.
+    """
+
+    PREFIX = "generation:"
+
+    def __init__(self):
+        super().__init__()
+        self._listener: Optional[asyncio.Task] = None
+
+    async def start(self):
+        pubsub = get_redis().pubsub()
+        await pubsub.psubscribe(f"{self.PREFIX}*")
+        self._listener = asyncio.create_task(self._listen(pubsub))
+
+    async def stop(self):
+        if self._listener:
+            self._listener.cancel()
+            self._listener = None
+
+    async def _listen(self, pubsub):
+        try:
+            async for item in pubsub.listen():
+                if item["type"] != "pmessage":
+                    continue
+                channel = item["channel"][len(self.PREFIX):]
+                self._deliver(channel, json.loads(item["data"]))
+        finally:
+            await pubsub.close()
+
+    async def publish(self, channel: str, message: Dict[str, Any]):
+        await get_redis().publish(f"{self.PREFIX}{channel}", json.dumps(message, default=str))
+
+def create_broker() -> ProgressBroker:
+    if GENERATION_EVENTS_BACKEND == "redis":
+        return RedisProgressBroker()
+    return ProgressBroker()
+
+# Shared broker instance, started with the application
+progress_broker = create_broker()
@@ -0,0 +1,219 @@
+import asyncio
+import itertools
+import math
+import os
+from typing import Dict, Any, List, Optional
+from dotenv import load_dotenv
+
+from models import JobPriority
+from image_worker import worker_pool, IMAGE_BATCH_MAX_IMAGES
+
+load_dotenv()
+
+# Admission control: generations waiting in this API process, overall and
+# per user, before new submissions get 429
+GENERATION_QUEUE_MAX_DEPTH = int(os.getenv("GENERATION_QUEUE_MAX_DEPTH", "100"))
+GENERATION_QUEUE_MAX_PER_USER = int(os.getenv("GENERATION_QUEUE_MAX_PER_USER", "10"))
+
+# Images handed to the worker pool at once; 0 means one full batch per worker
+GENERATION_MAX_IN_FLIGHT_IMAGES = int(os.getenv("GENERATION_MAX_IN_FLIGHT_IMAGES", "0"))
+
+# ETAs use the average render time per image over recent generations
+ETA_SAMPLE_SIZE = int(os.getenv("ETA_SAMPLE_SIZE", "200"))
+ETA_REFRESH_SECONDS = int(os.getenv("ETA_REFRESH_SECONDS", "300"))
+DEFAULT_SECONDS_PER_IMAGE = 15.0
+
+PRIORITY_RANK = {JobPriority.HIGH: 0, JobPriority.NORMAL: 1, JobPriority.LOW: 2}
+
+class QueueFull(Exception):
+    """Raised when a generation can't be admitted; retry_after is in seconds"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class QueueTicket:
+    """A generation waiting for its turn in the fair queue"""
+
+    def __init__(self, generation_id: str, user_id: str, priority: JobPriority, images: int, start_tag: float, seq: int):
+        self.generation_id = generation_id
+        self.user_id = user_id
+        self.priority = priority
+        self.images = images
+        self.start_tag = start_tag
+        self.seq = seq
+        self.position: Optional[Dict[str, int]] = None
+        self.cancelled = False
+        self._updates: asyncio.Queue = asyncio.Queue()
+
+    def order(self):
+        return (PRIORITY_RANK[self.priority], self.start_tag, self.seq)
+
+    def put(self, kind: str, data: Any = None):
+        if kind == "cancelled":
+            self.cancelled = True
+        self._updates.put_nowait((kind, data))
+
+    async def updates(self):
+        """Yield ("position", {...}) until the ticket is dispatched or
+        cancelled; positions still waiting after a cancel are skipped"""
+        while True:
+            kind, data = await self._updates.get()
+            if self.cancelled:
+                kind, data = "cancelled", None
+            yield kind, data
+            if kind in ("dispatched", "cancelled"):
+                return
+
+class FairQueue:
+    """Per-user fair queue in front of the worker pool.
+
+    Higher priority classes always go first. Within a class, users are
+    served by start-time fair queueing weighted by image count: each user's
+    next job is tagged after their previous one, so a user with dozens of
+    4-image jobs queued waits behind other users' work instead of ahead of
+    it. Jobs are handed to the pool while the images in flight fit its
+    batch capacity, and the pool micro-batches what it receives.
+    """
+
+    def __init__(
+        self,
+        max_depth: int = GENERATION_QUEUE_MAX_DEPTH,
+        max_per_user: int = GENERATION_QUEUE_MAX_PER_USER,
+        max_in_flight: int = GENERATION_MAX_IN_FLIGHT_IMAGES
+    ):
+        self.max_depth = max_depth
+        self.max_per_user = max_per_user
+        self.max_in_flight = max_in_flight
+        self.waiting: Dict[str, QueueTicket] = {}
+        self.in_flight: Dict[str, int] = {}
+        self.user_finish: Dict[str, float] = {}
+        self.virtual_time = 0.0
+        self.seconds_per_image = DEFAULT_SECONDS_PER_IMAGE
+        self.dispatched = 0
+        self.rejected = 0
+        self._seq = itertools.count()
+
+    @property
+    def capacity(self) -> int:
+        return self.max_in_flight or max(1, worker_pool.num_workers) * IMAGE_BATCH_MAX_IMAGES
+
+    def _ordered(self) -> List[QueueTicket]:
+        return sorted(self.waiting.values(), key=QueueTicket.order)
+
+    def estimate(self, images: int) -> int:
+        """Seconds until images more images, after those in flight, are done"""
+        total = sum(self.in_flight.values()) + images
+        return math.ceil(total * self.seconds_per_image / max(1, worker_pool.num_workers))
+
+    def enqueue(self, generation_id: str, user_id: str, priority: JobPriority, images: int) -> QueueTicket:
+        """Admit a generation or raise QueueFull"""
+        if len(self.waiting) >= self.max_depth:
+            self.rejected += 1
+            queued = sum(ticket.images for ticket in self.waiting.values())
+            raise QueueFull("Image generation queue is full", max(1, self.estimate(queued)))
+
+        queued = [ticket for ticket in self.waiting.values() if ticket.user_id == user_id]
+        if len(queued) >= self.max_per_user:
+            self.rejected += 1
+            ahead = sum(ticket.images for ticket in self.waiting.values() if ticket.order() <= queued[0].order())
+            raise QueueFull("Too many queued generations", max(1, self.estimate(ahead)))
+
+        start_tag = max(self.virtual_time, self.user_finish.get(user_id, 0.0))
+        self.user_finish[user_id] = start_tag + images
+        ticket = QueueTicket(generation_id, user_id, priority, images, start_tag, next(self._seq))
+        self.waiting[generation_id] = ticket
+
+        self._dispatch()
+        return ticket
+
+    def cancel(self, generation_id: str) -> bool:
+        """Drop a waiting generation; False if it isn't waiting here"""
+        ticket = self.waiting.pop(generation_id, None)
+        if ticket is None:
+            return False
+        ticket.put("cancelled")
+        self._publish_positions()
+        return True
+
+    def finish(self, generation_id: str):
+        """Free the capacity of a finished generation (or forget a waiting one)"""
+        self.waiting.pop(generation_id, None)
+        if self.in_flight.pop(generation_id, None) is not None:
+            self._dispatch()
+
+    def _dispatch(self):
+        for ticket in self._ordered():
+            used = sum(self.in_flight.values())
+            # Strict order, so large jobs aren't starved by smaller ones
+            if used and used + ticket.images > self.capacity:
+                break
+            del self.waiting[ticket.generation_id]
+            self.in_flight[ticket.generation_id] = ticket.images
+            self.virtual_time = max(self.virtual_time, ticket.start_tag)
+            self.dispatched += 1
+            ticket.put("dispatched")
+        self._publish_positions()
+
+    def _publish_positions(self):
+        images_ahead = 0
+        for position, ticket in enumerate(self._ordered(), start=1):
+            images_ahead += ticket.images
+            update = {"position": position, "estimated_time": self.estimate(images_ahead)}
+            if update != ticket.position:
+                ticket.position = update
+                ticket.put("position", update)
+
+    async def refresh_estimates(self):
+        """Recompute seconds per image from recently rendered generations"""
+        from database import get_database
+
+        db = get_database()
+        pipeline = [
+            {"$match": {"from_cache": {"$ne": True}, "processing_time": {"$gt": 0}}},
+            {"$sort": {"created_at": -1}},
+            {"$limit": ETA_SAMPLE_SIZE},
+            {"$group": {
+                "_id": None,
+                "seconds_per_image": {"$avg": {
+                    "$divide": ["$processing_time", {"$ifNull": ["$parameters.num_images", 1]}]
+                }}
+            }}
+        ]
+        rows = await db.image_history.aggregate(pipeline).to_list(length=1)
+        if rows and rows[0]["seconds_per_image"]:
+            self.seconds_per_image = rows[0]["seconds_per_image"]
+
+        # Users whose tag is behind the virtual clock have no credit left
+        for user_id, finish in list(self.user_finish.items()):
+            if finish <= self.virtual_time:
+                del self.user_finish[user_id]
+
+    async def run(self, interval: int = ETA_REFRESH_SECONDS):
+        """Refresh the ETA statistics until cancelled"""
+        while True:
+            try:
+                await self.refresh_estimates()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Failed to refresh generation ETAs: {e}")
+            await asyncio.sleep(interval)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and throughput counters for monitoring"""
+        return {
+            "waiting": len(self.waiting),
+            "in_flight": len(self.in_flight),
+            "in_flight_images": sum(self.in_flight.values()),
+            "capacity_images": self.capacity,
+            "max_depth": self.max_depth,
+            "max_per_user": self.max_per_user,
+            "users_waiting": len({ticket.user_id for ticket in self.waiting.values()}),
+            "seconds_per_image": self.seconds_per_image,
+            "dispatched": self.dispatched,
+            "rejected": self.rejected
+        }
+
+# Shared queue for this API process
+generation_queue = FairQueue()
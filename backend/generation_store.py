@@ -0,0 +1,98 @@
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+from dotenv import load_dotenv
+
+from models import GenerationProgress
+from database import get_redis
+
+load_dotenv()
+
+# "memory" is local to this process; "redis" shares statuses between every
+# uvicorn worker and node, so any of them can answer status requests
+GENERATION_STATUS_BACKEND = os.getenv("GENERATION_STATUS_BACKEND", "memory")
+
+# Statuses expire this many seconds after their last update
+GENERATION_STATUS_TTL = int(os.getenv("GENERATION_STATUS_TTL", "3600"))
+
+# Most statuses kept at once; the least recently updated go first
+GENERATION_STATUS_MAX_ENTRIES = int(os.getenv("GENERATION_STATUS_MAX_ENTRIES", "10000"))
+
+class StatusStore:
+    """In-memory generation statuses with TTL expiry and a size bound"""
+
+    def __init__(self, ttl: int = GENERATION_STATUS_TTL, max_entries: int = GENERATION_STATUS_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, Tuple[float, GenerationProgress]]" = OrderedDict()
+
+    async def get(self, generation_id: str) -> Optional[GenerationProgress]:
+        entry = self.entries.get(generation_id)
+        if entry is None:
+            return None
+
+        expires_at, progress = entry
+        if expires_at < time.monotonic():
+            del self.entries[generation_id]
+            return None
+        return progress
+
+    async def set(self, generation_id: str, progress: GenerationProgress):
+        self.entries[generation_id] = (time.monotonic() + self.ttl, progress)
+        self.entries.move_to_end(generation_id)
+
+        # Entries are ordered by last update, so expired ones come first
+        now = time.monotonic()
+        while self.entries:
+            oldest_id, (expires_at, _) = next(iter(self.entries.items()))
+            if expires_at >= now and len(self.entries) <= self.max_entries:
+                break
+            del self.entries[oldest_id]
+
+    async def delete(self, generation_id: str):
+        self.entries.pop(generation_id, None)
+
+class RedisStatusStore(StatusStore):
+    """Generation statuses kept in Redis.
+
+    Each status is a key with a TTL. A sorted set indexed by update time
+    enforces max_entries across all processes sharing the Redis instance.
+    """
+
+    PREFIX = "generation-status:"
+    INDEX = "generation-status-index"
+
+    async def get(self, generation_id: str) -> Optional[GenerationProgress]:
+        raw = await get_redis().get(f"{self.PREFIX}{generation_id}")
+        return GenerationProgress(**json.loads(raw)) if raw else None
+
+    async def set(self, generation_id: str, progress: GenerationProgress):
+        redis = get_redis()
+        now = time.time()
+
+        pipe = redis.pipeline(transaction=False)
+        pipe.set(f"{self.PREFIX}{generation_id}", json.dumps(progress.dict(), default=str), ex=self.ttl)
+        pipe.zadd(self.INDEX, {generation_id: now})
+        pipe.zremrangebyscore(self.INDEX, "-inf", now - self.ttl)
+        pipe.zcard(self.INDEX)
+        size = (await pipe.execute())[-1]
+
+        if size > self.max_entries:
+            evicted = await redis.zpopmin(self.INDEX, size - self.max_entries)
+            if evicted:
+                await redis.delete(*(f"{self.PREFIX}{member}" for member, _ in evicted))
+
+    async def delete(self, generation_id: str):
+        redis = get_redis()
+        await redis.delete(f"{self.PREFIX}{generation_id}")
+        await redis.zrem(self.INDEX, generation_id)
+
+def create_status_store() -> StatusStore:
+    if GENERATION_STATUS_BACKEND == "redis":
+        return RedisStatusStore()
+    return StatusStore()
+
+# Shared status store for this API process
+status_store = create_status_store()
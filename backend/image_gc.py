@@ -0,0 +1,196 @@
+import asyncio
+import os
+import re
+import time
+from collections import defaultdict
+from typing import Dict, Any, List, Optional
+from dotenv import load_dotenv
+
+from database import get_database
+from storage import image_storage
+
+load_dotenv()
+
+# Periodic reclamation of image files no image_history record references
+IMAGE_GC_ENABLED = os.getenv("IMAGE_GC_ENABLED", "true").lower() == "true"
+IMAGE_GC_INTERVAL_SECONDS = int(os.getenv("IMAGE_GC_INTERVAL_SECONDS", "3600"))
+
+# Files younger than this are never collected, which covers generations that
+# have saved their images but not yet written their record
+IMAGE_GC_GRACE_SECONDS = int(os.getenv("IMAGE_GC_GRACE_SECONDS", "3600"))
+
+# Rate limit: generations checked and deleted per batch, and the pause
+# between batches
+IMAGE_GC_BATCH_SIZE = int(os.getenv("IMAGE_GC_BATCH_SIZE", "100"))
+IMAGE_GC_BATCH_PAUSE_SECONDS = float(os.getenv("IMAGE_GC_BATCH_PAUSE_SECONDS", "1.0"))
+
+# The only files the collector touches: images saved by the pipelines as
+# {generation_id}_{i}.{format} (plus their WebP copies) and thumbnails saved
+# as thumbnails/{generation_id}_{i}_{size}.webp. Generation ids are UUIDs;
+# batch items append -{index}
+GENERATION_ID_PATTERN = r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}(?:-\d+)?"
+IMAGE_FILE = re.compile(rf"({GENERATION_ID_PATTERN})_\d+\.(?:png|webp|avif)")
+THUMBNAIL_FILE = re.compile(rf"({GENERATION_ID_PATTERN})_\d+_\d+\.webp")
+
+def generation_id_for(key: str, storage=image_storage) -> Optional[str]:
+    """Generation that produced a stored file, or None for any file this
+    application did not write.
+
+    Besides matching the naming pattern, the key must be exactly where
+    storage puts a file of that name, or where it did before sharding (the
+    flat layout of older files), which excludes stray files in the image
+    directory or bucket that merely look alike.
+    """
+    filename = key.rsplit("/", 1)[-1]
+    match = IMAGE_FILE.fullmatch(filename)
+    name = filename
+    if match is None:
+        match = THUMBNAIL_FILE.fullmatch(filename)
+        name = f"thumbnails/{filename}"
+    if match is None or key not in (name, storage.key_for(name)):
+        return None
+    return match.group(1)
+
+class ImageGarbageCollector:
+    """Deletes stored images whose generation no record references anymore.
+
+    Files are grouped by the generation id in their name. A generation is
+    live while a record has that id or lists one of its images, which is how
+    result-cache hits share the files of an earlier generation. References
+    are checked right before each batch is deleted.
+    """
+
+    def __init__(
+        self,
+        storage=image_storage,
+        grace_seconds: int = IMAGE_GC_GRACE_SECONDS,
+        batch_size: int = IMAGE_GC_BATCH_SIZE,
+        batch_pause: float = IMAGE_GC_BATCH_PAUSE_SECONDS
+    ):
+        self.storage = storage
+        self.grace_seconds = grace_seconds
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.runs = 0
+        self.total_deleted = 0
+        self.total_reclaimed_bytes = 0
+        self.last_run: Optional[Dict[str, Any]] = None
+        self._lock = asyncio.Lock()
+
+    def _candidates(self) -> Dict[str, List[tuple]]:
+        """Files old enough to collect, grouped by generation id"""
+        cutoff = time.time() - self.grace_seconds
+        groups: Dict[str, List[tuple]] = defaultdict(list)
+        for key, size, modified in self.storage.list():
+            generation_id = generation_id_for(key, self.storage)
+            if generation_id is None:
+                continue
+            if modified > cutoff:
+                # A recent file keeps its whole generation for this run
+                groups[generation_id] = None
+            elif groups[generation_id] is not None:
+                groups[generation_id].append((key, size))
+        return {generation_id: files for generation_id, files in groups.items() if files}
+
+    async def _live_generations(self, batch: Dict[str, List[tuple]]) -> set:
+        """Generation ids in batch that are still referenced"""
+        db = get_database()
+        urls = {
+            self.storage.url(key): generation_id
+            for generation_id, files in batch.items()
+            for key, _ in files
+        }
+        cursor = db.image_history.find(
+            {"$or": [
+                {"_id": {"$in": list(batch)}},
+                {"image_urls": {"$in": list(urls)}}
+            ]},
+            {"image_urls": 1}
+        )
+
+        live = set()
+        async for record in cursor:
+            live.add(record["_id"])
+            for url in record.get("image_urls", []):
+                if url in urls:
+                    live.add(urls[url])
+        return live
+
+    async def collect(self) -> Dict[str, Any]:
+        """Run one pass and report what was reclaimed"""
+        async with self._lock:
+            started = time.time()
+            loop = asyncio.get_running_loop()
+            candidates = await loop.run_in_executor(None, self._candidates)
+
+            deleted = 0
+            reclaimed = 0
+            generation_ids = list(candidates)
+            for start in range(0, len(generation_ids), self.batch_size):
+                batch = {
+                    generation_id: candidates[generation_id]
+                    for generation_id in generation_ids[start:start + self.batch_size]
+                }
+                live = await self._live_generations(batch)
+                orphans = [
+                    key
+                    for generation_id, files in batch.items() if generation_id not in live
+                    for key, _ in files
+                ]
+
+                for key in orphans:
+                    reclaimed += await loop.run_in_executor(None, self.storage.delete, key)
+                deleted += len(orphans)
+
+                if start + self.batch_size < len(generation_ids):
+                    await asyncio.sleep(self.batch_pause)
+
+            self.runs += 1
+            self.total_deleted += deleted
+            self.total_reclaimed_bytes += reclaimed
+            self.last_run = {
+                "started_at": started,
+                "duration": time.time() - started,
+                "generations_checked": len(candidates),
+                "files_deleted": deleted,
+                "reclaimed_bytes": reclaimed
+            }
+            print(f"Image GC deleted {deleted} files, reclaimed {reclaimed / (1024 * 1024):.1f}MB")
+            return self.last_run
+
+    async def run(self, interval: int = IMAGE_GC_INTERVAL_SECONDS):
+        """Collect periodically until cancelled"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.collect()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Image GC failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Totals and the last pass, for monitoring"""
+        return {
+            "enabled": IMAGE_GC_ENABLED,
+            "grace_seconds": self.grace_seconds,
+            "runs": self.runs,
+            "total_files_deleted": self.total_deleted,
+            "total_reclaimed_bytes": self.total_reclaimed_bytes,
+            "last_run": self.last_run
+        }
+
+# Shared collector, scheduled by the application on startup
+image_gc = ImageGarbageCollector()
+
+if __name__ == "__main__":
+    async def main():
+        from database import connect_to_mongo, close_mongo_connection
+
+        await connect_to_mongo()
+        try:
+            print(await image_gc.collect())
+        finally:
+            await close_mongo_connection()
+
+    asyncio.run(main())
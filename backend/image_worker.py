@@ -0,0 +1,455 @@
+import asyncio
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Any, List, Optional, Tuple
+from dotenv import load_dotenv
+
+from models import ImageGenerationRequest
+
+load_dotenv()
+
+# Number of inference processes started next to the API process. Set to 0
+# on chat/auth-only replicas so they never spawn workers or load torch.
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "1"))
+
+# Micro-batching: how many output images one forward pass may produce, and
+# how long a job waits for compatible requests before its batch is sent
+IMAGE_BATCH_MAX_IMAGES = int(os.getenv("IMAGE_BATCH_MAX_IMAGES", "4"))
+IMAGE_BATCH_WAIT_MS = int(os.getenv("IMAGE_BATCH_WAIT_MS", "50"))
+
+# Crashed workers are restarted after a delay that doubles with each crash;
+# a worker crashing more than IMAGE_WORKER_MAX_RESTARTS times in a row marks
+# the pool degraded and it stops accepting jobs. A worker that stayed up for
+# IMAGE_WORKER_RESTART_RESET_SECONDS starts counting again from zero
+IMAGE_WORKER_MAX_RESTARTS = int(os.getenv("IMAGE_WORKER_MAX_RESTARTS", "5"))
+IMAGE_WORKER_RESTART_BACKOFF_SECONDS = float(os.getenv("IMAGE_WORKER_RESTART_BACKOFF_SECONDS", "1"))
+IMAGE_WORKER_RESTART_MAX_BACKOFF_SECONDS = float(os.getenv("IMAGE_WORKER_RESTART_MAX_BACKOFF_SECONDS", "60"))
+IMAGE_WORKER_RESTART_RESET_SECONDS = float(os.getenv("IMAGE_WORKER_RESTART_RESET_SECONDS", "600"))
+
+# Seconds between checks for crashed workers
+WORKER_CHECK_SECONDS = 1.0
+
+TERMINAL_EVENTS = ("completed", "failed", "cancelled")
+
+def batch_key(request: ImageGenerationRequest):
+    """Requests with the same key can share one forward pass"""
+    return (request.model_version, request.size, request.steps, request.guidance_scale)
+
+class MicroBatcher:
+    """Groups queued jobs into batches of compatible requests.
+
+    Lives in the API process: jobs wait here in one FIFO per batch_key and
+    only whole batches go onto the shared job queue, so no worker holds back
+    jobs it can't render yet and any idle worker can take the next batch. A
+    batch is due once it is full or its oldest job has waited max_wait
+    seconds; batches are formed in order of their oldest job.
+    """
+
+    def __init__(self, max_images: int = IMAGE_BATCH_MAX_IMAGES, max_wait: float = IMAGE_BATCH_WAIT_MS / 1000):
+        self.max_images = max_images
+        self.max_wait = max_wait
+        self.queues: Dict[Any, deque] = {}
+
+    def __len__(self) -> int:
+        return sum(len(jobs) for jobs in self.queues.values())
+
+    def add(self, job: Dict[str, Any]):
+        self.queues.setdefault(batch_key(job["request"]), deque()).append((time.monotonic(), job))
+
+    def remove(self, generation_id: str) -> bool:
+        """Drop a job that hasn't been batched yet"""
+        for key, jobs in self.queues.items():
+            for entry in jobs:
+                if entry[1]["generation_id"] == generation_id:
+                    jobs.remove(entry)
+                    if not jobs:
+                        del self.queues[key]
+                    return True
+        return False
+
+    def next_batch(self) -> Tuple[Optional[List[Dict[str, Any]]], Optional[float]]:
+        """The next due batch, or None and the seconds until one is due"""
+        now = time.monotonic()
+        wait = None
+        for key, jobs in sorted(self.queues.items(), key=lambda item: item[1][0][0]):
+            # The oldest job always goes, even if alone it exceeds max_images
+            count, images = 1, jobs[0][1]["request"].num_images
+            while count < len(jobs) and images + jobs[count][1]["request"].num_images <= self.max_images:
+                images += jobs[count][1]["request"].num_images
+                count += 1
+
+            full = images >= self.max_images or count < len(jobs)
+            remaining = jobs[0][0] + self.max_wait - now
+            if full or remaining <= 0:
+                batch = [jobs.popleft()[1] for _ in range(count)]
+                if not jobs:
+                    del self.queues[key]
+                return batch, None
+            wait = remaining if wait is None else min(wait, remaining)
+        return None, wait
+
+class CancelledJobs:
+    """Generation ids the API process has cancelled, as seen by one worker.
+
+    Cancellations arrive on the worker's control queue and are picked up by
+    poll(), which the render loop calls between denoising steps. Only the
+    most recent max_entries ids are remembered.
+    """
+
+    def __init__(self, control_queue, max_entries: int = 10000):
+        self.control_queue = control_queue
+        self.max_entries = max_entries
+        self.ids: "OrderedDict[str, None]" = OrderedDict()
+
+    def poll(self) -> "OrderedDict[str, None]":
+        while True:
+            try:
+                generation_id = self.control_queue.get_nowait()
+            except queue.Empty:
+                break
+            self.ids[generation_id] = None
+            if len(self.ids) > self.max_entries:
+                self.ids.popitem(last=False)
+        return self.ids
+
+def worker_main(worker_id: int, job_queue, event_queue, control_queue):
+    """Entry point of an inference process"""
+    # torch/diffusers are only ever imported inside worker processes
+    from pipelines import generate_batch, cache_stats, GenerationCancelled
+
+    print(f"Image worker {worker_id} started (pid {os.getpid()})")
+    cancelled = CancelledJobs(control_queue)
+
+    while True:
+        # The pool only sends batches to workers that asked for one
+        event_queue.put(("idle", worker_id, None))
+        batch = job_queue.get()
+        if batch is None:
+            break
+
+        # "started" tells the pool which worker owns a job, so it can be
+        # failed if this process dies
+        for job in batch:
+            event_queue.put(("started", job["generation_id"], worker_id))
+
+        # Jobs cancelled while queued are dropped without touching the model
+        stopped = cancelled.poll()
+        batch = [job for job in batch if job["generation_id"] not in stopped]
+        if not batch:
+            continue
+
+        generation_ids = [job["generation_id"] for job in batch]
+
+        def report(progress: float, message: str, estimated_time: Optional[int] = None):
+            for generation_id in generation_ids:
+                event_queue.put(("progress", generation_id, {
+                    "progress": progress,
+                    "message": message,
+                    "estimated_time": estimated_time
+                }))
+
+        def preview(generation_id: str, image: str, step: int):
+            event_queue.put(("preview", generation_id, {"image": image, "step": step}))
+
+        try:
+            results = generate_batch(
+                [(job["generation_id"], job["request"]) for job in batch],
+                report,
+                cancelled.poll,
+                preview
+            )
+            for generation_id, result in results.items():
+                event_queue.put(("completed", generation_id, result))
+        except GenerationCancelled:
+            print(f"Image worker {worker_id} interrupted a cancelled batch")
+        except Exception as e:
+            print(f"Error in image generation: {e}")
+            for generation_id in generation_ids:
+                event_queue.put(("failed", generation_id, str(e)))
+
+        event_queue.put(("stats", worker_id, cache_stats()))
+
+    print(f"Image worker {worker_id} stopped")
+
+class GenerationJob:
+    """Handle for a job submitted to the worker pool"""
+
+    def __init__(self, generation_id: str):
+        self.generation_id = generation_id
+        self.worker_id: Optional[int] = None
+        self.cancelled = False
+        self._events: asyncio.Queue = asyncio.Queue()
+
+    def put(self, kind: str, data: Any = None):
+        if kind == "cancelled":
+            self.cancelled = True
+        self._events.put_nowait((kind, data))
+
+    async def events(self):
+        """Yield (kind, data) events until the job completes or fails.
+
+        Once cancelled, events still waiting are skipped, so a consumer
+        never reports progress for a job the user has already cancelled.
+        """
+        while True:
+            kind, data = await self._events.get()
+            if self.cancelled:
+                kind, data = "cancelled", None
+            yield kind, data
+            if kind in TERMINAL_EVENTS:
+                return
+
+class WorkerPool:
+    """Pool of inference processes fed by a shared job queue.
+
+    The API process only batches and enqueues jobs and reads the events the
+    workers send back, so renders never block the event loop. A batch is
+    put on the queue only when a worker has reported itself idle.
+    """
+
+    def __init__(self, num_workers: int = IMAGE_WORKERS):
+        self.num_workers = num_workers
+        self.ctx = mp.get_context("spawn")
+        self.job_queue = None
+        self.event_queue = None
+        self.processes: Dict[int, Any] = {}
+        self.control_queues: Dict[int, Any] = {}
+        self.jobs: Dict[str, GenerationJob] = {}
+        self.worker_stats: Dict[int, Dict[str, Any]] = {}
+        self.batcher = MicroBatcher()
+        self.idle_workers: set = set()
+        self.started_at: Dict[int, float] = {}
+        self.crashes: Dict[int, int] = {}
+        self.restart_at: Dict[int, float] = {}
+        self.degraded = False
+        self._batch_timer: Optional[asyncio.TimerHandle] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._listener: Optional[threading.Thread] = None
+        self._running = False
+
+    def start(self):
+        """Spawn the worker processes and the result listener"""
+        if self._running:
+            return
+        if self.num_workers <= 0:
+            print("Image workers disabled (IMAGE_WORKERS=0)")
+            return
+
+        self.loop = asyncio.get_running_loop()
+        self.job_queue = self.ctx.Queue()
+        self.event_queue = self.ctx.Queue()
+        self._running = True
+        self.degraded = False
+        self.crashes.clear()
+        self.restart_at.clear()
+
+        for worker_id in range(self.num_workers):
+            self._spawn(worker_id)
+
+        self._listener = threading.Thread(target=self._listen, name="image-worker-listener", daemon=True)
+        self._listener.start()
+        print(f"Started {self.num_workers} image worker(s)")
+
+    def stop(self, timeout: float = 10.0):
+        """Ask the workers to exit and fail whatever is still in flight"""
+        if not self._running:
+            return
+
+        self._running = False
+        if self._batch_timer:
+            self._batch_timer.cancel()
+        self.batcher = MicroBatcher()
+        self.idle_workers.clear()
+        for _ in self.processes:
+            self.job_queue.put(None)
+        for process in self.processes.values():
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self.processes.clear()
+        self.control_queues.clear()
+        self.restart_at.clear()
+
+        for job in self.jobs.values():
+            job.put("failed", "Image workers shut down")
+        self.jobs.clear()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether this process can accept image generation jobs"""
+        return self._running and not self.degraded
+
+    def submit(self, generation_id: str, request: ImageGenerationRequest) -> GenerationJob:
+        """Enqueue a generation and return a handle to its events"""
+        if not self._running:
+            raise RuntimeError("Image workers are not running")
+        if self.degraded:
+            raise RuntimeError("Image workers keep crashing; generation is disabled")
+
+        job = GenerationJob(generation_id)
+        self.jobs[generation_id] = job
+        self.batcher.add({"generation_id": generation_id, "request": request})
+        self._send_batches()
+        return job
+
+    def cancel(self, generation_id: str) -> bool:
+        """Cancel a queued or running job.
+
+        The job's handle is resolved immediately. A job not yet batched is
+        simply dropped; otherwise the workers skip it if it hasn't started,
+        or interrupt its batch at the next denoising step.
+        """
+        job = self.jobs.pop(generation_id, None)
+        if job is None:
+            return False
+
+        if not self.batcher.remove(generation_id):
+            for control_queue in self.control_queues.values():
+                control_queue.put(generation_id)
+        job.put("cancelled")
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Summarise the pool for monitoring"""
+        return {
+            "workers": self.num_workers,
+            "alive": sum(1 for p in self.processes.values() if p.is_alive()),
+            "degraded": self.degraded,
+            "crashes": self.crashes,
+            "in_flight": len(self.jobs),
+            "batching": len(self.batcher),
+            "idle": len(self.idle_workers),
+            "worker_stats": self.worker_stats
+        }
+
+    def _spawn(self, worker_id: int):
+        self.control_queues[worker_id] = self.ctx.Queue()
+        process = self.ctx.Process(
+            target=worker_main,
+            args=(worker_id, self.job_queue, self.event_queue, self.control_queues[worker_id]),
+            name=f"image-worker-{worker_id}",
+            daemon=True
+        )
+        process.start()
+        self.processes[worker_id] = process
+        self.started_at[worker_id] = time.monotonic()
+
+    def _send_batches(self):
+        """Hand due batches to idle workers; wake up when the next is due"""
+        if self._batch_timer:
+            self._batch_timer.cancel()
+            self._batch_timer = None
+
+        while self.idle_workers:
+            batch, wait = self.batcher.next_batch()
+            if batch is None:
+                if wait is not None:
+                    self._batch_timer = self.loop.call_later(wait, self._send_batches)
+                return
+            self.idle_workers.pop()
+            self.job_queue.put(batch)
+
+    def _listen(self):
+        """Forward worker events onto the event loop (runs in a thread).
+
+        Workers are checked every WORKER_CHECK_SECONDS whether or not events
+        keep arriving, so a crash is noticed while the others are busy.
+        """
+        next_check = time.monotonic() + WORKER_CHECK_SECONDS
+        while self._running:
+            try:
+                event = self.event_queue.get(timeout=max(0.0, next_check - time.monotonic()))
+            except queue.Empty:
+                event = None
+            except (EOFError, OSError):
+                break
+            if event is not None:
+                self.loop.call_soon_threadsafe(self._dispatch, event)
+            if time.monotonic() >= next_check:
+                next_check = time.monotonic() + WORKER_CHECK_SECONDS
+                self.loop.call_soon_threadsafe(self._check_workers)
+
+    def _dispatch(self, event):
+        kind, key, data = event
+        # Stats and idle events are keyed by worker id, not generation id
+        if kind == "stats":
+            self.worker_stats[key] = data
+            return
+        if kind == "idle":
+            self.idle_workers.add(key)
+            self._send_batches()
+            return
+
+        generation_id = key
+        job = self.jobs.get(generation_id)
+        if job is None:
+            return
+
+        if kind == "started":
+            job.worker_id = data
+        if kind in TERMINAL_EVENTS:
+            del self.jobs[generation_id]
+        job.put(kind, data)
+
+    def _check_workers(self):
+        """Fail the jobs of crashed workers and restart them with backoff"""
+        if not self._running:
+            return
+
+        now = time.monotonic()
+        for worker_id, process in list(self.processes.items()):
+            if process.is_alive():
+                continue
+            if worker_id in self.restart_at:
+                if now >= self.restart_at[worker_id] and not self.degraded:
+                    del self.restart_at[worker_id]
+                    self._spawn(worker_id)
+                continue
+
+            self.worker_stats.pop(worker_id, None)
+            self.idle_workers.discard(worker_id)
+            for generation_id, job in list(self.jobs.items()):
+                if job.worker_id == worker_id:
+                    del self.jobs[generation_id]
+                    job.put("failed", "Image worker exited unexpectedly")
+
+            if now - self.started_at[worker_id] >= IMAGE_WORKER_RESTART_RESET_SECONDS:
+                self.crashes[worker_id] = 0
+            self.crashes[worker_id] = self.crashes.get(worker_id, 0) + 1
+            if self.crashes[worker_id] > IMAGE_WORKER_MAX_RESTARTS:
+                print(f"Image worker {worker_id} exited with code {process.exitcode} "
+                      f"after {IMAGE_WORKER_MAX_RESTARTS} restarts, image generation disabled")
+                self.restart_at[worker_id] = float("inf")
+                self._degrade()
+            else:
+                delay = min(
+                    IMAGE_WORKER_RESTART_BACKOFF_SECONDS * 2 ** (self.crashes[worker_id] - 1),
+                    IMAGE_WORKER_RESTART_MAX_BACKOFF_SECONDS
+                )
+                print(f"Image worker {worker_id} exited with code {process.exitcode}, restarting in {delay:g}s")
+                self.restart_at[worker_id] = now + delay
+
+        if self.degraded and not any(p.is_alive() for p in self.processes.values()):
+            for job in self.jobs.values():
+                job.put("failed", "Image workers keep crashing")
+            self.jobs.clear()
+
+    def _degrade(self):
+        """Stop accepting jobs and fail those not yet sent to a worker"""
+        self.degraded = True
+        if self._batch_timer:
+            self._batch_timer.cancel()
+            self._batch_timer = None
+        for jobs in self.batcher.queues.values():
+            for _, item in jobs:
+                job = self.jobs.pop(item["generation_id"], None)
+                if job is not None:
+                    job.put("failed", "Image workers keep crashing")
+        self.batcher = MicroBatcher()
+
+# Shared pool instance, started with the application
+worker_pool = WorkerPool()
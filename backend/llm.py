@@ -0,0 +1,123 @@
+import os
+from abc import ABC, abstractmethod
+from typing import Dict, Any, AsyncIterator, List, Optional
+from dotenv import load_dotenv
+
+import httpx
+from openai import AsyncOpenAI
+
+load_dotenv()
+
+# "openai" talks to the OpenAI API or any compatible server, such as
+# benchmarks/mock_llm.py when OPENAI_BASE_URL points at it
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4o-mini")
+
+# One connection pool per API process; idle connections are kept alive so
+# chat turns skip the TCP and TLS handshakes
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("LLM_KEEPALIVE_EXPIRY_SECONDS", "60"))
+
+# The read timeout bounds the wait for each chunk, not the whole response
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "5"))
+LLM_READ_TIMEOUT_SECONDS = float(os.getenv("LLM_READ_TIMEOUT_SECONDS", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+class LLMProvider(ABC):
+    """Chat completion backend shared by every request of this process.
+
+    start() opens the provider's connections on application startup and
+    stop() closes them on shutdown.
+    """
+
+    model = CHAT_MODEL
+
+    @property
+    def configured(self) -> bool:
+        return True
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    @abstractmethod
+    async def complete(self, messages: List[Dict[str, str]], max_tokens: int, temperature: float) -> Dict[str, Any]:
+        """Return {"content", "tokens_used", "model"} for a conversation"""
+
+    @abstractmethod
+    def stream(self, messages: List[Dict[str, str]], max_tokens: int, temperature: float) -> AsyncIterator[str]:
+        """Yield the reply's text as it is generated"""
+
+class OpenAIProvider(LLMProvider):
+    """OpenAI-compatible chat completions over one pooled HTTP client"""
+
+    def __init__(self, api_key: Optional[str] = OPENAI_API_KEY, base_url: Optional[str] = OPENAI_BASE_URL, model: str = CHAT_MODEL):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+        self.client: Optional[AsyncOpenAI] = None
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key)
+
+    async def start(self):
+        if not self.configured or self.client is not None:
+            return
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=LLM_KEEPALIVE_EXPIRY_SECONDS
+            ),
+            timeout=httpx.Timeout(LLM_READ_TIMEOUT_SECONDS, connect=LLM_CONNECT_TIMEOUT_SECONDS)
+        )
+        self.client = AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            http_client=http_client,
+            max_retries=LLM_MAX_RETRIES
+        )
+
+    async def stop(self):
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+
+    async def complete(self, messages: List[Dict[str, str]], max_tokens: int, temperature: float) -> Dict[str, Any]:
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature
+        )
+        return {
+            "content": response.choices[0].message.content or "",
+            "tokens_used": response.usage.total_tokens if response.usage else 0,
+            "model": response.model or self.model
+        }
+
+    async def stream(self, messages: List[Dict[str, str]], max_tokens: int, temperature: float) -> AsyncIterator[str]:
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True
+        )
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+def create_llm_provider() -> LLMProvider:
+    if LLM_PROVIDER == "openai":
+        return OpenAIProvider()
+    raise ValueError(f"Unknown LLM provider: {LLM_PROVIDER}")
+
+# Shared provider instance, started with the application
+llm_provider = create_llm_provider()
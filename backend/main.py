@@ -1,8 +1,9 @@
 from fastapi import FastAPI, HTTPException, Depends, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import uvicorn
+import asyncio
+import mimetypes
 import os
 from dotenv import load_dotenv
 
@@ -10,7 +11,16 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # Import routers
-from routers import auth, chat, image_generation, history, user
+from routers import auth, chat, image_generation, history, user, images
+from database import connect_to_mongo, close_mongo_connection
+from image_worker import worker_pool
+from generation_events import progress_broker
+from storage import IMAGE_DIR
+from image_gc import image_gc, IMAGE_GC_ENABLED
+from generation_queue import generation_queue
+from llm import llm_provider
+from chat_store import migrate_chat_sessions
+from chat_context import start_encoding
 
 app = FastAPI(
     title="AI Studio API",
@@ -29,9 +39,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Static files for generated images
-os.makedirs("generated_images", exist_ok=True)
-app.mount("/generated-images", StaticFiles(directory="generated_images"), name="generated_images")
+# Generated images are served by routers/images.py with immutable caching
+mimetypes.add_type("image/webp", ".webp")
+mimetypes.add_type("image/avif", ".avif")
+os.makedirs(IMAGE_DIR, exist_ok=True)
 
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
@@ -39,6 +50,32 @@ app.include_router(chat.router, prefix="/api/chat", tags=["Chat"])
 app.include_router(image_generation.router, prefix="/api/generate", tags=["Image Generation"])
 app.include_router(history.router, prefix="/api/history", tags=["History"])
 app.include_router(user.router, prefix="/api/user", tags=["User"])
+app.include_router(images.router, prefix="/generated-images", tags=["Images"])
+
+@app.on_event("startup")
+async def startup_event():
+    await connect_to_mongo()
+    await llm_provider.start()
+    await start_encoding()
+    await progress_broker.start()
+    worker_pool.start()
+    app.state.cancellation_relay = asyncio.create_task(image_generation.relay_cancellations())
+    app.state.image_gc = asyncio.create_task(image_gc.run()) if IMAGE_GC_ENABLED else None
+    app.state.queue_estimates = asyncio.create_task(generation_queue.run())
+    # Sessions are also migrated on first access, so requests need not wait
+    app.state.chat_migration = asyncio.create_task(migrate_chat_sessions())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    app.state.cancellation_relay.cancel()
+    app.state.queue_estimates.cancel()
+    app.state.chat_migration.cancel()
+    if app.state.image_gc:
+        app.state.image_gc.cancel()
+    worker_pool.stop()
+    await progress_broker.stop()
+    await llm_provider.stop()
+    await close_mongo_connection()
 
 @app.get("/")
 async def root():
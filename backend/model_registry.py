@@ -0,0 +1,102 @@
+import os
+from typing import Dict, Any, List, Optional
+
+DEFAULT_MODEL = "stable-diffusion-xl-base-1.0"
+
+# Model ids clients may request, mapped to the weights that back them.
+# memory_mb is the approximate resident size used to plan evictions before
+# a model is loaded; the real size is measured once it is in memory.
+#
+# Optional loading options (see pipelines.load_pipeline):
+#   device          "cuda" or "cpu"; defaults to CUDA when available
+#   dtype           "float16", "bfloat16" or "float32"; defaults to float16
+#                   on CUDA and float32 on CPU
+#   runtime         "torch", or "openvino" / "onnx" for an optimum export, or
+#                   "tiny" for the benchmark stand-in
+#   scheduler       "dpm", "lcm" or "euler_a"
+#   lcm_lora        LCM-LoRA weights fused into the UNet for few-step sampling
+#   channels_last   NHWC memory layout for the UNet and VAE on CPU
+#   compile         torch.compile the UNet
+#   steps, guidance_scale
+#                   fixed sampler settings that override the request's
+MODEL_REGISTRY: Dict[str, Dict[str, Any]] = {
+    "stable-diffusion-xl-base-1.0": {
+        "name": "Stable Diffusion XL Base 1.0",
+        "description": "High-quality image generation with excellent prompt following",
+        "type": "text-to-image",
+        "max_resolution": "1024x1024",
+        "repo_id": "stabilityai/stable-diffusion-xl-base-1.0",
+        "variant": "fp16",
+        "memory_mb": 7000
+    },
+    "stable-diffusion-xl-lcm-cpu": {
+        "name": "Stable Diffusion XL LCM (CPU)",
+        "description": "SDXL with LCM-LoRA, 4 steps, tuned for CPU inference nodes",
+        "type": "text-to-image",
+        "max_resolution": "1024x1024",
+        "repo_id": "stabilityai/stable-diffusion-xl-base-1.0",
+        "variant": "fp16",
+        "memory_mb": 7000,
+        "device": "cpu",
+        "dtype": "bfloat16",
+        "scheduler": "lcm",
+        "lcm_lora": "latent-consistency/lcm-lora-sdxl",
+        "channels_last": True,
+        "steps": 4,
+        "guidance_scale": 1.0
+    },
+    "sdxl-turbo-cpu": {
+        "name": "SDXL Turbo (CPU)",
+        "description": "Distilled SDXL, 2 steps without guidance, best at 512x512",
+        "type": "text-to-image",
+        "max_resolution": "512x512",
+        "repo_id": "stabilityai/sdxl-turbo",
+        "variant": "fp16",
+        "memory_mb": 7000,
+        "device": "cpu",
+        "dtype": "bfloat16",
+        "scheduler": "euler_a",
+        "channels_last": True,
+        "steps": 2,
+        "guidance_scale": 0.0
+    },
+    "sdxl-turbo-openvino": {
+        "name": "SDXL Turbo (OpenVINO)",
+        "description": "SDXL Turbo exported to OpenVINO for Intel CPUs",
+        "type": "text-to-image",
+        "max_resolution": "512x512",
+        "repo_id": "stabilityai/sdxl-turbo",
+        "memory_mb": 14000,
+        "device": "cpu",
+        "runtime": "openvino",
+        "scheduler": "euler_a",
+        "steps": 2,
+        "guidance_scale": 0.0
+    }
+}
+
+# Randomly initialised stand-in for the benchmarks in benchmarks/; never
+# enable it on a serving deployment
+if os.getenv("BENCHMARK_TINY_MODEL", "false").lower() == "true":
+    MODEL_REGISTRY["tiny-sdxl-random"] = {
+        "name": "Tiny SDXL (random weights)",
+        "description": "Benchmark stand-in with SDXL's structure; renders noise",
+        "type": "text-to-image",
+        "max_resolution": "1024x1024",
+        "memory_mb": 50,
+        "device": "cpu",
+        "runtime": "tiny"
+    }
+
+PUBLIC_FIELDS = ("name", "description", "type", "max_resolution")
+
+def get_model_spec(model_id: str) -> Optional[Dict[str, Any]]:
+    """Get the registry entry for a model id, or None if it isn't allowed"""
+    return MODEL_REGISTRY.get(model_id)
+
+def list_models() -> List[Dict[str, Any]]:
+    """Public description of every registered model"""
+    return [
+        {"id": model_id, **{field: spec[field] for field in PUBLIC_FIELDS}}
+        for model_id, spec in MODEL_REGISTRY.items()
+    ]
@@ -32,6 +32,7 @@ class ChatMessage(BaseModel):
     role: str = Field(..., regex="^(user|assistant|system)$")
     content: str
     timestamp: Optional[datetime] = None
+    tokens: Optional[int] = None  # cached token count of content
 
 class ChatRequest(BaseModel):
     message: str
@@ -46,12 +47,15 @@ class ChatResponse(BaseModel):
     session_id: str
     tokens_used: Optional[int] = None
     model: str = "gpt-4o-mini"
+    cached: bool = False  # served from the response cache
 
 class ChatHistory(BaseModel):
     id: str
     user_id: str
     session_id: str
-    messages: List[ChatMessage]
+    title: str = "New Chat"
+    message_count: int = 0
+    messages: List[ChatMessage] = []  # read per session from /api/chat/sessions/{session_id}
     created_at: datetime
     updated_at: datetime
 
@@ -75,6 +79,16 @@ class ImageSize(str, Enum):
     LANDSCAPE_768 = "768x512"
     LANDSCAPE_1024 = "1024x768"
 
+class ImageFormat(str, Enum):
+    PNG = "png"
+    WEBP = "webp"
+    AVIF = "avif"
+
+class JobPriority(str, Enum):
+    HIGH = "high"
+    NORMAL = "normal"
+    LOW = "low"
+
 class ImageGenerationRequest(BaseModel):
     prompt: str = Field(..., min_length=1, max_length=1000)
     negative_prompt: Optional[str] = Field(default="", max_length=500)
@@ -85,6 +99,25 @@ class ImageGenerationRequest(BaseModel):
     seed: Optional[int] = None
     num_images: Optional[int] = Field(default=1, ge=1, le=4)
     model_version: Optional[str] = "stable-diffusion-xl-base-1.0"
+    output_format: Optional[ImageFormat] = None  # defaults to the user's setting
+    quality: Optional[int] = Field(default=None, ge=1, le=100)  # lossy formats only
+    priority: Optional[JobPriority] = None  # can only lower the account's class
+
+class ImageBatchRequest(BaseModel):
+    """Shared settings plus the values to vary; one generation is rendered
+    for every combination of prompts, styles, seeds and guidance scales"""
+    prompts: List[str] = Field(..., min_items=1, max_items=32)
+    styles: List[ImageStyle] = Field(default=[ImageStyle.REALISTIC], min_items=1, max_items=32)
+    seeds: List[Optional[int]] = Field(default=[None], min_items=1, max_items=32)
+    guidance_scales: List[float] = Field(default=[7.5], min_items=1, max_items=32)
+    negative_prompt: Optional[str] = Field(default="", max_length=500)
+    size: Optional[ImageSize] = ImageSize.SQUARE_1024
+    steps: Optional[int] = Field(default=20, ge=10, le=50)
+    num_images: Optional[int] = Field(default=1, ge=1, le=4)
+    model_version: Optional[str] = "stable-diffusion-xl-base-1.0"
+    output_format: Optional[ImageFormat] = None
+    quality: Optional[int] = Field(default=None, ge=1, le=100)
+    priority: Optional[JobPriority] = None
 
 class ImageGenerationResponse(BaseModel):
     id: str
@@ -93,6 +126,7 @@ class ImageGenerationResponse(BaseModel):
     style: str
     size: str
     image_urls: List[str]
+    thumbnails: List[Dict[str, str]] = []  # per image, URL by size
     parameters: Dict[str, Any]
     created_at: datetime
     processing_time: Optional[float] = None
@@ -105,7 +139,9 @@ class ImageHistory(BaseModel):
     style: str
     size: str
     image_urls: List[str]
+    thumbnails: List[Dict[str, str]] = []
     parameters: Dict[str, Any]
+    batch: List[Dict[str, Any]] = []  # items of a batch generation
     created_at: datetime
     is_favorite: bool = False
 
@@ -135,12 +171,17 @@ class GenerationProgress(BaseModel):
     progress: float = Field(..., ge=0.0, le=100.0)
     message: Optional[str] = None
     estimated_time: Optional[int] = None  # seconds
+    queue_position: Optional[int] = None  # while queued
+    preview: Optional[str] = None  # JPEG data URL of the latest latent preview
+    result: Optional[Dict[str, Any]] = None  # set once completed; batches fill it as items finish
 
 # Settings Models
 class UserSettings(BaseModel):
     theme: Optional[str] = "dark"
     default_image_style: Optional[ImageStyle] = ImageStyle.REALISTIC
     default_image_size: Optional[ImageSize] = ImageSize.SQUARE_1024
+    default_image_format: Optional[ImageFormat] = ImageFormat.PNG
+    default_image_quality: Optional[int] = Field(default=90, ge=1, le=100)
     chat_model: Optional[str] = "gpt-4o-mini"
     auto_save_history: Optional[bool] = True
     notifications_enabled: Optional[bool] = True
\ No newline at end of file
@@ -0,0 +1,612 @@
+from diffusers import (
+    StableDiffusionXLPipeline,
+    DPMSolverMultistepScheduler,
+    EulerAncestralDiscreteScheduler,
+    LCMScheduler
+)
+from PIL import Image
+import torch
+import base64
+import gc
+import io
+import itertools
+import math
+import numpy as np
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, List, Optional, Set, Tuple
+from dotenv import load_dotenv
+
+from image_worker import IMAGE_WORKERS
+from models import ImageGenerationRequest, ImageFormat
+from model_registry import DEFAULT_MODEL, get_model_spec
+from storage import image_storage
+from thumbnails import IMAGE_WEBP_VARIANTS, make_thumbnails, webp_variant_name
+
+load_dotenv()
+
+# Only worker processes import this module, so the API process never loads
+# torch or any model weights.
+
+MB = 1024 * 1024
+
+# Memory the resident pipelines of one worker process may use together
+PIPELINE_MEMORY_BUDGET_MB = int(os.getenv("PIPELINE_MEMORY_BUDGET_MB", "16000"))
+
+# Memory cap for cached text-encoder outputs, per worker process
+PROMPT_EMBED_CACHE_MB = int(os.getenv("PROMPT_EMBED_CACHE_MB", "256"))
+
+# Intra-op threads per worker; 0 splits the machine's cores between workers
+# so they don't oversubscribe each other on CPU nodes
+TORCH_THREADS = int(os.getenv("TORCH_THREADS", "0"))
+torch.set_num_threads(TORCH_THREADS or max(1, (os.cpu_count() or 1) // max(1, IMAGE_WORKERS)))
+
+DTYPES = {
+    "float16": torch.float16,
+    "bfloat16": torch.bfloat16,
+    "float32": torch.float32
+}
+
+SCHEDULERS = {
+    "dpm": DPMSolverMultistepScheduler,
+    "lcm": LCMScheduler,
+    "euler_a": EulerAncestralDiscreteScheduler
+}
+
+STYLE_PROMPTS = {
+    "realistic": "photorealistic, highly detailed, 8k resolution",
+    "artistic": "artistic, painterly, creative composition",
+    "anime": "anime style, manga, cel shading",
+    "cartoon": "cartoon style, vibrant colors, stylized",
+    "abstract": "abstract art, geometric, non-representational",
+    "photographic": "professional photography, studio lighting",
+    "digital_art": "digital art, concept art, detailed illustration",
+    "concept_art": "concept art, matte painting, cinematic"
+}
+
+DEFAULT_NEGATIVE_PROMPT = "blurry, low quality, distorted"
+
+# Threads encoding images in parallel within one worker
+IMAGE_ENCODE_THREADS = int(os.getenv("IMAGE_ENCODE_THREADS", "4"))
+PNG_COMPRESS_LEVEL = int(os.getenv("PNG_COMPRESS_LEVEL", "6"))
+
+# Live previews: every N denoising steps the current latents of each job's
+# first image are projected to RGB and sent as a small JPEG (0 disables)
+LATENT_PREVIEW_EVERY = int(os.getenv("LATENT_PREVIEW_EVERY", "5"))
+LATENT_PREVIEW_SIZE = int(os.getenv("LATENT_PREVIEW_SIZE", "128"))
+LATENT_PREVIEW_QUALITY = 60
+
+# Linear approximation of the SDXL VAE decoder: RGB = latent @ factors + bias
+SDXL_LATENT_RGB_FACTORS = [
+    [0.3651, 0.4232, 0.4341],
+    [-0.2533, -0.0042, 0.1068],
+    [0.1076, 0.1111, -0.0362],
+    [-0.3165, -0.2492, -0.2188]
+]
+SDXL_LATENT_RGB_BIAS = [0.1084, -0.0175, -0.0011]
+
+DEFAULT_QUALITY = {
+    ImageFormat.WEBP: 90,
+    ImageFormat.AVIF: 75
+}
+
+encode_pool = ThreadPoolExecutor(max_workers=IMAGE_ENCODE_THREADS, thread_name_prefix="image-encode")
+
+# Pillow 10.1 needs the plugin to write AVIF
+try:
+    import pillow_avif  # noqa: F401
+    AVIF_SUPPORTED = True
+except ImportError:
+    AVIF_SUPPORTED = False
+
+class PromptEmbeddingCache:
+    """LRU cache of SDXL text-encoder outputs keyed by (model, text).
+
+    Stores the token embeddings and the pooled embedding for a single text.
+    Negative prompts and resubmitted prompts repeat on most requests, so
+    their encoder passes are skipped. Bounded by total tensor bytes.
+    """
+
+    def __init__(self, max_bytes: int = PROMPT_EMBED_CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[Tuple[str, str], Tuple[torch.Tensor, torch.Tensor]]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _size(entry: Tuple[torch.Tensor, torch.Tensor]) -> int:
+        return sum(t.element_size() * t.nelement() for t in entry)
+
+    def _store(self, key: Tuple[str, str], entry: Tuple[torch.Tensor, torch.Tensor]):
+        size = self._size(entry)
+        if size > self.max_bytes:
+            return
+
+        self.entries[key] = entry
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.bytes -= self._size(evicted)
+            self.evictions += 1
+
+    def encode(self, pipe, model_version: str, texts: List[str]) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Return (embeds, pooled_embeds) for texts, one row per text"""
+        found: Dict[str, Tuple[torch.Tensor, torch.Tensor]] = {}
+        missing = []
+        for text in dict.fromkeys(texts):
+            key = (model_version, text)
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                found[text] = self.entries[key]
+                self.hits += 1
+            else:
+                missing.append(text)
+                self.misses += 1
+
+        if missing:
+            # Encode all misses in one pass; without guidance only the
+            # positive outputs are computed
+            embeds, _, pooled, _ = pipe.encode_prompt(
+                prompt=missing,
+                device=pipe.device,
+                num_images_per_prompt=1,
+                do_classifier_free_guidance=False
+            )
+            for i, text in enumerate(missing):
+                entry = (embeds[i:i + 1], pooled[i:i + 1])
+                found[text] = entry
+                self._store((model_version, text), entry)
+
+        return (
+            torch.cat([found[text][0] for text in texts]),
+            torch.cat([found[text][1] for text in texts])
+        )
+
+    def evict_model(self, model_version: str):
+        """Drop every entry computed by model_version"""
+        for key in [key for key in self.entries if key[0] == model_version]:
+            self.bytes -= self._size(self.entries.pop(key))
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+embedding_cache = PromptEmbeddingCache()
+
+def pipeline_device(spec: Dict[str, Any]) -> str:
+    """Device a registry entry runs on"""
+    return spec.get("device") or ("cuda" if torch.cuda.is_available() else "cpu")
+
+def load_exported_pipeline(spec: Dict[str, Any]):
+    """Load an OpenVINO or ONNX Runtime export of an SDXL model.
+
+    optimum is only needed by deployments that register such a model; the
+    weights are exported on first load unless the repo is already exported.
+    """
+    if spec["runtime"] == "openvino":
+        from optimum.intel import OVStableDiffusionXLPipeline as ExportedPipeline
+    elif spec["runtime"] == "onnx":
+        from optimum.onnxruntime import ORTStableDiffusionXLPipeline as ExportedPipeline
+    else:
+        raise ValueError(f"Unknown runtime: {spec['runtime']}")
+
+    pipe = ExportedPipeline.from_pretrained(spec["repo_id"], export=spec.get("export", True))
+    pipe.scheduler = SCHEDULERS[spec.get("scheduler", "dpm")].from_config(pipe.scheduler.config)
+    return pipe
+
+def load_pipeline(spec: Dict[str, Any]):
+    """Load and optimise the pipeline described by a registry entry"""
+    runtime = spec.get("runtime", "torch")
+    if runtime not in ("torch", "tiny"):
+        return load_exported_pipeline(spec)
+
+    device = pipeline_device(spec)
+    # fp16 kernels are slow or missing on CPU, so CPU defaults to fp32
+    dtype = DTYPES[spec.get("dtype") or ("float16" if device == "cuda" else "float32")]
+    if runtime == "tiny":
+        from benchmarks.tiny_model import build_pipeline
+        pipe = build_pipeline().to(torch_dtype=dtype)
+    else:
+        pipe = StableDiffusionXLPipeline.from_pretrained(
+            spec["repo_id"],
+            torch_dtype=dtype,
+            use_safetensors=True,
+            variant=spec.get("variant")
+        )
+
+    # Optimize for memory and speed
+    pipe.scheduler = SCHEDULERS[spec.get("scheduler", "dpm")].from_config(pipe.scheduler.config)
+    if spec.get("lcm_lora"):
+        pipe.load_lora_weights(spec["lcm_lora"])
+        pipe.fuse_lora()
+    pipe = pipe.to(device)
+
+    if device == "cuda":
+        # Enable memory efficient attention
+        pipe.enable_xformers_memory_efficient_attention()
+        pipe.enable_vae_slicing()
+        pipe.enable_vae_tiling()
+    elif spec.get("channels_last"):
+        pipe.unet.to(memory_format=torch.channels_last)
+        pipe.vae.to(memory_format=torch.channels_last)
+
+    if spec.get("compile"):
+        pipe.unet = torch.compile(pipe.unet)
+
+    return pipe
+
+def pipeline_size(pipe) -> int:
+    """Bytes held by the parameters and buffers of a pipeline's models"""
+    size = 0
+    for component in pipe.components.values():
+        if isinstance(component, torch.nn.Module):
+            tensors = itertools.chain(component.parameters(), component.buffers())
+            size += sum(t.element_size() * t.nelement() for t in tensors)
+    return size
+
+class PipelineCache:
+    """Pipelines resident in this worker, bounded by a memory budget.
+
+    Only models in the registry can be loaded. When loading a model would
+    exceed the budget, the least recently used pipelines are evicted first;
+    a single model larger than the budget is still allowed on its own.
+    Concurrent requests for the same model share one load.
+    """
+
+    def __init__(self, budget_bytes: int = PIPELINE_MEMORY_BUDGET_MB * MB):
+        self.budget_bytes = budget_bytes
+        self.entries: "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()
+        self.loads = 0
+        self.evictions = 0
+        self._lock = threading.RLock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+
+    def used_bytes(self) -> int:
+        return sum(size for _, size in self.entries.values())
+
+    def _lookup(self, model_id: str):
+        with self._lock:
+            entry = self.entries.get(model_id)
+            if entry is None:
+                return None
+            self.entries.move_to_end(model_id)
+            return entry[0]
+
+    def _make_room(self, needed: int, keep: Optional[str] = None):
+        """Evict least recently used pipelines until needed bytes fit"""
+        evicted = False
+        with self._lock:
+            for model_id in list(self.entries):
+                if self.used_bytes() + needed <= self.budget_bytes:
+                    break
+                if model_id == keep:
+                    continue
+                self.entries.pop(model_id)
+                embedding_cache.evict_model(model_id)
+                self.evictions += 1
+                evicted = True
+                print(f"Evicted {model_id} pipeline")
+
+        if evicted:
+            gc.collect()
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+    def get(self, model_id: str):
+        """Return the pipeline for model_id, loading it if needed"""
+        pipe = self._lookup(model_id)
+        if pipe is not None:
+            return pipe
+
+        spec = get_model_spec(model_id)
+        if spec is None:
+            raise ValueError(f"Unknown model: {model_id}")
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(model_id, threading.Lock())
+
+        with load_lock:
+            # Another caller may have finished loading while we waited
+            pipe = self._lookup(model_id)
+            if pipe is not None:
+                return pipe
+
+            self._make_room(spec.get("memory_mb", 0) * MB)
+            pipe = load_pipeline(spec)
+            # Exported runtimes hold their weights outside torch
+            size = pipeline_size(pipe) or spec.get("memory_mb", 0) * MB
+
+            with self._lock:
+                self.entries[model_id] = (pipe, size)
+                self.loads += 1
+            self._make_room(0, keep=model_id)
+
+            print(f"Loaded {model_id} pipeline ({size / MB:.0f} MB)")
+            return pipe
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "resident": [
+                    {"model": model_id, "memory_mb": round(size / MB, 1)}
+                    for model_id, (_, size) in self.entries.items()
+                ],
+                "used_mb": round(self.used_bytes() / MB, 1),
+                "budget_mb": round(self.budget_bytes / MB, 1),
+                "loads": self.loads,
+                "evictions": self.evictions
+            }
+
+pipeline_cache = PipelineCache()
+
+def get_pipeline(model_version: str = DEFAULT_MODEL):
+    """Get or create Stable Diffusion pipeline"""
+    try:
+        return pipeline_cache.get(model_version)
+    except Exception as e:
+        print(f"Error loading pipeline: {e}")
+        return None
+
+def cache_stats() -> Dict[str, Any]:
+    """Stats this worker reports back to the API process"""
+    return {
+        "pipelines": pipeline_cache.stats(),
+        "prompt_embeddings": embedding_cache.stats()
+    }
+
+def resolve_format(output_format: Optional[ImageFormat]) -> ImageFormat:
+    """Pick the encoder for a request, falling back when AVIF is unavailable"""
+    if output_format is None:
+        return ImageFormat.PNG
+    if output_format == ImageFormat.AVIF and not AVIF_SUPPORTED:
+        print("AVIF encoder not installed, saving as WebP")
+        return ImageFormat.WEBP
+    return output_format
+
+def save_image(
+    image: Image.Image,
+    filename: str,
+    output_format: ImageFormat = ImageFormat.PNG,
+    quality: Optional[int] = None
+) -> str:
+    """Encode a generated image, store it and return its URL"""
+    buffer = io.BytesIO()
+    if output_format == ImageFormat.PNG:
+        image.save(buffer, "PNG", compress_level=PNG_COMPRESS_LEVEL)
+    else:
+        quality = quality or DEFAULT_QUALITY[output_format]
+        image.save(buffer, output_format.value.upper(), quality=quality)
+    url = image_storage.save(filename, buffer.getvalue())
+
+    if output_format == ImageFormat.PNG and IMAGE_WEBP_VARIANTS:
+        variant = io.BytesIO()
+        image.save(variant, "WEBP", quality=DEFAULT_QUALITY[ImageFormat.WEBP])
+        image_storage.save(webp_variant_name(filename), variant.getvalue())
+
+    return url
+
+def save_with_thumbnails(
+    image: Image.Image,
+    filename: str,
+    output_format: ImageFormat = ImageFormat.PNG,
+    quality: Optional[int] = None
+) -> Tuple[str, Dict[str, str]]:
+    """Save an image and its derivative renditions, returning their URLs"""
+    return save_image(image, filename, output_format, quality), make_thumbnails(image, filename)
+
+def build_prompt(request: ImageGenerationRequest) -> str:
+    """Append the style suffix to the user's prompt"""
+    return f"{request.prompt}, {STYLE_PROMPTS.get(request.style.value, '')}"
+
+def latent_preview(latent: torch.Tensor) -> str:
+    """Cheap RGB preview of one image's latents, as a JPEG data URL"""
+    factors = torch.tensor(SDXL_LATENT_RGB_FACTORS, dtype=torch.float32, device=latent.device)
+    bias = torch.tensor(SDXL_LATENT_RGB_BIAS, dtype=torch.float32, device=latent.device)
+    rgb = torch.einsum("chw,cr->hwr", latent.float(), factors) + bias
+    pixels = ((rgb + 1) / 2).clamp(0, 1).mul(255).byte().cpu().numpy()
+
+    image = Image.fromarray(pixels)
+    image.thumbnail((LATENT_PREVIEW_SIZE, LATENT_PREVIEW_SIZE), Image.BILINEAR)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=LATENT_PREVIEW_QUALITY)
+    return "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+def make_generator(seed: Optional[int] = None) -> torch.Generator:
+    """Create a CPU generator, randomly seeded when no seed is given"""
+    generator = torch.Generator()
+    if seed is None:
+        generator.seed()
+    else:
+        generator.manual_seed(seed)
+    return generator
+
+class GenerationCancelled(Exception):
+    """Raised from the step callback once every job in a batch is cancelled"""
+
+def generate_batch(
+    jobs: List[Tuple[str, ImageGenerationRequest]],
+    report: Optional[Callable[..., None]] = None,
+    cancelled: Optional[Callable[[], Set[str]]] = None,
+    preview: Optional[Callable[[str, str, int], None]] = None
+) -> Dict[str, Dict[str, Any]]:
+    """Render compatible requests in one forward pass and save their images.
+
+    Every request must share model_version, size, steps and guidance_scale;
+    models with fixed sampler settings in the registry use those instead.
+    report(progress, message, estimated_time) is called after loading and
+    after every denoising step; cancelled() returns the generation ids that
+    should stop. The batch is interrupted at the next step once all of its
+    jobs are cancelled, and cancelled jobs are left out of the results.
+    preview(generation_id, image, step) receives latent previews. Each
+    result carries the seconds spent per stage under "timings".
+    """
+    report = report or (lambda progress, message, estimated_time=None: None)
+    cancelled = cancelled or (lambda: set())
+    generation_ids = [generation_id for generation_id, _ in jobs]
+    first = jobs[0][1]
+
+    report(5.0, "Loading model...")
+    load_start = time.time()
+    pipe = get_pipeline(first.model_version)
+    if not pipe:
+        raise RuntimeError("Failed to load model")
+    timings = {"load": time.time() - load_start}
+
+    # Few-step models pin their sampler settings in the registry
+    spec = get_model_spec(first.model_version) or {}
+    steps = spec.get("steps", first.steps)
+    guidance_scale = spec.get("guidance_scale", first.guidance_scale)
+    width, height = (int(value) for value in first.size.value.split('x'))
+
+    # One prompt per output image so each request keeps its own seed
+    prompts, negative_prompts, generators = [], [], []
+    for _, request in jobs:
+        for i in range(request.num_images):
+            prompts.append(build_prompt(request))
+            negative_prompts.append(request.negative_prompt or DEFAULT_NEGATIVE_PROMPT)
+            generators.append(make_generator(request.seed + i if request.seed is not None else None))
+
+    report(10.0, "Generating image...")
+    start_time = time.time()
+    step_start = start_time
+    step_times: List[float] = []
+
+    def step_done(step_index: int, total: int):
+        nonlocal step_start
+        now = time.time()
+        step_times.append(now - step_start)
+        step_start = now
+
+        stopped = cancelled()
+        if all(generation_id in stopped for generation_id in generation_ids):
+            raise GenerationCancelled()
+
+        done = step_index + 1
+        average = sum(step_times) / len(step_times)
+        report(
+            10.0 + 80.0 * done / total,
+            f"Denoising step {done}/{total}",
+            math.ceil(average * (total - done))
+        )
+
+    def send_previews(latents: torch.Tensor, step: int):
+        stopped = cancelled()
+        offset = 0
+        for generation_id, request in jobs:
+            if generation_id not in stopped:
+                preview(generation_id, latent_preview(latents[offset]), step)
+            offset += request.num_images
+
+    def on_step_end(pipe, step_index, timestep, callback_kwargs):
+        total = pipe.num_timesteps or steps
+        step_done(step_index, total)
+        done = step_index + 1
+        if preview and LATENT_PREVIEW_EVERY > 0 and done % LATENT_PREVIEW_EVERY == 0 and done < total:
+            send_previews(callback_kwargs["latents"], done)
+        return callback_kwargs
+
+    # Exported pipelines encode the prompts inside the denoising call
+    denoise_start = start_time
+    if isinstance(pipe, StableDiffusionXLPipeline):
+        with torch.inference_mode():
+            prompt_embeds, pooled_prompt_embeds = embedding_cache.encode(pipe, first.model_version, prompts)
+            negative_prompt_embeds, negative_pooled_prompt_embeds = embedding_cache.encode(
+                pipe, first.model_version, negative_prompts
+            )
+            denoise_start = step_start = time.time()
+
+            images = pipe(
+                prompt_embeds=prompt_embeds,
+                pooled_prompt_embeds=pooled_prompt_embeds,
+                negative_prompt_embeds=negative_prompt_embeds,
+                negative_pooled_prompt_embeds=negative_pooled_prompt_embeds,
+                num_inference_steps=steps,
+                guidance_scale=guidance_scale,
+                width=width,
+                height=height,
+                num_images_per_prompt=1,
+                generator=generators,
+                callback_on_step_end=on_step_end
+            ).images
+    else:
+        # Exported pipelines take plain prompts, numpy latents and the older
+        # per-step callback. Their generator is a single RandomState for the
+        # whole batch, so each image's starting noise is drawn from its own
+        # seed here, keeping results independent of batch composition
+        channels = getattr(pipe.unet, "config", {}).get("in_channels", 4)
+        scale = getattr(pipe, "vae_scale_factor", 8)
+        latents = np.stack([
+            np.random.RandomState(generator.initial_seed() % 2**32).randn(
+                channels, height // scale, width // scale
+            ).astype(np.float32)
+            for generator in generators
+        ])
+        seed = generators[0].initial_seed() % 2**32
+        images = pipe(
+            prompt=prompts,
+            negative_prompt=negative_prompts,
+            num_inference_steps=steps,
+            guidance_scale=guidance_scale,
+            width=width,
+            height=height,
+            num_images_per_prompt=1,
+            latents=latents,
+            generator=np.random.RandomState(seed),
+            callback=lambda step, timestep, latents: step_done(step, steps),
+            callback_steps=1
+        ).images
+
+    finished = time.time()
+    processing_time = finished - start_time
+    # The last step callback marks the end of denoising; the rest of the
+    # call is the VAE decode and postprocessing
+    timings["text_encode"] = denoise_start - start_time
+    timings["denoise"] = step_start - denoise_start
+    timings["decode"] = finished - step_start
+
+    report(90.0, "Saving images...", 0)
+    stopped = cancelled()
+
+    # Encode every image of the batch in parallel; the encoders release the GIL
+    saves: Dict[str, list] = {}
+    offset = 0
+    for generation_id, request in jobs:
+        if generation_id not in stopped:
+            output_format = resolve_format(request.output_format)
+            saves[generation_id] = [
+                encode_pool.submit(
+                    save_with_thumbnails,
+                    images[offset + i],
+                    f"{generation_id}_{i}.{output_format.value}",
+                    output_format,
+                    request.quality
+                )
+                for i in range(request.num_images)
+            ]
+        offset += request.num_images
+
+    results = {}
+    for generation_id, futures in saves.items():
+        saved = [future.result() for future in futures]
+        results[generation_id] = {
+            "image_urls": [url for url, _ in saved],
+            "thumbnails": [thumbnails for _, thumbnails in saved],
+            "processing_time": processing_time,
+            "timings": {**timings, "encode": time.time() - finished},
+            "batch_size": len(jobs)
+        }
+
+    return results
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+from dotenv import load_dotenv
+
+from models import ImageGenerationRequest
+
+load_dotenv()
+
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+
+class ResultCache:
+    """LRU cache of finished generations keyed by their deterministic inputs.
+
+    Only seeded requests are cacheable: with a fixed seed the images are fully
+    determined by the parameters hashed in key_for, so a repeat submission can
+    reuse the stored image URLs instead of rendering again.
+    """
+
+    def __init__(self, max_entries: int = RESULT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key_for(request: ImageGenerationRequest) -> Optional[str]:
+        """Hash the parameters that determine the output, or None if unseeded"""
+        if request.seed is None:
+            return None
+
+        params = {
+            "prompt": request.prompt,
+            "negative_prompt": request.negative_prompt or "",
+            "style": request.style.value,
+            "size": request.size.value,
+            "steps": request.steps,
+            "guidance_scale": request.guidance_scale,
+            "seed": request.seed,
+            "model_version": request.model_version,
+            "num_images": request.num_images,
+            "output_format": request.output_format.value if request.output_format else None,
+            "quality": request.quality
+        }
+        return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+    def get(self, request: ImageGenerationRequest) -> Optional[Dict[str, Any]]:
+        """Return a copy of the cached result for request, if any"""
+        key = self.key_for(request)
+        if key is None:
+            return None
+
+        result = self.entries.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return dict(result)
+
+    def put(self, request: ImageGenerationRequest, result: Dict[str, Any]):
+        """Remember the result of a seeded request"""
+        key = self.key_for(request)
+        if key is None or self.max_entries <= 0:
+            return
+
+        self.entries[key] = dict(result)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def discard(self, request: ImageGenerationRequest):
+        """Forget the result of a request, e.g. once its files are gone"""
+        key = self.key_for(request)
+        if key is not None:
+            self.entries.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for monitoring"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+# Shared cache instance for this API process
+result_cache = ResultCache()
@@ -14,6 +14,7 @@ from auth import (
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
 from database import get_database
+from chat_store import delete_sessions
 
 router = APIRouter()
 
@@ -57,6 +58,8 @@ async def signup(user_data: UserCreate):
             "theme": "dark",
             "default_image_style": "realistic",
             "default_image_size": "1024x1024",
+            "default_image_format": "png",
+            "default_image_quality": 90,
             "chat_model": "gpt-4o-mini",
             "auto_save_history": True,
             "notifications_enabled": True
@@ -140,7 +143,10 @@ async def delete_account(current_user: dict = Depends(get_current_user)):
     
     # Delete user data
     await db.users.delete_one({"_id": user_id})
-    await db.chat_history.delete_many({"user_id": user_id})
+    await delete_sessions(user_id)
     await db.image_history.delete_many({"user_id": user_id})
     
+    # The image files are reclaimed by the image garbage collector once no
+    # other record (e.g. another user's result-cache hit) references them
+    
     return {"message": "Account deleted successfully"}
\ No newline at end of file
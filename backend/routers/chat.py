@@ -1,112 +1,94 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Query
 from fastapi.responses import StreamingResponse
 from datetime import datetime
-from bson import ObjectId
-import openai
 import json
-import os
 import uuid
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Optional
 
 from models import ChatRequest, ChatResponse, ChatMessage, ChatHistory
 from auth import get_current_user
 from database import get_database
+from llm import llm_provider
+from chat_context import build_context, count_tokens, conversation_summarizer
+from chat_store import (
+    get_session, load_context, append_messages, page_messages, delete_sessions, format_session
+)
+from chat_cache import session_cache
+from chat_response_cache import response_cache
 
 router = APIRouter()
 
-# Configure OpenAI
-openai.api_key = os.getenv("OPENAI_API_KEY")
-
 @router.post("/", response_model=ChatResponse)
 async def chat(
     request: ChatRequest,
     current_user: dict = Depends(get_current_user)
 ):
     """Send a message to the AI chatbot"""
-    if not openai.api_key:
+    if not llm_provider.configured:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="OpenAI API key not configured"
+            detail="Chat model not configured"
         )
     
-    db = get_database()
     user_id = str(current_user["_id"])
     session_id = request.session_id or str(uuid.uuid4())
     
     # Get chat history for context
-    chat_history = await db.chat_history.find_one({
-        "user_id": user_id,
-        "session_id": session_id
-    })
+    chat_history, history = await load_context(user_id, session_id)
     
-    messages = []
-    if chat_history:
-        messages = [{"role": msg["role"], "content": msg["content"]} 
-                   for msg in chat_history["messages"]]
+    # System prompt, summary and as many recent turns as fit the budget
+    messages, first_kept = build_context(chat_history, history, request.system_prompt, request.message)
     
-    # Add system prompt if provided
-    if request.system_prompt and not any(msg["role"] == "system" for msg in messages):
-        messages.insert(0, {"role": "system", "content": request.system_prompt})
-    
-    # Add user message
-    messages.append({"role": "user", "content": request.message})
+    # Deterministic requests may be answered from the response cache
+    lookup = await response_cache.lookup(
+        user_id,
+        llm_provider.model,
+        messages,
+        request.temperature,
+        request.max_tokens,
+        one_shot=not chat_history
+    )
     
     try:
-        # Call OpenAI API
-        response = await openai.ChatCompletion.acreate(
-            model="gpt-4o-mini",
-            messages=messages,
-            max_tokens=request.max_tokens,
-            temperature=request.temperature,
-            stream=False
-        )
+        if lookup["response"] is not None:
+            completion = {**lookup["response"], "tokens_used": 0}
+        else:
+            completion = await llm_provider.complete(messages, request.max_tokens, request.temperature)
+            await response_cache.store(lookup, completion)
         
-        assistant_message = response.choices[0].message.content
-        tokens_used = response.usage.total_tokens
+        assistant_message = completion["content"]
+        tokens_used = completion["tokens_used"]
         
         # Save to database
         user_msg = ChatMessage(
             role="user",
             content=request.message,
-            timestamp=datetime.utcnow()
+            timestamp=datetime.utcnow(),
+            tokens=count_tokens(request.message)
         )
         
         assistant_msg = ChatMessage(
             role="assistant",
             content=assistant_message,
-            timestamp=datetime.utcnow()
+            timestamp=datetime.utcnow(),
+            tokens=count_tokens(assistant_message)
         )
         
-        if chat_history:
-            # Update existing chat
-            await db.chat_history.update_one(
-                {"user_id": user_id, "session_id": session_id},
-                {
-                    "$push": {
-                        "messages": {
-                            "$each": [user_msg.dict(), assistant_msg.dict()]
-                        }
-                    },
-                    "$set": {"updated_at": datetime.utcnow()}
-                }
-            )
-        else:
-            # Create new chat
-            new_chat = {
-                "_id": str(ObjectId()),
-                "user_id": user_id,
-                "session_id": session_id,
-                "messages": [user_msg.dict(), assistant_msg.dict()],
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            }
-            await db.chat_history.insert_one(new_chat)
+        await append_messages(
+            user_id,
+            session_id,
+            [user_msg.dict(), assistant_msg.dict()],
+            context=(chat_history, history)
+        )
+        
+        conversation_summarizer.schedule(chat_history, first_kept)
         
         return ChatResponse(
             message=assistant_message,
             session_id=session_id,
             tokens_used=tokens_used,
-            model="gpt-4o-mini"
+            model=completion["model"],
+            cached=lookup["response"] is not None
         )
         
     except Exception as e:
@@ -121,89 +103,74 @@ async def chat_stream(
     current_user: dict = Depends(get_current_user)
 ):
     """Stream chat response from AI"""
-    if not openai.api_key:
+    if not llm_provider.configured:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="OpenAI API key not configured"
+            detail="Chat model not configured"
         )
     
     async def generate_stream() -> AsyncGenerator[str, None]:
-        db = get_database()
         user_id = str(current_user["_id"])
         session_id = request.session_id or str(uuid.uuid4())
         
         # Get chat history
-        chat_history = await db.chat_history.find_one({
-            "user_id": user_id,
-            "session_id": session_id
-        })
-        
-        messages = []
-        if chat_history:
-            messages = [{"role": msg["role"], "content": msg["content"]} 
-                       for msg in chat_history["messages"]]
+        chat_history, history = await load_context(user_id, session_id)
         
-        # Add system prompt if provided
-        if request.system_prompt and not any(msg["role"] == "system" for msg in messages):
-            messages.insert(0, {"role": "system", "content": request.system_prompt})
+        # System prompt, summary and as many recent turns as fit the budget
+        messages, first_kept = build_context(chat_history, history, request.system_prompt, request.message)
         
-        # Add user message
-        messages.append({"role": "user", "content": request.message})
+        lookup = await response_cache.lookup(
+            user_id,
+            llm_provider.model,
+            messages,
+            request.temperature,
+            request.max_tokens,
+            one_shot=not chat_history
+        )
         
         try:
-            # Stream response from OpenAI
-            response = await openai.ChatCompletion.acreate(
-                model="gpt-4o-mini",
-                messages=messages,
-                max_tokens=request.max_tokens,
-                temperature=request.temperature,
-                stream=True
-            )
-            
-            full_response = ""
-            async for chunk in response:
-                if chunk.choices[0].delta.get("content"):
-                    content = chunk.choices[0].delta.content
+            if lookup["response"] is not None:
+                # A cached reply goes out as a single chunk
+                full_response = lookup["response"]["content"]
+                yield f"data: {json.dumps({'content': full_response, 'session_id': session_id, 'cached': True})}\n\n"
+            else:
+                # Stream response from the model
+                full_response = ""
+                async for content in llm_provider.stream(messages, request.max_tokens, request.temperature):
                     full_response += content
                     
                     # Send chunk to client
                     yield f"data: {json.dumps({'content': content, 'session_id': session_id})}\n\n"
+                
+                await response_cache.store(lookup, {
+                    "content": full_response,
+                    "tokens_used": 0,
+                    "model": llm_provider.model
+                })
             
             # Save complete conversation to database
             user_msg = ChatMessage(
                 role="user",
                 content=request.message,
-                timestamp=datetime.utcnow()
+                timestamp=datetime.utcnow(),
+                tokens=count_tokens(request.message)
             )
             
             assistant_msg = ChatMessage(
                 role="assistant",
                 content=full_response,
-                timestamp=datetime.utcnow()
+                timestamp=datetime.utcnow(),
+                tokens=count_tokens(full_response)
             )
             
-            if chat_history:
-                await db.chat_history.update_one(
-                    {"user_id": user_id, "session_id": session_id},
-                    {
-                        "$push": {
-                            "messages": {
-                                "$each": [user_msg.dict(), assistant_msg.dict()]
-                            }
-                        },
-                        "$set": {"updated_at": datetime.utcnow()}
-                    }
-                )
-            else:
-                new_chat = {
-                    "_id": str(ObjectId()),
-                    "user_id": user_id,
-                    "session_id": session_id,
-                    "messages": [user_msg.dict(), assistant_msg.dict()],
-                    "created_at": datetime.utcnow(),
-                    "updated_at": datetime.utcnow()
-                }
-                await db.chat_history.insert_one(new_chat)
+            await append_messages(
+                user_id,
+                session_id,
+                [user_msg.dict(), assistant_msg.dict()],
+                context=(chat_history, history)
+            )
+            
+            conversation_summarizer.schedule(chat_history, first_kept)
             
             # Send completion signal
             yield f"data: {json.dumps({'done': True, 'session_id': session_id})}\n\n"
@@ -230,39 +197,46 @@ async def get_chat_sessions(current_user: dict = Depends(get_current_user)):
     
     sessions = await db.chat_history.find(
         {"user_id": user_id},
-        {"session_id": 1, "created_at": 1, "updated_at": 1, "messages": {"$slice": 1}}
+        {"session_id": 1, "title": 1, "message_count": 1, "created_at": 1, "updated_at": 1}
     ).sort("updated_at", -1).to_list(length=50)
     
-    # Format sessions with first message as title
     formatted_sessions = []
     for session in sessions:
-        title = "New Chat"
-        if session.get("messages") and len(session["messages"]) > 0:
-            first_message = session["messages"][0]["content"]
-            title = first_message[:50] + "..." if len(first_message) > 50 else first_message
-        
         formatted_sessions.append({
             "session_id": session["session_id"],
-            "title": title,
+            "title": session.get("title") or "New Chat",
+            "message_count": session.get("message_count", 0),
             "created_at": session["created_at"],
             "updated_at": session["updated_at"]
         })
     
     return {"sessions": formatted_sessions}
 
+@router.get("/cache")
+async def get_session_cache_stats(current_user: dict = Depends(get_current_user)):
+    """Get hot-session cache statistics"""
+    return session_cache.stats()
+
+@router.get("/response-cache")
+async def get_response_cache_stats(current_user: dict = Depends(get_current_user)):
+    """Get chat response cache statistics"""
+    return response_cache.stats()
+
 @router.get("/sessions/{session_id}")
 async def get_chat_session(
     session_id: str,
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[int] = Query(None, ge=0),
     current_user: dict = Depends(get_current_user)
 ):
-    """Get specific chat session"""
-    db = get_database()
+    """Get a chat session with its newest messages.
+    
+    Pass the returned next_before as before to page back through older
+    messages.
+    """
     user_id = str(current_user["_id"])
     
-    session = await db.chat_history.find_one({
-        "user_id": user_id,
-        "session_id": session_id
-    })
+    session = await get_session(user_id, session_id)
     
     if not session:
         raise HTTPException(
@@ -270,11 +244,13 @@ async def get_chat_session(
             detail="Chat session not found"
         )
     
+    messages, has_more = await page_messages(session, limit, before)
+    
     return {
-        "session_id": session["session_id"],
-        "messages": session["messages"],
-        "created_at": session["created_at"],
-        "updated_at": session["updated_at"]
+        **format_session(session),
+        "messages": messages,
+        "has_more": has_more,
+        "next_before": messages[0]["seq"] if has_more else None
     }
 
 @router.delete("/sessions/{session_id}")
@@ -283,18 +259,14 @@ async def delete_chat_session(
     current_user: dict = Depends(get_current_user)
 ):
     """Delete a chat session"""
-    db = get_database()
     user_id = str(current_user["_id"])
     
-    result = await db.chat_history.delete_one({
-        "user_id": user_id,
-        "session_id": session_id
-    })
+    deleted_count = await delete_sessions(user_id, session_id)
     
-    if result.deleted_count == 0:
+    if deleted_count == 0:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Chat session not found"
         )
     
-    return {"message": "Chat session deleted successfully"}
\ No newline at end of file
+    return {"message": "Chat session deleted successfully"}
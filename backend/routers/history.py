@@ -5,10 +5,33 @@ from bson import ObjectId
 
 from models import HistoryFilter, HistoryResponse, ChatHistory, ImageHistory
 from auth import get_current_user
-from database import get_database
+from database import get_database, PROMPT_COLLATION
+from chat_store import SESSION_FIELDS, format_session, delete_sessions
 
 router = APIRouter()
 
+# Prompt autocomplete looks at this many matching generations at most, so
+# short prefixes stay cheap for users with long histories
+PROMPT_SUGGEST_SCAN_LIMIT = 2000
+
+def format_image(doc: dict) -> dict:
+    """Image history entry as returned by the image endpoints"""
+    return {
+        "id": str(doc["_id"]),
+        "user_id": doc["user_id"],
+        "prompt": doc["prompt"],
+        "negative_prompt": doc.get("negative_prompt"),
+        "style": doc["style"],
+        "size": doc["size"],
+        "image_urls": doc["image_urls"],
+        "thumbnails": doc.get("thumbnails", []),
+        "parameters": doc["parameters"],
+        "batch": doc.get("batch", []),
+        "created_at": doc["created_at"],
+        "processing_time": doc.get("processing_time"),
+        "is_favorite": doc.get("is_favorite", False)
+    }
+
 @router.get("/", response_model=HistoryResponse)
 async def get_history(
     type: Optional[str] = Query(None, regex="^(chat|image)$"),
@@ -39,18 +62,10 @@ async def get_history(
     
     # Get chat history
     if not type or type == "chat":
-        chat_cursor = db.chat_history.find(query).sort("created_at", -1).skip(offset).limit(limit)
+        chat_cursor = db.chat_history.find(query, SESSION_FIELDS).sort("created_at", -1).skip(offset).limit(limit)
         chat_docs = await chat_cursor.to_list(length=limit)
         
-        for doc in chat_docs:
-            chat_history.append({
-                "id": str(doc["_id"]),
-                "user_id": doc["user_id"],
-                "session_id": doc["session_id"],
-                "messages": doc["messages"],
-                "created_at": doc["created_at"],
-                "updated_at": doc["updated_at"]
-            })
+        chat_history = [format_session(doc) for doc in chat_docs]
         
         chat_count = await db.chat_history.count_documents(query)
         total_count += chat_count
@@ -60,19 +75,7 @@ async def get_history(
         image_cursor = db.image_history.find(query).sort("created_at", -1).skip(offset).limit(limit)
         image_docs = await image_cursor.to_list(length=limit)
         
-        for doc in image_docs:
-            image_history.append({
-                "id": str(doc["_id"]),
-                "user_id": doc["user_id"],
-                "prompt": doc["prompt"],
-                "negative_prompt": doc.get("negative_prompt"),
-                "style": doc["style"],
-                "size": doc["size"],
-                "image_urls": doc["image_urls"],
-                "parameters": doc["parameters"],
-                "created_at": doc["created_at"],
-                "is_favorite": doc.get("is_favorite", False)
-            })
+        image_history = [format_image(doc) for doc in image_docs]
         
         image_count = await db.image_history.count_documents(query)
         total_count += image_count
@@ -94,7 +97,8 @@ async def get_chat_history(
     session_id: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
-    """Get chat history with optional session filter"""
+    """Get chat sessions, optionally just one; messages are paged through
+    /api/chat/sessions/{session_id}"""
     db = get_database()
     user_id = str(current_user["_id"])
     
@@ -102,19 +106,10 @@ async def get_chat_history(
     if session_id:
         query["session_id"] = session_id
     
-    cursor = db.chat_history.find(query).sort("created_at", -1).skip(offset).limit(limit)
+    cursor = db.chat_history.find(query, SESSION_FIELDS).sort("created_at", -1).skip(offset).limit(limit)
     docs = await cursor.to_list(length=limit)
     
-    chat_history = []
-    for doc in docs:
-        chat_history.append({
-            "id": str(doc["_id"]),
-            "user_id": doc["user_id"],
-            "session_id": doc["session_id"],
-            "messages": doc["messages"],
-            "created_at": doc["created_at"],
-            "updated_at": doc["updated_at"]
-        })
+    chat_history = [format_session(doc) for doc in docs]
     
     total_count = await db.chat_history.count_documents(query)
     has_more = (offset + limit) < total_count
@@ -143,21 +138,7 @@ async def get_image_history(
     cursor = db.image_history.find(query).sort("created_at", -1).skip(offset).limit(limit)
     docs = await cursor.to_list(length=limit)
     
-    image_history = []
-    for doc in docs:
-        image_history.append({
-            "id": str(doc["_id"]),
-            "user_id": doc["user_id"],
-            "prompt": doc["prompt"],
-            "negative_prompt": doc.get("negative_prompt"),
-            "style": doc["style"],
-            "size": doc["size"],
-            "image_urls": doc["image_urls"],
-            "parameters": doc["parameters"],
-            "created_at": doc["created_at"],
-            "processing_time": doc.get("processing_time"),
-            "is_favorite": doc.get("is_favorite", False)
-        })
+    image_history = [format_image(doc) for doc in docs]
     
     total_count = await db.image_history.count_documents(query)
     has_more = (offset + limit) < total_count
@@ -168,6 +149,74 @@ async def get_image_history(
         "has_more": has_more
     }
 
+@router.get("/images/search", response_model=dict)
+async def search_image_history(
+    q: str = Query(..., min_length=1, max_length=500),
+    limit: int = Query(20, le=100),
+    offset: int = Query(0, ge=0),
+    favorites_only: bool = Query(False),
+    current_user: dict = Depends(get_current_user)
+):
+    """Search image prompts and negative prompts, best matches first.
+
+    Uses the user-scoped text index, so words are stemmed, "quoted phrases"
+    must match exactly and -word excludes results. Matches in the prompt
+    rank above matches in the negative prompt; ties go to newer images.
+    """
+    db = get_database()
+    user_id = str(current_user["_id"])
+    
+    query = {"user_id": user_id, "$text": {"$search": q}}
+    if favorites_only:
+        query["is_favorite"] = True
+    
+    # Fetch one extra result instead of counting every match
+    cursor = db.image_history.find(query, {"score": {"$meta": "textScore"}}).sort([
+        ("score", {"$meta": "textScore"}),
+        ("created_at", -1)
+    ]).skip(offset).limit(limit + 1)
+    docs = await cursor.to_list(length=limit + 1)
+    
+    return {
+        "image_history": [
+            {**format_image(doc), "score": doc["score"]}
+            for doc in docs[:limit]
+        ],
+        "has_more": len(docs) > limit
+    }
+
+@router.get("/images/suggest", response_model=dict)
+async def suggest_prompts(
+    prefix: str = Query(..., min_length=1, max_length=500),
+    limit: int = Query(10, le=50),
+    current_user: dict = Depends(get_current_user)
+):
+    """Earlier prompts starting with prefix, most used first"""
+    db = get_database()
+    user_id = str(current_user["_id"])
+    
+    # A range scan on the case-insensitive (user_id, prompt) index; U+FFFF
+    # sorts after every character under this collation
+    pipeline = [
+        {"$match": {"user_id": user_id, "prompt": {"$gte": prefix, "$lt": prefix + "\uffff"}}},
+        {"$limit": PROMPT_SUGGEST_SCAN_LIMIT},
+        {"$group": {
+            "_id": "$prompt",
+            "count": {"$sum": 1},
+            "last_used": {"$max": "$created_at"}
+        }},
+        {"$sort": {"count": -1, "last_used": -1}},
+        {"$limit": limit}
+    ]
+    rows = await db.image_history.aggregate(pipeline, collation=PROMPT_COLLATION).to_list(length=limit)
+    
+    return {
+        "suggestions": [
+            {"prompt": row["_id"], "count": row["count"], "last_used": row["last_used"]}
+            for row in rows
+        ]
+    }
+
 @router.post("/images/{image_id}/favorite")
 async def toggle_image_favorite(
     image_id: str,
@@ -222,7 +271,8 @@ async def delete_image(
             detail="Image not found"
         )
     
-    # TODO: Also delete the actual image files from storage
+    # The files are reclaimed by the image garbage collector once no other
+    # record (e.g. a result-cache hit) references them
     
     return {"message": "Image deleted successfully"}
 
@@ -232,15 +282,11 @@ async def delete_chat_session(
     current_user: dict = Depends(get_current_user)
 ):
     """Delete a chat session"""
-    db = get_database()
     user_id = str(current_user["_id"])
     
-    result = await db.chat_history.delete_one({
-        "user_id": user_id,
-        "session_id": session_id
-    })
+    deleted_count = await delete_sessions(user_id, session_id)
     
-    if result.deleted_count == 0:
+    if deleted_count == 0:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Chat session not found"
@@ -260,8 +306,7 @@ async def clear_history(
     deleted_count = 0
     
     if not type or type == "chat":
-        result = await db.chat_history.delete_many({"user_id": user_id})
-        deleted_count += result.deleted_count
+        deleted_count += await delete_sessions(user_id)
     
     if not type or type == "image":
         result = await db.image_history.delete_many({"user_id": user_id})
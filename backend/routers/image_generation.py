@@ -1,133 +1,236 @@
 from fastapi import APIRouter, HTTPException, status, Depends, BackgroundTasks
 from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import ValidationError
 from datetime import datetime
 from bson import ObjectId
-import torch
-from diffusers import StableDiffusionXLPipeline, DPMSolverMultistepScheduler
-from PIL import Image
-import io
-import os
+import itertools
 import uuid
 import asyncio
 import json
+import os
 import time
-from typing import Dict, Any
+from typing import Dict, List, Optional
 
-from models import ImageGenerationRequest, ImageGenerationResponse, GenerationProgress
+from models import (
+    ImageGenerationRequest, ImageBatchRequest, ImageGenerationResponse, GenerationProgress, ImageFormat, JobPriority
+)
 from auth import get_current_user
 from database import get_database
+from image_worker import worker_pool
+from generation_events import progress_broker, CONTROL_CHANNEL
+from generation_store import status_store
+from model_registry import get_model_spec, list_models
+from result_cache import result_cache
+from storage import image_storage
+from image_gc import image_gc
+from generation_queue import generation_queue, QueueFull, QueueTicket, PRIORITY_RANK
 
 router = APIRouter()
 
-# Global pipeline cache
-pipeline_cache: Dict[str, Any] = {}
-generation_status: Dict[str, GenerationProgress] = {}
-
-def get_pipeline(model_version: str = "stable-diffusion-xl-base-1.0"):
-    """Get or create Stable Diffusion pipeline"""
-    if model_version not in pipeline_cache:
-        try:
-            # Load pipeline with optimizations
-            pipe = StableDiffusionXLPipeline.from_pretrained(
-                "stabilityai/stable-diffusion-xl-base-1.0",
-                torch_dtype=torch.float16,
-                use_safetensors=True,
-                variant="fp16"
-            )
-            
-            # Optimize for memory and speed
-            pipe.scheduler = DPMSolverMultistepScheduler.from_config(pipe.scheduler.config)
-            pipe = pipe.to("cuda" if torch.cuda.is_available() else "cpu")
-            
-            # Enable memory efficient attention
-            if torch.cuda.is_available():
-                pipe.enable_memory_efficient_attention()
-                pipe.enable_vae_slicing()
-                pipe.enable_vae_tiling()
-            
-            pipeline_cache[model_version] = pipe
-            print(f"Loaded {model_version} pipeline")
-        except Exception as e:
-            print(f"Error loading pipeline: {e}")
-            return None
-    
-    return pipeline_cache[model_version]
+# Seconds a queued generation is expected to take before workers report
+DEFAULT_ESTIMATED_TIME = 60
+
+# Seconds between keep-alive comments on idle progress streams
+STREAM_KEEPALIVE_SECONDS = 15
+
+# Most images a single batch request may render
+GENERATION_BATCH_MAX_IMAGES = int(os.getenv("GENERATION_BATCH_MAX_IMAGES", "32"))
+
+# Item generation ids of the batches rendering in this process, by batch id
+running_batches: Dict[str, List[str]] = {}
+
+async def set_status(generation_id: str, progress: GenerationProgress):
+    """Record a generation's status and push it to everyone watching it"""
+    await status_store.set(generation_id, progress)
+    await progress_broker.publish(generation_id, progress.dict())
+
+async def set_cancelled(generation_id: str):
+    """Record a user's cancellation as the generation's final status"""
+    await set_status(generation_id, GenerationProgress(
+        status="failed",
+        progress=0.0,
+        message="Generation cancelled by user"
+    ))
+
+async def relay_cancellations():
+    """Cancel local jobs when another API process is asked to stop them"""
+    async with progress_broker.subscribe(CONTROL_CHANNEL, latest_only=False) as subscription:
+        while True:
+            message = await subscription.get()
+            if message and "cancel" in message:
+                cancel_local(message["cancel"])
 
-def save_image(image: Image.Image, filename: str) -> str:
-    """Save generated image and return URL"""
-    os.makedirs("generated_images", exist_ok=True)
-    filepath = os.path.join("generated_images", filename)
-    image.save(filepath, "PNG")
-    return f"/generated-images/{filename}"
+def cancel_local(generation_id: str) -> bool:
+    """Cancel a generation or batch owned by this process; False if it isn't"""
+    if generation_queue.cancel(generation_id) or worker_pool.cancel(generation_id):
+        return True
+    item_ids = running_batches.pop(generation_id, None)
+    if item_ids is None:
+        return False
+    for item_id in item_ids:
+        worker_pool.cancel(item_id)
+    return True
+
+def format_result(record: dict) -> dict:
+    """Public view of an image_history record"""
+    result = {
+        "id": record["_id"],
+        "prompt": record["prompt"],
+        "image_urls": record["image_urls"],
+        "thumbnails": record.get("thumbnails", []),
+        "parameters": record["parameters"],
+        "processing_time": record.get("processing_time")
+    }
+    if "batch" in record:
+        result["batch"] = record["batch"]
+    return result
+
+def images_exist(image_urls: list) -> bool:
+    """Whether every image of a result is still in storage"""
+    keys = [image_storage.key_for_url(url) for url in image_urls]
+    return all(key and image_storage.exists(key) for key in keys)
+
+async def status_payload(generation_id: str, status_info: GenerationProgress) -> dict:
+    """Status response, including the result once the generation completed"""
+    data = {
+        "status": status_info.status,
+        "progress": status_info.progress,
+        "message": status_info.message,
+        "estimated_time": status_info.estimated_time,
+        "queue_position": status_info.queue_position,
+        "preview": status_info.preview
+    }
+
+    if status_info.status == "processing" and status_info.result:
+        # Batches publish their finished items while the rest render
+        data["result"] = status_info.result
+    elif status_info.status == "completed":
+        result = status_info.result
+        if result is None:
+            db = get_database()
+            record = await db.image_history.find_one({"_id": generation_id})
+            result = format_result(record) if record else None
+        if result:
+            data["result"] = result
+
+    return data
+
+async def cached_result(request: ImageGenerationRequest) -> Optional[dict]:
+    """Stored result of an identical seeded request, if its files still exist"""
+    result = result_cache.get(request)
+    if result is not None and not await run_in_threadpool(images_exist, result["image_urls"]):
+        # The garbage collector has removed them since
+        result_cache.discard(request)
+        result = None
+    return result
+
+def apply_user_defaults(request, current_user: dict):
+    """Fall back to the user's preferred output encoding"""
+    settings = current_user.get("settings", {})
+    if request.output_format is None:
+        request.output_format = ImageFormat(settings.get("default_image_format", ImageFormat.PNG.value))
+    if request.quality is None and request.output_format != ImageFormat.PNG:
+        request.quality = settings.get("default_image_quality")
+
+def effective_priority(request, current_user: dict) -> JobPriority:
+    """Requests may lower their priority class but not raise it"""
+    priority = JobPriority(current_user.get("priority", JobPriority.NORMAL.value))
+    if request.priority and PRIORITY_RANK[request.priority] > PRIORITY_RANK[priority]:
+        priority = request.priority
+    return priority
+
+def admit(generation_id: str, user_id: str, priority: JobPriority, images: int) -> QueueTicket:
+    """Enqueue a generation, turning a full queue into a 429"""
+    try:
+        return generation_queue.enqueue(generation_id, user_id, priority, images)
+    except QueueFull as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+def abandon(generation_id: str):
+    """Release the queue place of a generation whose task never started"""
+    generation_queue.cancel(generation_id)
+    generation_queue.finish(generation_id)
+    worker_pool.cancel(generation_id)
+
+async def wait_for_turn(generation_id: str, ticket: QueueTicket) -> bool:
+    """Publish queue positions until dispatched; False if cancelled meanwhile"""
+    async for kind, data in ticket.updates():
+        if kind == "position":
+            await set_status(generation_id, GenerationProgress(
+                status="queued",
+                progress=0.0,
+                message=f"Queued at position {data['position']}",
+                estimated_time=data["estimated_time"],
+                queue_position=data["position"]
+            ))
+        elif kind == "cancelled":
+            return False
+    return True
 
 async def generate_image_task(
     request: ImageGenerationRequest,
     user_id: str,
-    generation_id: str
+    generation_id: str,
+    ticket: Optional[QueueTicket] = None,
+    result: Optional[dict] = None
 ):
-    """Background task for image generation"""
+    """Background task for image generation.
+
+    Cached results are recorded straight away; otherwise the generation
+    waits for its turn in the fair queue and is rendered by the worker pool.
+    This coroutine only relays progress and records the result, so it never
+    blocks the event loop.
+    """
     try:
-        # Update status to processing
-        generation_status[generation_id] = GenerationProgress(
-            status="processing",
-            progress=10.0,
-            message="Loading model...",
-            estimated_time=30
-        )
-        
-        # Get pipeline
-        pipe = get_pipeline(request.model_version)
-        if not pipe:
-            generation_status[generation_id] = GenerationProgress(
-                status="failed",
-                progress=0.0,
-                message="Failed to load model"
-            )
-            return
-        
-        generation_status[generation_id].progress = 30.0
-        generation_status[generation_id].message = "Generating image..."
-        
-        # Prepare prompt
-        style_prompts = {
-            "realistic": "photorealistic, highly detailed, 8k resolution",
-            "artistic": "artistic, painterly, creative composition",
-            "anime": "anime style, manga, cel shading",
-            "cartoon": "cartoon style, vibrant colors, stylized",
-            "abstract": "abstract art, geometric, non-representational",
-            "photographic": "professional photography, studio lighting",
-            "digital_art": "digital art, concept art, detailed illustration",
-            "concept_art": "concept art, matte painting, cinematic"
-        }
-        
-        enhanced_prompt = f"{request.prompt}, {style_prompts.get(request.style.value, '')}"
-        
-        # Generate image
-        start_time = time.time()
-        
-        with torch.inference_mode():
-            images = pipe(
-                prompt=enhanced_prompt,
-                negative_prompt=request.negative_prompt or "blurry, low quality, distorted",
-                num_inference_steps=request.steps,
-                guidance_scale=request.guidance_scale,
-                width=int(request.size.value.split('x')[0]),
-                height=int(request.size.value.split('x')[1]),
-                num_images_per_prompt=request.num_images,
-                generator=torch.Generator().manual_seed(request.seed) if request.seed else None
-            ).images
-        
-        processing_time = time.time() - start_time
-        
-        generation_status[generation_id].progress = 80.0
-        generation_status[generation_id].message = "Saving images..."
-        
-        # Save images
-        image_urls = []
-        for i, image in enumerate(images):
-            filename = f"{generation_id}_{i}.png"
-            url = save_image(image, filename)
-            image_urls.append(url)
+        from_cache = result is not None
+
+        if from_cache:
+            result["processing_time"] = 0.0
+        else:
+            if not await wait_for_turn(generation_id, ticket):
+                # Rewritten in case a queued update raced cancel_generation's
+                await set_cancelled(generation_id)
+                return
+
+            job = worker_pool.submit(generation_id, request)
+            estimated_time = DEFAULT_ESTIMATED_TIME
+            progress = GenerationProgress(status="processing", progress=0.0)
+
+            async for kind, data in job.events():
+                if kind == "progress":
+                    # Workers only know the ETA once denoising has started
+                    if data["estimated_time"] is not None:
+                        estimated_time = data["estimated_time"]
+
+                    progress = GenerationProgress(
+                        status="processing",
+                        progress=data["progress"],
+                        message=data["message"],
+                        estimated_time=estimated_time
+                    )
+                    await set_status(generation_id, progress)
+                elif kind == "preview":
+                    # Sent with the current progress; later updates drop it
+                    # again so streams don't resend the image every step
+                    progress.preview = data["image"]
+                    await set_status(generation_id, progress)
+                    progress.preview = None
+                elif kind == "completed":
+                    result = data
+                elif kind == "failed":
+                    raise RuntimeError(data)
+                elif kind == "cancelled":
+                    # Rewritten in case a progress update raced
+                    # cancel_generation's
+                    await set_cancelled(generation_id)
+                    return
+
+            result_cache.put(request, result)
         
         # Save to database
         db = get_database()
@@ -138,36 +241,209 @@ async def generate_image_task(
             "negative_prompt": request.negative_prompt,
             "style": request.style.value,
             "size": request.size.value,
-            "image_urls": image_urls,
+            "image_urls": result["image_urls"],
+            "thumbnails": result.get("thumbnails", []),
             "parameters": {
                 "steps": request.steps,
                 "guidance_scale": request.guidance_scale,
                 "seed": request.seed,
                 "model_version": request.model_version,
-                "num_images": request.num_images
+                "num_images": request.num_images,
+                "output_format": request.output_format.value,
+                "quality": request.quality
             },
             "created_at": datetime.utcnow(),
-            "processing_time": processing_time,
+            "processing_time": result["processing_time"],
+            "timings": {} if from_cache else result.get("timings", {}),
+            "from_cache": from_cache,
             "is_favorite": False
         }
         
         await db.image_history.insert_one(image_record)
         
-        # Update status to completed
-        generation_status[generation_id] = GenerationProgress(
+        # Update status to completed; watchers get the result with it, so
+        # nobody has to read it back from the database
+        await set_status(generation_id, GenerationProgress(
             status="completed",
             progress=100.0,
             message="Generation completed!",
-            estimated_time=0
-        )
+            estimated_time=0,
+            result=format_result(image_record)
+        ))
         
     except Exception as e:
         print(f"Error in image generation: {e}")
-        generation_status[generation_id] = GenerationProgress(
+        await set_status(generation_id, GenerationProgress(
             status="failed",
             progress=0.0,
             message=f"Generation failed: {str(e)}"
+        ))
+    finally:
+        generation_queue.finish(generation_id)
+
+def expand_batch(batch: ImageBatchRequest) -> List[ImageGenerationRequest]:
+    """One request per combination of the batch's varied values"""
+    shared = batch.dict(exclude={"prompts", "styles", "seeds", "guidance_scales"})
+    return [
+        ImageGenerationRequest(prompt=prompt, style=style, seed=seed, guidance_scale=guidance_scale, **shared)
+        for prompt, style, seed, guidance_scale in itertools.product(
+            batch.prompts, batch.styles, batch.seeds, batch.guidance_scales
         )
+    ]
+
+def batch_record(
+    batch_id: str,
+    user_id: str,
+    batch: ImageBatchRequest,
+    items: List[ImageGenerationRequest],
+    results: List[Optional[dict]],
+    cached: List[Optional[dict]],
+    processing_time: Optional[float]
+) -> dict:
+    """The single image_history record of a batch, listing its finished items"""
+    finished = [
+        {
+            "generation_id": f"{batch_id}-{index}",
+            "prompt": request.prompt,
+            "style": request.style.value,
+            "seed": request.seed,
+            "guidance_scale": request.guidance_scale,
+            "image_urls": result["image_urls"],
+            "thumbnails": result.get("thumbnails", []),
+            "from_cache": cached[index] is not None
+        }
+        for index, (request, result) in enumerate(zip(items, results)) if result is not None
+    ]
+    return {
+        "_id": batch_id,
+        "user_id": user_id,
+        "prompt": items[0].prompt,
+        "negative_prompt": batch.negative_prompt,
+        "style": items[0].style.value,
+        "size": batch.size.value,
+        "image_urls": [url for item in finished for url in item["image_urls"]],
+        "thumbnails": [thumbnails for item in finished for thumbnails in item["thumbnails"]],
+        "parameters": {
+            "steps": batch.steps,
+            "guidance_scale": items[0].guidance_scale,
+            "seed": items[0].seed,
+            "model_version": batch.model_version,
+            "num_images": sum(len(item["image_urls"]) for item in finished),
+            "output_format": batch.output_format.value,
+            "quality": batch.quality
+        },
+        "batch": finished,
+        "created_at": datetime.utcnow(),
+        "processing_time": processing_time,
+        "from_cache": all(result is not None for result in cached),
+        "is_favorite": False
+    }
+
+async def generate_batch_task(
+    batch: ImageBatchRequest,
+    items: List[ImageGenerationRequest],
+    user_id: str,
+    batch_id: str,
+    ticket: Optional[QueueTicket],
+    cached: List[Optional[dict]]
+):
+    """Background task for a batch generation.
+
+    The batch holds one place in the fair queue. Once dispatched, all of its
+    uncached items are submitted to the worker pool together, so the
+    workers' micro-batcher packs items with the same model, size, steps and
+    guidance into shared forward passes. Finished items are published with
+    the batch status as they arrive, and one record is written at the end.
+    """
+    results: List[Optional[dict]] = list(cached)
+    relays: List[asyncio.Task] = []
+    processing_time = 0.0
+    try:
+        pending = {f"{batch_id}-{index}": index for index, result in enumerate(cached) if result is None}
+        if pending:
+            if not await wait_for_turn(batch_id, ticket):
+                await set_cancelled(batch_id)
+                return
+
+            started = time.time()
+            running_batches[batch_id] = list(pending)
+            events: asyncio.Queue = asyncio.Queue()
+
+            async def relay(item_id: str, job):
+                async for kind, data in job.events():
+                    await events.put((item_id, kind, data))
+
+            relays = [
+                asyncio.create_task(relay(item_id, worker_pool.submit(item_id, items[index])))
+                for item_id, index in pending.items()
+            ]
+
+            progress = {item_id: 0.0 for item_id in pending}
+            estimates: Dict[str, int] = {}
+            failed = 0
+            remaining = len(pending)
+            while remaining:
+                item_id, kind, data = await events.get()
+                if batch_id not in running_batches or kind == "cancelled":
+                    await set_cancelled(batch_id)
+                    return
+                index = pending[item_id]
+                if kind == "progress":
+                    progress[item_id] = data["progress"]
+                    if data["estimated_time"] is not None:
+                        estimates[item_id] = data["estimated_time"]
+                elif kind == "completed":
+                    results[index] = data
+                    result_cache.put(items[index], data)
+                elif kind == "failed":
+                    print(f"Batch {batch_id} item {index} failed: {data}")
+                    failed += 1
+                else:
+                    continue
+
+                if kind in ("completed", "failed"):
+                    remaining -= 1
+                    progress[item_id] = 100.0
+                    estimates.pop(item_id, None)
+
+                done = sum(1 for result in results if result is not None)
+                partial = batch_record(batch_id, user_id, batch, items, results, cached, None)
+                await set_status(batch_id, GenerationProgress(
+                    status="processing",
+                    progress=min(99.0, sum(progress.values()) / len(progress)),
+                    message=f"{done}/{len(items)} generations finished",
+                    estimated_time=max(estimates.values(), default=DEFAULT_ESTIMATED_TIME if remaining else 0),
+                    result=format_result(partial) if done else None
+                ))
+
+            processing_time = time.time() - started
+            if failed == len(pending) and not any(cached):
+                raise RuntimeError("every item of the batch failed")
+
+        db = get_database()
+        image_record = batch_record(batch_id, user_id, batch, items, results, cached, processing_time)
+        await db.image_history.insert_one(image_record)
+
+        await set_status(batch_id, GenerationProgress(
+            status="completed",
+            progress=100.0,
+            message=f"Batch completed: {len(image_record['batch'])}/{len(items)} generations",
+            estimated_time=0,
+            result=format_result(image_record)
+        ))
+
+    except Exception as e:
+        print(f"Error in batch generation: {e}")
+        await set_status(batch_id, GenerationProgress(
+            status="failed",
+            progress=0.0,
+            message=f"Generation failed: {str(e)}"
+        ))
+    finally:
+        for task in relays:
+            task.cancel()
+        running_batches.pop(batch_id, None)
+        generation_queue.finish(batch_id)
 
 @router.post("/image", response_model=dict)
 async def generate_image(
@@ -176,24 +452,54 @@ async def generate_image(
     current_user: dict = Depends(get_current_user)
 ):
     """Generate image using Stable Diffusion XL"""
+    if not worker_pool.enabled:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Image generation is not enabled on this server"
+        )
+
+    if not get_model_spec(request.model_version):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown model: {request.model_version}"
+        )
+
+    apply_user_defaults(request, current_user)
+
     user_id = str(current_user["_id"])
     generation_id = str(uuid.uuid4())
+
+    # Seeded requests we've already rendered reuse the stored images
+    cached = await cached_result(request)
+    ticket = None
+    position = None
+    if cached is None:
+        ticket = admit(generation_id, user_id, effective_priority(request, current_user), request.num_images)
+        position = ticket.position
     
-    # Initialize generation status
-    generation_status[generation_id] = GenerationProgress(
-        status="queued",
-        progress=0.0,
-        message="Request queued for processing",
-        estimated_time=60
-    )
-    
-    # Start background task
-    background_tasks.add_task(
-        generate_image_task,
-        request,
-        user_id,
-        generation_id
-    )
+    try:
+        # Initialize generation status
+        await set_status(generation_id, GenerationProgress(
+            status="queued",
+            progress=0.0,
+            message="Request queued for processing",
+            estimated_time=position["estimated_time"] if position else DEFAULT_ESTIMATED_TIME,
+            queue_position=position["position"] if position else None
+        ))
+
+        # Start background task
+        background_tasks.add_task(
+            generate_image_task,
+            request,
+            user_id,
+            generation_id,
+            ticket,
+            cached
+        )
+    except Exception:
+        # Without its task nothing would ever release the admitted capacity
+        abandon(generation_id)
+        raise
     
     return {
         "generation_id": generation_id,
@@ -201,44 +507,102 @@ async def generate_image(
         "message": "Image generation started. Use the generation_id to check progress."
     }
 
+@router.post("/image/batch", response_model=dict)
+async def generate_image_batch(
+    batch: ImageBatchRequest,
+    background_tasks: BackgroundTasks,
+    current_user: dict = Depends(get_current_user)
+):
+    """Generate every combination of prompts and parameters as one job.
+
+    Progress and finished items are reported under the returned
+    generation_id through the usual status, stream and cancel endpoints.
+    """
+    if not worker_pool.enabled:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Image generation is not enabled on this server"
+        )
+
+    if not get_model_spec(batch.model_version):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown model: {batch.model_version}"
+        )
+
+    # Check the size before building one request per combination
+    total_images = len(batch.prompts) * len(batch.styles) * len(batch.seeds) * len(batch.guidance_scales) * batch.num_images
+    if total_images > GENERATION_BATCH_MAX_IMAGES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A batch may render at most {GENERATION_BATCH_MAX_IMAGES} images, this one has {total_images}"
+        )
+
+    apply_user_defaults(batch, current_user)
+    try:
+        items = expand_batch(batch)
+    except ValidationError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=e.errors()
+        )
+
+    user_id = str(current_user["_id"])
+    batch_id = str(uuid.uuid4())
+
+    # Seeded items we've already rendered reuse the stored images
+    cached = [await cached_result(item) for item in items]
+    images = sum(item.num_images for item, result in zip(items, cached) if result is None)
+    ticket = None
+    position = None
+    if images:
+        ticket = admit(batch_id, user_id, effective_priority(batch, current_user), images)
+        position = ticket.position
+
+    try:
+        await set_status(batch_id, GenerationProgress(
+            status="queued",
+            progress=0.0,
+            message="Batch queued for processing",
+            estimated_time=position["estimated_time"] if position else DEFAULT_ESTIMATED_TIME,
+            queue_position=position["position"] if position else None
+        ))
+
+        background_tasks.add_task(
+            generate_batch_task,
+            batch,
+            items,
+            user_id,
+            batch_id,
+            ticket,
+            cached
+        )
+    except Exception:
+        abandon(batch_id)
+        raise
+
+    return {
+        "generation_id": batch_id,
+        "status": "queued",
+        "items": len(items),
+        "num_images": total_images,
+        "message": "Batch generation started. Use the generation_id to check progress."
+    }
+
 @router.get("/image/{generation_id}/status")
 async def get_generation_status(
     generation_id: str,
     current_user: dict = Depends(get_current_user)
 ):
     """Get image generation status"""
-    if generation_id not in generation_status:
+    status_info = await status_store.get(generation_id)
+    if status_info is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Generation ID not found"
         )
     
-    status_info = generation_status[generation_id]
-    
-    # If completed, get the result from database
-    if status_info.status == "completed":
-        db = get_database()
-        result = await db.image_history.find_one({"_id": generation_id})
-        if result:
-            return {
-                "status": status_info.status,
-                "progress": status_info.progress,
-                "message": status_info.message,
-                "result": {
-                    "id": result["_id"],
-                    "prompt": result["prompt"],
-                    "image_urls": result["image_urls"],
-                    "parameters": result["parameters"],
-                    "processing_time": result.get("processing_time")
-                }
-            }
-    
-    return {
-        "status": status_info.status,
-        "progress": status_info.progress,
-        "message": status_info.message,
-        "estimated_time": status_info.estimated_time
-    }
+    return await status_payload(generation_id, status_info)
 
 @router.get("/image/{generation_id}/stream")
 async def stream_generation_progress(
@@ -247,36 +611,23 @@ async def stream_generation_progress(
 ):
     """Stream image generation progress"""
     async def generate_progress_stream():
-        while generation_id in generation_status:
-            status_info = generation_status[generation_id]
-            
-            data = {
-                "status": status_info.status,
-                "progress": status_info.progress,
-                "message": status_info.message,
-                "estimated_time": status_info.estimated_time
-            }
-            
-            # If completed, include result
-            if status_info.status == "completed":
-                db = get_database()
-                result = await db.image_history.find_one({"_id": generation_id})
-                if result:
-                    data["result"] = {
-                        "id": result["_id"],
-                        "prompt": result["prompt"],
-                        "image_urls": result["image_urls"],
-                        "parameters": result["parameters"],
-                        "processing_time": result.get("processing_time")
-                    }
-            
-            yield f"data: {json.dumps(data)}\n\n"
-            
-            # Break if completed or failed
-            if status_info.status in ["completed", "failed"]:
-                break
-            
-            await asyncio.sleep(1)  # Update every second
+        # Subscribe before reading the current status so no update is missed
+        async with progress_broker.subscribe(generation_id) as subscription:
+            status_info = await status_store.get(generation_id)
+            while status_info is not None:
+                data = await status_payload(generation_id, status_info)
+                yield f"data: {json.dumps(data)}\n\n"
+                
+                # Break if completed or failed
+                if status_info.status in ["completed", "failed"]:
+                    break
+                
+                # Sleep until the status changes
+                message = await subscription.get(timeout=STREAM_KEEPALIVE_SECONDS)
+                while message is None:
+                    yield ": keep-alive\n\n"
+                    message = await subscription.get(timeout=STREAM_KEEPALIVE_SECONDS)
+                status_info = GenerationProgress(**message)
     
     return StreamingResponse(
         generate_progress_stream(),
@@ -292,17 +643,37 @@ async def stream_generation_progress(
 @router.get("/models")
 async def get_available_models():
     """Get list of available image generation models"""
-    return {
-        "models": [
-            {
-                "id": "stable-diffusion-xl-base-1.0",
-                "name": "Stable Diffusion XL Base 1.0",
-                "description": "High-quality image generation with excellent prompt following",
-                "type": "text-to-image",
-                "max_resolution": "1024x1024"
-            }
-        ]
-    }
+    # Which workers currently hold each model in memory
+    resident: Dict[str, list] = {}
+    for worker_id, stats in worker_pool.worker_stats.items():
+        for entry in stats.get("pipelines", {}).get("resident", []):
+            resident.setdefault(entry["model"], []).append(worker_id)
+
+    models = []
+    for model in list_models():
+        models.append({**model, "resident_workers": resident.get(model["id"], [])})
+
+    return {"models": models}
+
+@router.get("/workers")
+async def get_worker_status(current_user: dict = Depends(get_current_user)):
+    """Get image worker pool status"""
+    return worker_pool.stats()
+
+@router.get("/cache")
+async def get_cache_stats(current_user: dict = Depends(get_current_user)):
+    """Get result cache statistics"""
+    return result_cache.stats()
+
+@router.get("/queue")
+async def get_queue_stats(current_user: dict = Depends(get_current_user)):
+    """Get generation queue statistics"""
+    return generation_queue.stats()
+
+@router.get("/gc")
+async def get_gc_stats(current_user: dict = Depends(get_current_user)):
+    """Get image garbage collector statistics"""
+    return image_gc.stats()
 
 @router.get("/styles")
 async def get_available_styles():
@@ -326,13 +697,13 @@ async def cancel_generation(
     current_user: dict = Depends(get_current_user)
 ):
     """Cancel image generation"""
-    if generation_id in generation_status:
-        if generation_status[generation_id].status in ["queued", "processing"]:
-            generation_status[generation_id] = GenerationProgress(
-                status="failed",
-                progress=0.0,
-                message="Generation cancelled by user"
-            )
+    status_info = await status_store.get(generation_id)
+    if status_info is not None:
+        if status_info.status in ["queued", "processing"]:
+            # The job may belong to another API process; its owner cancels it
+            if not cancel_local(generation_id):
+                await progress_broker.publish(CONTROL_CHANNEL, {"cancel": generation_id})
+            await set_cancelled(generation_id)
             return {"message": "Generation cancelled"}
         else:
             return {"message": "Generation already completed or failed"}
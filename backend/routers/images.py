@@ -0,0 +1,174 @@
+from fastapi import APIRouter, HTTPException, Request, status
+from fastapi.responses import Response, FileResponse
+from starlette.concurrency import run_in_threadpool
+from email.utils import formatdate
+from typing import Optional, Tuple
+import anyio
+import os
+
+from storage import IMAGE_DIR
+from thumbnails import IMAGE_WEBP_VARIANTS, webp_variant_name
+
+# Serves the local storage backend; object-store URLs point at the bucket
+router = APIRouter()
+
+# Generated files are never rewritten, so browsers and CDNs may keep them
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# When set (e.g. /internal-images/), responses carry an X-Accel-Redirect to
+# this nginx internal location so the proxy sends the file with sendfile
+IMAGE_ACCEL_REDIRECT = os.getenv("IMAGE_ACCEL_REDIRECT", "")
+
+class ImageFileResponse(FileResponse):
+    """FileResponse for a byte range that uses zero-copy send when the
+    server supports the ASGI zerocopysend extension"""
+
+    def __init__(self, path: str, byte_range: Tuple[int, int], **kwargs):
+        super().__init__(path, **kwargs)
+        self.byte_range = byte_range
+
+    async def __call__(self, scope, receive, send):
+        start, end = self.byte_range
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers
+        })
+        if self.send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": file.wrapped.fileno(),
+                    "offset": start,
+                    "count": end - start + 1,
+                    "more_body": False
+                })
+                return
+
+            await file.seek(start)
+            remaining = end - start + 1
+            more_body = True
+            while more_body:
+                chunk = await file.read(min(self.chunk_size, remaining)) if remaining > 0 else b""
+                remaining -= len(chunk)
+                more_body = remaining > 0 and bool(chunk)
+                await send({
+                    "type": "http.response.body",
+                    "body": chunk,
+                    "more_body": more_body
+                })
+
+def resolve_image(path: str, accept: str) -> Optional[Tuple[str, os.stat_result]]:
+    """Find the file to serve for a path, preferring a WebP copy if accepted"""
+    root = os.path.realpath(IMAGE_DIR)
+    filepath = os.path.realpath(os.path.join(root, path))
+    if not filepath.startswith(root + os.sep):
+        return None
+
+    if IMAGE_WEBP_VARIANTS and filepath.endswith(".png") and "image/webp" in accept:
+        variant = webp_variant_name(filepath)
+        if os.path.isfile(variant):
+            filepath = variant
+
+    try:
+        stat_result = os.stat(filepath)
+    except OSError:
+        return None
+    if not os.path.isfile(filepath):
+        return None
+    return filepath, stat_result
+
+def make_etag(stat_result: os.stat_result) -> str:
+    """Strong validator; files are written once and never modified"""
+    return f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single-range Range header; None means serve the whole file.
+
+    As RFC 7233 requires, a header that isn't a valid byte range (such as
+    bytes=5-2) is ignored, and only a valid range outside the file is a 416.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+
+    first, _, last = (part.strip() for part in spec.strip().partition("-"))
+    if not (first or last) or not all(part.isdigit() for part in (first, last) if part):
+        return None
+
+    if first:
+        start = int(first)
+        end = int(last) if last else size - 1
+        if last and end < start:
+            return None
+    else:
+        # Suffix range: the last N bytes
+        start = max(size - int(last), 0) if int(last) else size
+        end = size - 1
+
+    if start >= size:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, min(end, size - 1)
+
+@router.api_route("/{path:path}", methods=["GET", "HEAD"])
+async def serve_image(path: str, request: Request):
+    """Serve a generated image with long-lived caching"""
+    resolved = await run_in_threadpool(resolve_image, path, request.headers.get("accept", ""))
+    if not resolved:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Image not found"
+        )
+
+    filepath, stat_result = resolved
+    etag = make_etag(stat_result)
+    headers = {
+        "Cache-Control": IMAGE_CACHE_CONTROL,
+        "ETag": etag,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Accept-Ranges": "bytes"
+    }
+    if IMAGE_WEBP_VARIANTS and path.endswith(".png"):
+        headers["Vary"] = "Accept"
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in if_none_match):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if IMAGE_ACCEL_REDIRECT:
+        # nginx applies Range itself and streams the file with sendfile
+        relative = os.path.relpath(filepath, os.path.realpath(IMAGE_DIR))
+        headers["X-Accel-Redirect"] = IMAGE_ACCEL_REDIRECT.rstrip("/") + "/" + relative
+        return Response(headers=headers)
+
+    size = stat_result.st_size
+    byte_range = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range == etag):
+        byte_range = parse_range(range_header, size)
+
+    status_code = status.HTTP_200_OK
+    if byte_range is None:
+        byte_range = (0, size - 1)
+    else:
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+        headers["Content-Range"] = f"bytes {byte_range[0]}-{byte_range[1]}/{size}"
+
+    headers["Content-Length"] = str(byte_range[1] - byte_range[0] + 1)
+    return ImageFileResponse(
+        filepath,
+        byte_range,
+        status_code=status_code,
+        headers=headers,
+        stat_result=stat_result,
+        method=request.method
+    )
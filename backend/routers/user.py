@@ -5,6 +5,7 @@ from typing import Optional
 from models import UserSettings, UserResponse
 from auth import get_current_user, get_password_hash, verify_password
 from database import get_database
+from chat_store import SESSION_FIELDS
 
 router = APIRouter()
 
@@ -48,6 +49,8 @@ async def get_user_settings(current_user: dict = Depends(get_current_user)):
         "theme": "dark",
         "default_image_style": "realistic",
         "default_image_size": "1024x1024",
+        "default_image_format": "png",
+        "default_image_quality": 90,
         "chat_model": "gpt-4o-mini",
         "auto_save_history": True,
         "notifications_enabled": True
@@ -153,7 +156,7 @@ async def get_usage_stats(current_user: dict = Depends(get_current_user)):
     # Calculate total messages in chats
     pipeline = [
         {"$match": {"user_id": user_id}},
-        {"$project": {"message_count": {"$size": "$messages"}}},
+        {"$project": {"message_count": {"$ifNull": ["$message_count", 0]}}},
         {"$group": {"_id": None, "total_messages": {"$sum": "$message_count"}}}
     ]
     
@@ -180,12 +183,20 @@ async def export_user_data(current_user: dict = Depends(get_current_user)):
     user_id = str(current_user["_id"])
     
     # Get all user data
-    chat_history = await db.chat_history.find({"user_id": user_id}).to_list(length=None)
+    chat_history = await db.chat_history.find({"user_id": user_id}, SESSION_FIELDS).to_list(length=None)
     image_history = await db.image_history.find({"user_id": user_id}).to_list(length=None)
     
+    # Attach each session's messages, read in one pass over the user's messages
+    messages_by_session = {}
+    async for message in db.chat_messages.find(
+        {"user_id": user_id}, {"_id": 0, "user_id": 0}
+    ).sort([("session_id", 1), ("seq", 1)]):
+        messages_by_session.setdefault(message.pop("session_id"), []).append(message)
+    
     # Clean up data (remove internal fields)
     for chat in chat_history:
         chat["_id"] = str(chat["_id"])
+        chat["messages"] = messages_by_session.get(chat["session_id"], [])
     
     for image in image_history:
         image["_id"] = str(image["_id"])
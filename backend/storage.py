@@ -0,0 +1,200 @@
+import hashlib
+import mimetypes
+import os
+import tempfile
+from typing import Iterator, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Where generated images are kept: "local" (the directory below) or "s3" for
+# any S3-compatible object store (AWS S3, MinIO, R2...)
+IMAGE_STORAGE_BACKEND = os.getenv("IMAGE_STORAGE_BACKEND", "local")
+
+IMAGE_DIR = os.getenv("IMAGE_DIR", "generated_images")
+IMAGE_URL_PREFIX = "/generated-images"
+
+# Spread local files over hash-prefix subdirectories (ab/cd/name) so no single
+# directory grows past a few thousand entries
+IMAGE_STORAGE_SHARDED = os.getenv("IMAGE_STORAGE_SHARDED", "true").lower() == "true"
+
+S3_BUCKET = os.getenv("S3_BUCKET", "generated-images")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None  # e.g. http://minio:9000
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+# Base URL clients load objects from (bucket website or CDN); defaults to the
+# endpoint's path-style bucket URL
+S3_PUBLIC_URL = os.getenv("S3_PUBLIC_URL") or None
+
+mimetypes.add_type("image/webp", ".webp")
+mimetypes.add_type("image/avif", ".avif")
+
+def shard_path(name: str) -> str:
+    """Relative path of a stored file, keeping its directory part.
+
+    The shard comes from the generation id at the start of the name, so all
+    files of a generation, including their WebP copies, end up side by side.
+    """
+    if not IMAGE_STORAGE_SHARDED:
+        return name
+    directory, filename = os.path.split(name)
+    digest = hashlib.sha1(filename.split("_")[0].split(".")[0].encode()).hexdigest()
+    return "/".join(part for part in (directory, digest[:2], digest[2:4], filename) if part)
+
+class LocalStorage:
+    """Images on the local filesystem, served by routers/images.py"""
+
+    def __init__(self, root: str = IMAGE_DIR, url_prefix: str = IMAGE_URL_PREFIX):
+        self.root = root
+        self.url_prefix = url_prefix
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def key_for(self, name: str) -> str:
+        """Key a file saved under name is stored at"""
+        return shard_path(name)
+
+    def save(self, name: str, data: bytes) -> str:
+        """Store data under a sharded key and return its public URL"""
+        key = self.key_for(name)
+        filepath = self.path(key)
+        directory = os.path.dirname(filepath)
+        os.makedirs(directory, exist_ok=True)
+
+        # Write then rename so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, filepath)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return self.url(key)
+
+    def read(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self.path(key), "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self.path(key))
+
+    def delete(self, key: str) -> int:
+        """Remove a file and return the bytes reclaimed"""
+        try:
+            size = os.path.getsize(self.path(key))
+            os.remove(self.path(key))
+            return size
+        except FileNotFoundError:
+            return 0
+
+    def list(self) -> Iterator[Tuple[str, int, float]]:
+        """Yield (key, size, modified time) for every stored file"""
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.startswith(".tmp-"):
+                    continue
+                filepath = os.path.join(directory, filename)
+                try:
+                    stat_result = os.stat(filepath)
+                except FileNotFoundError:
+                    continue
+                key = os.path.relpath(filepath, self.root).replace(os.sep, "/")
+                yield key, stat_result.st_size, stat_result.st_mtime
+
+    def url(self, key: str) -> str:
+        return f"{self.url_prefix}/{key}"
+
+    def key_for_url(self, url: str) -> Optional[str]:
+        """Storage key of a URL produced by this backend, or None"""
+        prefix = self.url_prefix + "/"
+        return url[len(prefix):] if url.startswith(prefix) else None
+
+class S3Storage:
+    """Images in an S3-compatible bucket, loaded by clients straight from it"""
+
+    def __init__(
+        self,
+        bucket: str = S3_BUCKET,
+        endpoint_url: Optional[str] = S3_ENDPOINT_URL,
+        region: str = S3_REGION,
+        public_url: Optional[str] = S3_PUBLIC_URL
+    ):
+        # boto3 is only needed when this backend is selected
+        import boto3
+        from botocore.config import Config
+
+        self.bucket = bucket
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            config=Config(max_pool_connections=32, retries={"max_attempts": 3})
+        )
+        base = public_url or f"{endpoint_url or f'https://s3.{region}.amazonaws.com'}/{bucket}"
+        self.public_url = base.rstrip("/")
+
+    def key_for(self, name: str) -> str:
+        """Key a file saved under name is stored at"""
+        return name
+
+    def save(self, name: str, data: bytes) -> str:
+        """Upload data under its name and return its public URL"""
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=name,
+            Body=data,
+            ContentType=mimetypes.guess_type(name)[0] or "application/octet-stream",
+            CacheControl="public, max-age=31536000, immutable"
+        )
+        return self.url(name)
+
+    def read(self, key: str) -> Optional[bytes]:
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+        except self.client.exceptions.NoSuchKey:
+            return None
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except self.client.exceptions.ClientError:
+            return False
+
+    def delete(self, key: str) -> int:
+        """Remove an object and return the bytes reclaimed"""
+        try:
+            size = self.client.head_object(Bucket=self.bucket, Key=key)["ContentLength"]
+        except self.client.exceptions.ClientError:
+            return 0
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+        return size
+
+    def list(self) -> Iterator[Tuple[str, int, float]]:
+        """Yield (key, size, modified time) for every stored object"""
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket):
+            for obj in page.get("Contents", []):
+                yield obj["Key"], obj["Size"], obj["LastModified"].timestamp()
+
+    def url(self, key: str) -> str:
+        return f"{self.public_url}/{key}"
+
+    def key_for_url(self, url: str) -> Optional[str]:
+        """Storage key of a URL produced by this backend, or None"""
+        prefix = self.public_url + "/"
+        return url[len(prefix):] if url.startswith(prefix) else None
+
+def create_storage():
+    """Build the storage backend selected by IMAGE_STORAGE_BACKEND"""
+    if IMAGE_STORAGE_BACKEND == "s3":
+        return S3Storage()
+    return LocalStorage()
+
+# Shared storage instance used by the workers, routers and maintenance jobs
+image_storage = create_storage()
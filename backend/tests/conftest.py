@@ -0,0 +1,11 @@
+import pytest
+
+from database import db
+
+@pytest.fixture
+def mongo(monkeypatch):
+    """In-memory MongoDB in place of the application's database"""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    database = mongomock_motor.AsyncMongoMockClient()["ai_studio_test"]
+    monkeypatch.setattr(db, "database", database)
+    return database
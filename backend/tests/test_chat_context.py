@@ -0,0 +1,107 @@
+"""Context window trimming and the rolling summary handoff"""
+import asyncio
+
+import pytest
+
+import chat_context
+from chat_context import MESSAGE_OVERHEAD_TOKENS, build_context, count_tokens
+
+SYSTEM = "You are a helpful assistant."
+QUESTION = "What did we decide?"
+
+@pytest.fixture(autouse=True)
+def estimated_tokens(monkeypatch):
+    # Count tokens the same way whether or not tiktoken could load
+    monkeypatch.setattr(chat_context, "_encoding", None)
+
+def message(seq: int, tokens: int = 6) -> dict:
+    role = "user" if seq % 2 == 0 else "assistant"
+    return {"role": role, "content": f"message {seq}", "seq": seq, "tokens": tokens}
+
+def fixed_cost(*texts: str) -> int:
+    return sum(count_tokens(text) + MESSAGE_OVERHEAD_TOKENS for text in texts)
+
+def contents(messages: list) -> list:
+    return [m["content"] for m in messages]
+
+def test_system_prompt_and_message_always_sent():
+    history = [message(seq) for seq in range(4)]
+    session = {"message_count": 4}
+
+    messages, first_kept = build_context(session, history, SYSTEM, QUESTION, budget=1)
+
+    assert messages == [
+        {"role": "system", "content": SYSTEM},
+        {"role": "user", "content": QUESTION}
+    ]
+    assert first_kept == 4
+
+def test_newest_turns_kept_within_budget():
+    history = [message(seq) for seq in range(10)]
+    session = {"message_count": 10}
+    # Room for three messages of 6 + overhead tokens, but not four
+    budget = fixed_cost(SYSTEM, QUESTION) + 3 * (6 + MESSAGE_OVERHEAD_TOKENS) + 5
+
+    messages, first_kept = build_context(session, history, SYSTEM, QUESTION, budget)
+
+    assert contents(messages) == [SYSTEM, "message 7", "message 8", "message 9", QUESTION]
+    assert first_kept == 7
+
+def test_trimming_stops_at_the_first_message_that_does_not_fit():
+    history = [message(0, tokens=1), message(1, tokens=500), message(2, tokens=1)]
+    budget = fixed_cost(SYSTEM, QUESTION) + 50
+
+    messages, first_kept = build_context({"message_count": 3}, history, SYSTEM, QUESTION, budget)
+
+    # message 0 would fit, but sending it without message 1 would leave a gap
+    assert contents(messages) == [SYSTEM, "message 2", QUESTION]
+    assert first_kept == 2
+
+def test_summarized_messages_are_not_resent():
+    history = [message(seq) for seq in range(4, 10)]
+    session = {"message_count": 10, "summary": {"text": "They chose blue.", "upto": 6}}
+
+    messages, first_kept = build_context(session, history, SYSTEM, QUESTION, budget=10_000)
+
+    assert contents(messages) == [
+        SYSTEM,
+        "Summary of the earlier conversation:\nThey chose blue.",
+        "message 6", "message 7", "message 8", "message 9",
+        QUESTION
+    ]
+    assert first_kept == 6
+
+class FakeProvider:
+    configured = True
+
+    def __init__(self):
+        self.transcripts = []
+
+    async def complete(self, messages, max_tokens, temperature):
+        self.transcripts.append(messages[-1]["content"])
+        return {"content": "They chose blue.", "tokens_used": 5, "model": "fake"}
+
+def test_summary_covers_dropped_messages_and_hands_off(mongo, monkeypatch):
+    provider = FakeProvider()
+    monkeypatch.setattr(chat_context, "llm_provider", provider)
+    session = {"_id": "s1", "user_id": "u1", "session_id": "chat-1", "message_count": 10}
+
+    async def scenario():
+        await mongo.chat_history.insert_one(dict(session))
+        await mongo.chat_messages.insert_many([
+            {**message(seq), "user_id": "u1", "session_id": "chat-1"} for seq in range(10)
+        ])
+        # Messages 0-5 fell out of the window on the last turn
+        await chat_context.ConversationSummarizer()._summarize(session, 0, 6)
+        return await mongo.chat_history.find_one({"_id": "s1"})
+
+    stored = asyncio.run(scenario())
+    assert stored["summary"] == {"text": "They chose blue.", "upto": 6}
+    transcript = provider.transcripts[0]
+    assert "message 5" in transcript and "message 6" not in transcript
+
+    history = [message(seq) for seq in range(10)]
+    messages, first_kept = build_context(stored, history, SYSTEM, QUESTION, budget=10_000)
+    assert "message 5" not in contents(messages)
+    assert contents(messages)[2] == "message 6"
+    assert first_kept == 6
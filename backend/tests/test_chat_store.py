@@ -0,0 +1,102 @@
+"""The hot-session cache stays in step with MongoDB as turns are saved"""
+import asyncio
+from datetime import datetime
+
+import pytest
+
+import chat_store
+from chat_cache import RedisSessionCache, SessionCache
+from database import db
+
+USER = "u1"
+SESSION = "chat-1"
+
+@pytest.fixture(params=["memory", "redis"])
+def cache(request, monkeypatch, mongo):
+    if request.param == "redis":
+        fakeredis = pytest.importorskip("fakeredis")
+        monkeypatch.setattr(db, "redis", fakeredis.FakeAsyncRedis(decode_responses=True))
+        cache = RedisSessionCache(max_entries=100, ttl=60)
+    else:
+        cache = SessionCache(max_entries=100, ttl=60)
+    monkeypatch.setattr(chat_store, "session_cache", cache)
+    return cache
+
+def turn(text: str) -> list:
+    now = datetime.utcnow()
+    return [
+        {"role": "user", "content": text, "timestamp": now, "tokens": 3},
+        {"role": "assistant", "content": f"re: {text}", "timestamp": now, "tokens": 4}
+    ]
+
+def comparable(messages: list) -> list:
+    # Redis returns timestamps as strings; the prompt only uses these fields
+    return [(m["seq"], m["role"], m["content"], m["tokens"]) for m in messages]
+
+async def from_database():
+    session = await chat_store.get_session(USER, SESSION)
+    return session, await chat_store.recent_messages(session)
+
+async def assert_cache_matches_database(cache):
+    entry = await cache.get(USER, SESSION)
+    assert entry is not None, "turn was not written through to the cache"
+    session, history = await from_database()
+    assert comparable(entry["messages"]) == comparable(history)
+    assert entry["session"]["message_count"] == session["message_count"]
+    assert entry["session"].get("summary") == session.get("summary")
+
+async def chat_turn(text: str):
+    context = await chat_store.load_context(USER, SESSION)
+    await chat_store.append_messages(USER, SESSION, turn(text), context=context)
+
+def test_write_through_matches_database(cache):
+    async def scenario():
+        for text in ("hello", "how are you?", "tell me a joke"):
+            await chat_turn(text)
+            await assert_cache_matches_database(cache)
+
+        session, history = await chat_store.load_context(USER, SESSION)
+        assert session["message_count"] == 6
+        assert [m["seq"] for m in history] == list(range(6))
+
+    asyncio.run(scenario())
+
+def test_concurrent_turn_drops_stale_entry(cache):
+    async def scenario():
+        await chat_turn("hello")
+        stale = await chat_store.load_context(USER, SESSION)
+
+        # Another process saves a turn this one never saw
+        await chat_store.append_messages(USER, SESSION, turn("from elsewhere"))
+        await chat_store.append_messages(USER, SESSION, turn("late"), context=stale)
+        assert await cache.get(USER, SESSION) is None
+
+        # The next turn reloads from MongoDB and is written through again
+        await chat_turn("again")
+        await assert_cache_matches_database(cache)
+        _, history = await chat_store.load_context(USER, SESSION)
+        assert [m["seq"] for m in history] == list(range(8))
+
+    asyncio.run(scenario())
+
+def test_summary_and_delete_invalidate(cache, mongo):
+    async def scenario():
+        for text in ("one", "two", "three"):
+            await chat_turn(text)
+
+        # What the summarizer does once it has stored a summary
+        await mongo.chat_history.update_one(
+            {"user_id": USER, "session_id": SESSION},
+            {"$set": {"summary": {"text": "Counting.", "upto": 4}}}
+        )
+        await cache.delete(USER, SESSION)
+        await chat_turn("four")
+        await assert_cache_matches_database(cache)
+        _, history = await chat_store.load_context(USER, SESSION)
+        assert [m["seq"] for m in history] == [4, 5, 6, 7]
+
+        await chat_store.delete_sessions(USER, SESSION)
+        assert await cache.get(USER, SESSION) is None
+        assert await chat_store.load_context(USER, SESSION) == (None, [])
+
+    asyncio.run(scenario())
@@ -0,0 +1,67 @@
+"""Cancelling a generation leaves it failed, even with updates still queued"""
+import asyncio
+
+from generation_queue import QueueTicket
+from image_worker import GenerationJob, worker_pool
+from models import GenerationProgress, ImageGenerationRequest, JobPriority
+from generation_store import status_store
+from routers import image_generation as ig
+
+USER = {"_id": "user-1"}
+
+def progress_event(step: int) -> dict:
+    return {"progress": step * 5.0, "message": f"Denoising step {step}/20", "estimated_time": 10}
+
+async def final_status(generation_id: str) -> GenerationProgress:
+    return await status_store.get(generation_id)
+
+def test_cancel_running_job_with_queued_progress(monkeypatch):
+    async def scenario():
+        generation_id = "cancel-running"
+        job = GenerationJob(generation_id)
+
+        def submit(gid, request):
+            worker_pool.jobs[gid] = job
+            return job
+        monkeypatch.setattr(worker_pool, "submit", submit)
+
+        ticket = QueueTicket(generation_id, USER["_id"], JobPriority.NORMAL, 1, 0.0, 0)
+        ticket.put("dispatched")
+        await ig.set_status(generation_id, GenerationProgress(status="processing", progress=0.0))
+
+        task = asyncio.create_task(ig.generate_image_task(
+            ImageGenerationRequest(prompt="a lighthouse"), USER["_id"], generation_id, ticket
+        ))
+        # Let the task start waiting for events, then deliver some and
+        # cancel before it has read them
+        while generation_id not in worker_pool.jobs:
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        for step in range(1, 4):
+            job.put("progress", progress_event(step))
+        await ig.cancel_generation(generation_id, current_user=USER)
+        await task
+        return await final_status(generation_id)
+
+    status = asyncio.run(scenario())
+    assert status.status == "failed"
+    assert status.message == "Generation cancelled by user"
+
+def test_cancel_queued_job_with_queued_positions():
+    async def scenario():
+        generation_id = "cancel-queued"
+        ticket = QueueTicket(generation_id, USER["_id"], JobPriority.NORMAL, 1, 0.0, 0)
+        ticket.put("position", {"position": 2, "estimated_time": 30})
+        ticket.put("position", {"position": 1, "estimated_time": 15})
+        ticket.put("cancelled")
+        await ig.set_status(generation_id, GenerationProgress(status="queued", progress=0.0))
+
+        await ig.set_cancelled(generation_id)
+        await ig.generate_image_task(
+            ImageGenerationRequest(prompt="a lighthouse"), USER["_id"], generation_id, ticket
+        )
+        return await final_status(generation_id)
+
+    status = asyncio.run(scenario())
+    assert status.status == "failed"
+    assert status.queue_position is None
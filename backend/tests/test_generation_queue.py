@@ -0,0 +1,134 @@
+"""FairQueue ordering, capacity and admission control"""
+import pytest
+from fastapi import HTTPException
+
+from generation_queue import FairQueue, QueueFull
+from image_worker import worker_pool
+from models import JobPriority
+from routers import image_generation
+
+NORMAL = JobPriority.NORMAL
+
+@pytest.fixture(autouse=True)
+def one_worker(monkeypatch):
+    monkeypatch.setattr(worker_pool, "num_workers", 1)
+
+def drain(queue: FairQueue) -> list:
+    """Finish in-flight generations one at a time, in dispatch order"""
+    order = []
+    while queue.in_flight:
+        generation_id = next(iter(queue.in_flight))
+        order.append(generation_id)
+        queue.finish(generation_id)
+    return order
+
+def test_users_share_the_queue_fairly():
+    queue = FairQueue(max_in_flight=1)
+    for name in ("a1", "a2", "a3"):
+        queue.enqueue(name, "alice", NORMAL, 1)
+    queue.enqueue("b1", "bob", NORMAL, 1)
+    queue.enqueue("b2", "bob", NORMAL, 1)
+
+    # Bob's first job is tagged at the virtual clock, ahead of Alice's backlog
+    assert drain(queue) == ["a1", "b1", "a2", "b2", "a3"]
+
+def test_larger_jobs_use_more_of_a_users_share():
+    queue = FairQueue(max_in_flight=1)
+    queue.enqueue("a1", "alice", NORMAL, 1)
+    queue.enqueue("a2", "alice", NORMAL, 4)
+    queue.enqueue("a3", "alice", NORMAL, 1)
+    queue.enqueue("b1", "bob", NORMAL, 1)
+    queue.enqueue("b2", "bob", NORMAL, 1)
+    queue.enqueue("b3", "bob", NORMAL, 1)
+
+    assert drain(queue) == ["a1", "b1", "a2", "b2", "b3", "a3"]
+
+def test_higher_priority_goes_first():
+    queue = FairQueue(max_in_flight=1)
+    queue.enqueue("running", "alice", NORMAL, 1)
+    queue.enqueue("low", "alice", JobPriority.LOW, 1)
+    queue.enqueue("normal", "bob", NORMAL, 1)
+    queue.enqueue("high", "carol", JobPriority.HIGH, 1)
+
+    assert drain(queue) == ["running", "high", "normal", "low"]
+
+def test_in_flight_images_are_capped():
+    queue = FairQueue(max_in_flight=4)
+    queue.enqueue("a1", "alice", NORMAL, 2)
+    queue.enqueue("b1", "bob", NORMAL, 2)
+    queue.enqueue("c1", "carol", NORMAL, 2)
+
+    assert set(queue.in_flight) == {"a1", "b1"}
+    assert list(queue.waiting) == ["c1"]
+
+    queue.finish("a1")
+    assert set(queue.in_flight) == {"b1", "c1"}
+    assert not queue.waiting
+
+def test_an_oversized_job_runs_alone():
+    queue = FairQueue(max_in_flight=2)
+    ticket = queue.enqueue("big", "alice", NORMAL, 4)
+    assert "big" in queue.in_flight
+    assert ticket.position is None
+
+def test_full_queue_is_rejected_with_retry_after():
+    queue = FairQueue(max_depth=2, max_in_flight=1)
+    queue.seconds_per_image = 15
+    queue.enqueue("a1", "alice", NORMAL, 1)
+    queue.enqueue("b1", "bob", NORMAL, 1)
+    queue.enqueue("c1", "carol", NORMAL, 2)
+
+    with pytest.raises(QueueFull) as error:
+        queue.enqueue("d1", "dave", NORMAL, 1)
+    # One image in flight and three waiting, on one worker
+    assert error.value.retry_after == 60
+    assert queue.rejected == 1
+
+def test_user_limit_is_rejected_with_retry_after():
+    queue = FairQueue(max_per_user=1, max_in_flight=1)
+    queue.seconds_per_image = 10
+    queue.enqueue("b1", "bob", NORMAL, 1)
+    queue.enqueue("a1", "alice", NORMAL, 2)
+
+    with pytest.raises(QueueFull) as error:
+        queue.enqueue("a2", "alice", NORMAL, 1)
+    # Alice's queued job finishes after bob's image and its own two
+    assert error.value.retry_after == 30
+
+def test_admit_turns_queue_full_into_429(monkeypatch):
+    queue = FairQueue(max_depth=0)
+    monkeypatch.setattr(image_generation, "generation_queue", queue)
+
+    with pytest.raises(HTTPException) as error:
+        image_generation.admit("a1", "alice", NORMAL, 1)
+    assert error.value.status_code == 429
+    assert int(error.value.headers["Retry-After"]) >= 1
+
+def test_cancel_frees_a_waiting_place():
+    queue = FairQueue(max_depth=1, max_in_flight=1)
+    queue.enqueue("a1", "alice", NORMAL, 1)
+    ticket = queue.enqueue("b1", "bob", NORMAL, 1)
+    with pytest.raises(QueueFull):
+        queue.enqueue("c1", "carol", NORMAL, 1)
+
+    assert queue.cancel("b1")
+    assert ticket.cancelled
+    assert not queue.cancel("b1")
+    # In-flight generations aren't cancelled here, only finished
+    assert not queue.cancel("a1")
+
+    queue.enqueue("c1", "carol", NORMAL, 1)
+    assert list(queue.waiting) == ["c1"]
+
+def test_finish_frees_capacity():
+    queue = FairQueue(max_in_flight=1)
+    queue.enqueue("a1", "alice", NORMAL, 1)
+    queue.enqueue("b1", "bob", NORMAL, 1)
+
+    queue.finish("a1")
+    assert list(queue.in_flight) == ["b1"]
+    queue.finish("b1")
+    assert not queue.in_flight and not queue.waiting
+    # Finishing twice is harmless
+    queue.finish("b1")
+    assert queue.stats()["in_flight_images"] == 0
@@ -0,0 +1,61 @@
+"""Orphaned image collection over the sharded and the older flat layout"""
+import asyncio
+import os
+import time
+import uuid
+
+import storage
+from image_gc import ImageGarbageCollector, generation_id_for
+from storage import LocalStorage
+
+OLD = time.time() - 7200
+
+def write(local: LocalStorage, key: str) -> str:
+    path = local.path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(b"image")
+    os.utime(path, (OLD, OLD))
+    return key
+
+def stored_keys(local: LocalStorage) -> set:
+    return {key for key, _, _ in local.list()}
+
+def test_generation_id_for_both_layouts(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "IMAGE_STORAGE_SHARDED", True)
+    local = LocalStorage(root=str(tmp_path))
+    generation_id = str(uuid.uuid4())
+    name = f"{generation_id}_0.png"
+
+    assert generation_id_for(local.key_for(name), local) == generation_id
+    assert generation_id_for(name, local) == generation_id
+    assert generation_id_for(f"thumbnails/{generation_id}_0_256.webp", local) == generation_id
+    assert generation_id_for(f"other/{name}", local) is None
+    assert generation_id_for("notes.txt", local) is None
+
+def test_collects_orphans_in_both_layouts(tmp_path, monkeypatch, mongo):
+    monkeypatch.setattr(storage, "IMAGE_STORAGE_SHARDED", True)
+    local = LocalStorage(root=str(tmp_path))
+    sharded_orphan, legacy_orphan, legacy_live = (str(uuid.uuid4()) for _ in range(3))
+
+    orphans = {
+        write(local, local.key_for(f"{sharded_orphan}_0.png")),
+        write(local, local.key_for(f"thumbnails/{sharded_orphan}_0_256.webp")),
+        write(local, f"{legacy_orphan}_0.png"),
+        write(local, f"thumbnails/{legacy_orphan}_0_256.webp"),
+    }
+    kept = {
+        write(local, f"{legacy_live}_0.png"),
+        write(local, f"other/{legacy_orphan}_1.png"),
+        write(local, "notes.txt"),
+    }
+    asyncio.run(mongo.image_history.insert_one({
+        "_id": "result-cache-hit",
+        "image_urls": [local.url(f"{legacy_live}_0.png")]
+    }))
+
+    collector = ImageGarbageCollector(storage=local, grace_seconds=60, batch_pause=0)
+    report = asyncio.run(collector.collect())
+
+    assert stored_keys(local) == kept
+    assert report["files_deleted"] == len(orphans)
@@ -0,0 +1,116 @@
+"""Generated image serving: ranges, conditional requests and path safety"""
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException
+
+from routers import images
+from routers.images import parse_range
+
+CONTENT = bytes(range(100))
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    root = tmp_path / "generated_images"
+    root.mkdir()
+    (root / "image.png").write_bytes(CONTENT)
+    (tmp_path / "secret.txt").write_text("not an image")
+    monkeypatch.setattr(images, "IMAGE_DIR", str(root))
+    monkeypatch.setattr(images, "IMAGE_ACCEL_REDIRECT", "")
+
+    app = FastAPI()
+    app.include_router(images.router, prefix="/generated-images")
+    return Client(app)
+
+class Client:
+    """Synchronous requests against the app over its ASGI interface"""
+
+    def __init__(self, app: FastAPI):
+        self.app = app
+
+    def get(self, path: str, headers: dict = None) -> httpx.Response:
+        async def request():
+            transport = httpx.ASGITransport(app=self.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.get(path, headers=headers)
+        return asyncio.run(request())
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-9", (0, 9)),
+    ("bytes=90-", (90, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=-500", (0, 99)),
+    ("bytes=95-500", (95, 99)),
+    ("bytes=a-b", None),
+    ("bytes=5-2", None),
+    ("bytes=-", None),
+    ("bytes=--5", None),
+    ("bytes=0-1,5-6", None),
+    ("items=0-9", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 100) == expected
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=200-300", "bytes=-0"])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(HTTPException) as error:
+        parse_range(header, 100)
+    assert error.value.status_code == 416
+    assert error.value.headers["Content-Range"] == "bytes */100"
+
+def test_full_response(client):
+    response = client.get("/generated-images/image.png")
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers["accept-ranges"] == "bytes"
+    assert "immutable" in response.headers["cache-control"]
+
+def test_suffix_range(client):
+    response = client.get("/generated-images/image.png", headers={"Range": "bytes=-10"})
+    assert response.status_code == 206
+    assert response.content == CONTENT[-10:]
+    assert response.headers["content-range"] == "bytes 90-99/100"
+
+def test_unsatisfiable_range(client):
+    response = client.get("/generated-images/image.png", headers={"Range": "bytes=100-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */100"
+
+@pytest.mark.parametrize("header", ["bytes=a-b", "bytes=5-2"])
+def test_invalid_range_is_ignored(client, header):
+    response = client.get("/generated-images/image.png", headers={"Range": header})
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+def test_if_none_match(client):
+    etag = client.get("/generated-images/image.png").headers["etag"]
+    response = client.get("/generated-images/image.png", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+def test_if_range(client):
+    etag = client.get("/generated-images/image.png").headers["etag"]
+
+    response = client.get("/generated-images/image.png", headers={"Range": "bytes=0-9", "If-Range": etag})
+    assert response.status_code == 206
+    assert response.content == CONTENT[:10]
+
+    # A stale validator gets the whole current file instead of a range
+    response = client.get("/generated-images/image.png", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+@pytest.mark.parametrize("path", ["%2e%2e/secret.txt", "..%2fsecret.txt", "missing.png"])
+def test_outside_or_missing_is_not_found(client, path):
+    response = client.get(f"/generated-images/{path}")
+    assert response.status_code == 404
+
+def test_resolve_image_rejects_traversal(tmp_path, monkeypatch):
+    root = tmp_path / "generated_images"
+    root.mkdir()
+    (tmp_path / "secret.txt").write_text("not an image")
+    monkeypatch.setattr(images, "IMAGE_DIR", str(root))
+    assert images.resolve_image("../secret.txt", "") is None
+    assert images.resolve_image(str(tmp_path / "secret.txt"), "") is None
@@ -0,0 +1,94 @@
+"""MicroBatcher grouping, wait timeout, image cap and cancellation"""
+import pytest
+
+import image_worker
+from image_worker import MicroBatcher
+from models import ImageGenerationRequest, ImageSize
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(image_worker.time, "monotonic", clock)
+    return clock
+
+def job(generation_id: str, **settings) -> dict:
+    return {"generation_id": generation_id, "request": ImageGenerationRequest(prompt=generation_id, **settings)}
+
+def ids(batch) -> list:
+    return [item["generation_id"] for item in batch]
+
+def test_groups_compatible_requests(clock):
+    batcher = MicroBatcher(max_images=4, max_wait=0.05)
+    batcher.add(job("a1"))
+    batcher.add(job("b1", size=ImageSize.SQUARE_512))
+    batcher.add(job("a2"))
+    batcher.add(job("b2", size=ImageSize.SQUARE_512))
+    clock.now += 0.05
+
+    # Batches come out in order of their oldest job
+    assert ids(batcher.next_batch()[0]) == ["a1", "a2"]
+    assert ids(batcher.next_batch()[0]) == ["b1", "b2"]
+    assert batcher.next_batch() == (None, None)
+    assert len(batcher) == 0
+
+def test_partial_batch_waits_for_timeout(clock):
+    batcher = MicroBatcher(max_images=4, max_wait=0.05)
+    batcher.add(job("a1"))
+    clock.now += 0.02
+    batcher.add(job("a2"))
+
+    batch, wait = batcher.next_batch()
+    assert batch is None
+    assert wait == pytest.approx(0.03)
+
+    clock.now += 0.03
+    batch, wait = batcher.next_batch()
+    assert ids(batch) == ["a1", "a2"]
+    assert wait is None
+
+def test_full_batch_is_sent_immediately(clock):
+    batcher = MicroBatcher(max_images=4, max_wait=0.05)
+    batcher.add(job("a1", num_images=2))
+    batcher.add(job("a2", num_images=2))
+    assert ids(batcher.next_batch()[0]) == ["a1", "a2"]
+
+def test_max_images_caps_a_batch(clock):
+    batcher = MicroBatcher(max_images=4, max_wait=0.05)
+    for name in ("a1", "a2", "a3"):
+        batcher.add(job(name, num_images=2))
+
+    # The third job doesn't fit and waits for the next batch
+    assert ids(batcher.next_batch()[0]) == ["a1", "a2"]
+    assert batcher.next_batch()[0] is None
+    clock.now += 0.05
+    assert ids(batcher.next_batch()[0]) == ["a3"]
+
+def test_oversized_job_goes_alone(clock):
+    batcher = MicroBatcher(max_images=2, max_wait=0.05)
+    batcher.add(job("big", num_images=4))
+    batcher.add(job("small"))
+    assert ids(batcher.next_batch()[0]) == ["big"]
+    clock.now += 0.05
+    assert ids(batcher.next_batch()[0]) == ["small"]
+
+def test_cancel_waiting_job(clock):
+    batcher = MicroBatcher(max_images=4, max_wait=0.05)
+    batcher.add(job("a1"))
+    batcher.add(job("a2"))
+    batcher.add(job("b1", steps=30))
+
+    assert batcher.remove("a1")
+    assert batcher.remove("b1")
+    assert not batcher.remove("b1")
+    assert len(batcher) == 1
+    assert list(batcher.queues) == [image_worker.batch_key(job("a2")["request"])]
+
+    clock.now += 0.05
+    assert ids(batcher.next_batch()[0]) == ["a2"]
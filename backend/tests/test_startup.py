@@ -0,0 +1,32 @@
+"""Startup budget of the API process; see benchmarks/startup.py for the
+full report. Budgets come from the same environment variables."""
+import os
+import statistics
+
+import pytest
+
+from benchmarks.startup import HEAVY_MODULES, probe
+
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "3.0"))
+IMPORT_BUDGET_SECONDS = float(os.getenv("IMPORT_BUDGET_SECONDS", "2.0"))
+STARTUP_RSS_BUDGET_MB = float(os.getenv("STARTUP_RSS_BUDGET_MB", "200"))
+
+@pytest.fixture(scope="module")
+def runs():
+    return [probe() for _ in range(3)]
+
+def test_api_does_not_import_ml_stack(runs):
+    heavy = sorted({module for run in runs for module in run["heavy_modules"]})
+    assert not heavy, f"main:app imported {', '.join(heavy)}; keep {', '.join(HEAVY_MODULES)} in the image workers"
+
+def test_import_within_budget(runs):
+    seconds = statistics.median(run["import_seconds"] for run in runs)
+    assert seconds <= IMPORT_BUDGET_SECONDS, f"import {seconds:.2f}s > {IMPORT_BUDGET_SECONDS:.2f}s"
+
+def test_startup_within_budget(runs):
+    seconds = statistics.median(run["startup_seconds"] for run in runs)
+    assert seconds <= STARTUP_BUDGET_SECONDS, f"startup {seconds:.2f}s > {STARTUP_BUDGET_SECONDS:.2f}s"
+
+def test_memory_within_budget(runs):
+    rss = max(run["peak_rss_mb"] for run in runs)
+    assert rss <= STARTUP_RSS_BUDGET_MB, f"RSS {rss:.0f} MB > {STARTUP_RSS_BUDGET_MB:.0f} MB"
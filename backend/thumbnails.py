@@ -0,0 +1,96 @@
+import argparse
+import asyncio
+import io
+import os
+from typing import Dict, List, Optional
+from PIL import Image
+from dotenv import load_dotenv
+
+from storage import image_storage
+
+load_dotenv()
+
+# Longest edge, in pixels, of the derivative renditions kept for each image
+THUMBNAIL_SIZES = sorted(
+    (int(size) for size in os.getenv("THUMBNAIL_SIZES", "128,256,512").split(",")),
+    reverse=True
+)
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "80"))
+
+# Also keep a full-size WebP copy of PNG outputs, served to clients that
+# accept WebP
+IMAGE_WEBP_VARIANTS = os.getenv("IMAGE_WEBP_VARIANTS", "false").lower() == "true"
+
+def make_thumbnails(image: Image.Image, filename: str) -> Dict[str, str]:
+    """Save WebP renditions of an image and return their URLs keyed by size"""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+
+    thumbnails = {}
+    # Each size is downscaled from the previous one, largest first
+    rendition = image.convert("RGB")
+    for size in THUMBNAIL_SIZES:
+        rendition = rendition.copy()
+        rendition.thumbnail((size, size), Image.LANCZOS)
+        buffer = io.BytesIO()
+        rendition.save(buffer, "WEBP", quality=THUMBNAIL_QUALITY)
+        thumbnails[str(size)] = image_storage.save(f"thumbnails/{stem}_{size}.webp", buffer.getvalue())
+    return thumbnails
+
+def webp_variant_name(filename: str) -> str:
+    """Name of the full-size WebP copy kept next to a PNG output"""
+    return os.path.splitext(filename)[0] + ".webp"
+
+def thumbnails_for_file(url: str) -> Optional[Dict[str, str]]:
+    """Build the thumbnails of an already saved image, if it is still stored"""
+    key = image_storage.key_for_url(url)
+    data = image_storage.read(key) if key else None
+    if data is None:
+        return None
+
+    with Image.open(io.BytesIO(data)) as image:
+        return make_thumbnails(image, key)
+
+async def backfill(batch_size: int = 100, limit: Optional[int] = None) -> int:
+    """Add thumbnails to image_history records created before they existed"""
+    from database import connect_to_mongo, close_mongo_connection, get_database
+
+    await connect_to_mongo()
+    db = get_database()
+    loop = asyncio.get_running_loop()
+    updated = 0
+
+    try:
+        cursor = db.image_history.find(
+            {"thumbnails": {"$exists": False}},
+            {"image_urls": 1}
+        ).batch_size(batch_size)
+
+        async for doc in cursor:
+            thumbnails: List[Dict[str, str]] = []
+            for url in doc.get("image_urls", []):
+                # Missing files get an empty entry so the list stays aligned
+                result = await loop.run_in_executor(None, thumbnails_for_file, url)
+                thumbnails.append(result or {})
+
+            await db.image_history.update_one(
+                {"_id": doc["_id"]},
+                {"$set": {"thumbnails": thumbnails}}
+            )
+            updated += 1
+            if updated % batch_size == 0:
+                print(f"Backfilled thumbnails for {updated} images")
+            if limit and updated >= limit:
+                break
+    finally:
+        await close_mongo_connection()
+
+    return updated
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate thumbnails for existing image history")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--limit", type=int, default=None)
+    args = parser.parse_args()
+
+    count = asyncio.run(backfill(args.batch_size, args.limit))
+    print(f"Backfilled thumbnails for {count} images")